@@ -0,0 +1,42 @@
+"""Add registered_count to Event
+
+Revision ID: 1a062eed3395
+Revises: ef9e6edec2c4
+Create Date: 2026-10-17 09:12:41.508213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '1a062eed3395'
+down_revision = 'ef9e6edec2c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'event',
+        sa.Column('registered_count', sa.Integer(), nullable=False, server_default='0'),
+    )
+    # Backfill the event-level counter from the per-church counters
+    op.execute(
+        """
+        UPDATE event
+        SET registered_count = COALESCE(
+            (
+                SELECT SUM(eventchurchlink.registered_count)
+                FROM eventchurchlink
+                WHERE eventchurchlink.event_id = event.id
+            ),
+            0
+        )
+        """
+    )
+
+
+def downgrade():
+    op.drop_column('event', 'registered_count')
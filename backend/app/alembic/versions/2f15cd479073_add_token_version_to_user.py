@@ -0,0 +1,28 @@
+"""Add token_version to User
+
+Revision ID: 2f15cd479073
+Revises: 4fa529403fad
+Create Date: 2026-10-17 18:20:07.311842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '2f15cd479073'
+down_revision = '4fa529403fad'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'user',
+        sa.Column('token_version', sa.Integer(), nullable=False, server_default='0'),
+    )
+
+
+def downgrade():
+    op.drop_column('user', 'token_version')
@@ -0,0 +1,43 @@
+"""Add checked_in_count to EventChurchLink
+
+Revision ID: 4fa529403fad
+Revises: fc0129925a64
+Create Date: 2026-10-17 15:02:51.774390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '4fa529403fad'
+down_revision = 'fc0129925a64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'eventchurchlink',
+        sa.Column('checked_in_count', sa.Integer(), nullable=False, server_default='0'),
+    )
+    # Backfill from the attendees that are already checked in
+    op.execute(
+        """
+        UPDATE eventchurchlink
+        SET checked_in_count = counts.checked_in_count
+        FROM (
+            SELECT event_id, church_id, COUNT(*) AS checked_in_count
+            FROM attendee
+            WHERE checked_in_at IS NOT NULL
+            GROUP BY event_id, church_id
+        ) AS counts
+        WHERE eventchurchlink.event_id = counts.event_id
+          AND eventchurchlink.church_id = counts.church_id
+        """
+    )
+
+
+def downgrade():
+    op.drop_column('eventchurchlink', 'checked_in_count')
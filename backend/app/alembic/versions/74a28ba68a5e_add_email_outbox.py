@@ -0,0 +1,51 @@
+"""Add EmailOutbox
+
+Revision ID: 74a28ba68a5e
+Revises: 2f15cd479073
+Create Date: 2026-10-17 21:04:36.118245
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '74a28ba68a5e'
+down_revision = '2f15cd479073'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'emailoutbox',
+        sa.Column('id', sa.Uuid(), nullable=False),
+        sa.Column('email_to', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+        sa.Column('subject', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+        sa.Column('html_content', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column(
+            'status',
+            sa.Enum('PENDING', 'SENT', 'FAILED', name='emailstatus'),
+            nullable=False,
+        ),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sqlmodel.sql.sqltypes.AutoString(length=1000), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_emailoutbox_pending_next_attempt_at',
+        'emailoutbox',
+        ['next_attempt_at'],
+        unique=False,
+        postgresql_where=sa.text("status = 'PENDING'"),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_emailoutbox_pending_next_attempt_at', table_name='emailoutbox')
+    op.drop_table('emailoutbox')
+    sa.Enum(name='emailstatus').drop(op.get_bind(), checkfirst=True)
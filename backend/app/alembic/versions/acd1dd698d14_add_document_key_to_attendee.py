@@ -0,0 +1,135 @@
+"""Add normalized document_key to Attendee with unique index per event
+
+Revision ID: acd1dd698d14
+Revises: 1a062eed3395
+Create Date: 2026-10-17 10:03:27.114052
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'acd1dd698d14'
+down_revision = '1a062eed3395'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'attendee',
+        sa.Column('document_key', sqlmodel.sql.sqltypes.AutoString(length=50), nullable=True),
+    )
+    # Existing duplicates (same normalized document in the same event) can't
+    # stay: the unique index needs a key on every row, or the ORM fills it in
+    # on the next write. As in app.crud_events.cleanup_duplicate_attendees, the
+    # most recent registration of each group is kept and the older ones are
+    # removed. Same normalization as app.models_events.normalize_document_id.
+    op.execute(
+        """
+        CREATE TEMPORARY TABLE ranked_attendee AS
+        SELECT
+            id,
+            event_id,
+            church_id,
+            checked_in_at,
+            checked_in_by_id,
+            document_key,
+            row_number() OVER w AS rn,
+            first_value(id) OVER w AS kept_id
+        FROM (
+            SELECT
+                id,
+                event_id,
+                church_id,
+                created_at,
+                checked_in_at,
+                checked_in_by_id,
+                NULLIF(
+                    regexp_replace(upper(document_id), '[^0-9A-Z]', '', 'g'), ''
+                ) AS document_key
+            FROM attendee
+        ) AS normalized
+        WHERE document_key IS NOT NULL
+        WINDOW w AS (
+            PARTITION BY event_id, document_key ORDER BY created_at DESC, id DESC
+        )
+        """
+    )
+    # A removed registration that was checked in leaves its (earliest) check-in
+    # on the kept one, so nobody who attended is lost
+    op.execute(
+        """
+        UPDATE attendee
+        SET checked_in_at = removed.checked_in_at,
+            checked_in_by_id = removed.checked_in_by_id
+        FROM (
+            SELECT DISTINCT ON (kept_id) kept_id, checked_in_at, checked_in_by_id
+            FROM ranked_attendee
+            WHERE rn > 1 AND checked_in_at IS NOT NULL
+            ORDER BY kept_id, checked_in_at
+        ) AS removed
+        WHERE attendee.id = removed.kept_id AND attendee.checked_in_at IS NULL
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM attendee
+        USING ranked_attendee
+        WHERE attendee.id = ranked_attendee.id AND ranked_attendee.rn > 1
+        """
+    )
+    op.execute(
+        """
+        UPDATE attendee
+        SET document_key = ranked_attendee.document_key
+        FROM ranked_attendee
+        WHERE attendee.id = ranked_attendee.id
+        """
+    )
+    # Recount the registrations of the churches and events that had duplicates
+    op.execute(
+        """
+        UPDATE eventchurchlink
+        SET registered_count = (
+            SELECT count(*)
+            FROM attendee
+            WHERE attendee.event_id = eventchurchlink.event_id
+                AND attendee.church_id = eventchurchlink.church_id
+        )
+        WHERE (event_id, church_id) IN (
+            SELECT event_id, church_id
+            FROM ranked_attendee
+            WHERE kept_id IN (SELECT kept_id FROM ranked_attendee WHERE rn > 1)
+        )
+        """
+    )
+    op.execute(
+        """
+        UPDATE event
+        SET registered_count = COALESCE(
+            (
+                SELECT SUM(eventchurchlink.registered_count)
+                FROM eventchurchlink
+                WHERE eventchurchlink.event_id = event.id
+            ),
+            0
+        )
+        WHERE id IN (SELECT event_id FROM ranked_attendee WHERE rn > 1)
+        """
+    )
+    op.execute("DROP TABLE ranked_attendee")
+    op.create_index(
+        'ix_attendee_event_id_document_key',
+        'attendee',
+        ['event_id', 'document_key'],
+        unique=True,
+        postgresql_where=sa.text('document_key IS NOT NULL'),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_attendee_event_id_document_key', table_name='attendee')
+    op.drop_column('attendee', 'document_key')
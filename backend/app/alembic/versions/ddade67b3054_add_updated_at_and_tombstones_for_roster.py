@@ -0,0 +1,44 @@
+"""Add updated_at to Attendee and AttendeeTombstone for roster sync
+
+Revision ID: ddade67b3054
+Revises: acd1dd698d14
+Create Date: 2026-10-17 11:26:09.730415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'ddade67b3054'
+down_revision = 'acd1dd698d14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('attendee', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute("UPDATE attendee SET updated_at = COALESCE(checked_in_at, created_at)")
+    op.alter_column('attendee', 'updated_at', nullable=False)
+    op.create_index(
+        'ix_attendee_event_id_updated_at', 'attendee', ['event_id', 'updated_at'], unique=False
+    )
+    op.create_table(
+        'attendeetombstone',
+        sa.Column('attendee_id', sa.Uuid(), nullable=False),
+        sa.Column('event_id', sa.Uuid(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['event_id'], ['event.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('attendee_id'),
+    )
+    op.create_index(
+        op.f('ix_attendeetombstone_event_id'), 'attendeetombstone', ['event_id'], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index(op.f('ix_attendeetombstone_event_id'), table_name='attendeetombstone')
+    op.drop_table('attendeetombstone')
+    op.drop_index('ix_attendee_event_id_updated_at', table_name='attendee')
+    op.drop_column('attendee', 'updated_at')
@@ -0,0 +1,75 @@
+"""Add EmailCampaign
+
+Revision ID: f355c9c6eaf6
+Revises: 74a28ba68a5e
+Create Date: 2026-10-17 22:12:48.503917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'f355c9c6eaf6'
+down_revision = '74a28ba68a5e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'emailcampaign',
+        sa.Column(
+            'audience',
+            sa.Enum('DIGITERS', 'CHURCH_CONTACTS', 'ALL', name='campaignaudience'),
+            nullable=False,
+        ),
+        sa.Column('subject', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+        sa.Column('message', sqlmodel.sql.sqltypes.AutoString(length=5000), nullable=False),
+        sa.Column('id', sa.Uuid(), nullable=False),
+        sa.Column('event_id', sa.Uuid(), nullable=False),
+        sa.Column('created_by_id', sa.Uuid(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('recipient_count', sa.Integer(), nullable=False),
+        sa.Column('queued_count', sa.Integer(), nullable=False),
+        sa.Column(
+            'queued_until', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=True
+        ),
+        sa.Column('queued_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['event_id'], ['event.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['created_by_id'], ['user.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        op.f('ix_emailcampaign_event_id'), 'emailcampaign', ['event_id'], unique=False
+    )
+    op.create_index(
+        'ix_emailcampaign_queueing_created_at',
+        'emailcampaign',
+        ['created_at'],
+        unique=False,
+        postgresql_where=sa.text('queued_at IS NULL'),
+    )
+    op.add_column('emailoutbox', sa.Column('campaign_id', sa.Uuid(), nullable=True))
+    op.create_foreign_key(
+        'emailoutbox_campaign_id_fkey',
+        'emailoutbox',
+        'emailcampaign',
+        ['campaign_id'],
+        ['id'],
+        ondelete='CASCADE',
+    )
+    op.create_index(
+        op.f('ix_emailoutbox_campaign_id'), 'emailoutbox', ['campaign_id'], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index(op.f('ix_emailoutbox_campaign_id'), table_name='emailoutbox')
+    op.drop_constraint('emailoutbox_campaign_id_fkey', 'emailoutbox', type_='foreignkey')
+    op.drop_column('emailoutbox', 'campaign_id')
+    op.drop_index('ix_emailcampaign_queueing_created_at', table_name='emailcampaign')
+    op.drop_index(op.f('ix_emailcampaign_event_id'), table_name='emailcampaign')
+    op.drop_table('emailcampaign')
+    sa.Enum(name='campaignaudience').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,85 @@
+"""Add accent-folded search_name and trigram indexes to Attendee
+
+Revision ID: fc0129925a64
+Revises: ddade67b3054
+Create Date: 2026-10-17 14:26:08.530117
+
+"""
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'fc0129925a64'
+down_revision = 'ddade67b3054'
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 5000
+
+
+def fold_name(name):
+    # Same folding as app.models_events.fold_name (kept here so the migration
+    # doesn't change if the application code does).
+    if not name:
+        return None
+    decomposed = unicodedata.normalize('NFKD', name)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.casefold().split()) or None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.add_column(
+        'attendee',
+        sa.Column('search_name', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=True),
+    )
+
+    # Backfill in batches, walking the primary key
+    bind = op.get_bind()
+    attendee = sa.table(
+        'attendee',
+        sa.column('id', sa.Uuid()),
+        sa.column('full_name', sa.String()),
+        sa.column('search_name', sa.String()),
+    )
+    last_id = None
+    while True:
+        query = sa.select(attendee.c.id, attendee.c.full_name).order_by(attendee.c.id).limit(BATCH_SIZE)
+        if last_id is not None:
+            query = query.where(attendee.c.id > last_id)
+        rows = bind.execute(query).all()
+        if not rows:
+            break
+        bind.execute(
+            attendee.update()
+            .where(attendee.c.id == sa.bindparam('b_id'))
+            .values(search_name=sa.bindparam('b_search_name')),
+            [{'b_id': row.id, 'b_search_name': fold_name(row.full_name)} for row in rows],
+        )
+        last_id = rows[-1].id
+
+    op.create_index(
+        'ix_attendee_search_name_trgm',
+        'attendee',
+        ['search_name'],
+        postgresql_using='gin',
+        postgresql_ops={'search_name': 'gin_trgm_ops'},
+    )
+    op.create_index(
+        'ix_attendee_document_id_trgm',
+        'attendee',
+        ['document_id'],
+        postgresql_using='gin',
+        postgresql_ops={'document_id': 'gin_trgm_ops'},
+    )
+
+
+def downgrade():
+    op.drop_index('ix_attendee_document_id_trgm', table_name='attendee')
+    op.drop_index('ix_attendee_search_name_trgm', table_name='attendee')
+    op.drop_column('attendee', 'search_name')
@@ -1,4 +1,5 @@
-from collections.abc import Generator
+import uuid
+from collections.abc import AsyncGenerator, Generator
 from typing import Annotated
 
 import jwt
@@ -7,11 +8,13 @@ from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
 from pydantic import ValidationError
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.core import security
 from app.core.config import settings
-from app.core.db import engine
-from app.models import TokenPayload, User
+from app.core.db import async_engine, engine, set_statement_timeout
+from app.core.user_cache import get_auth_user, get_auth_user_async
+from app.models import AuthUser, TokenPayload, User
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
@@ -23,33 +26,123 @@ def get_db() -> Generator[Session, None, None]:
         yield session
 
 
+async def get_db_async() -> AsyncGenerator[AsyncSession, None]:
+    # Nothing is loaded lazily after a commit, which async sessions can't do
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
 SessionDep = Annotated[Session, Depends(get_db)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_db_async)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-def get_current_user(session: SessionDep, token: TokenDep) -> User:
+def short_statement_timeout(session: SessionDep) -> None:
+    """
+    Route dependency for the check-in and search routes: a scanner would
+    rather get an error to retry than wait on a stuck query.
+    """
+    set_statement_timeout(session, settings.DB_SHORT_STATEMENT_TIMEOUT_MS)
+
+
+async def short_statement_timeout_async(session: AsyncSessionDep) -> None:
+    await session.run_sync(
+        set_statement_timeout,  # type: ignore
+        settings.DB_SHORT_STATEMENT_TIMEOUT_MS,
+    )
+
+
+def _decode_token(token: str) -> TokenPayload:
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
         )
-        token_data = TokenPayload(**payload)
+        return TokenPayload(**payload)
     except (InvalidTokenError, ValidationError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
+
+
+def _check_token_version(token_data: TokenPayload, token_version: int) -> None:
+    # Tokens issued before a change of role, church or activation are revoked
+    if token_data.ver is not None and token_data.ver != token_version:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="TOKEN_REVOKED",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+def get_current_user(session: SessionDep, token: TokenDep) -> User:
+    """The full User row, for routes that read or change it."""
+    token_data = _decode_token(token)
     user = session.get(User, token_data.sub)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
+    _check_token_version(token_data, user.token_version)
     return user
 
 
 CurrentUser = Annotated[User, Depends(get_current_user)]
 
 
-def get_current_active_superuser(current_user: CurrentUser) -> User:
+def _token_user_id(token_data: TokenPayload) -> uuid.UUID:
+    try:
+        return uuid.UUID(token_data.sub)
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Could not validate credentials",
+        )
+
+
+def _authorize_auth_user(token_data: TokenPayload, user: AuthUser | None) -> AuthUser:
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    if token_data.ver is None:
+        return user
+    _check_token_version(token_data, user.token_version)
+    return user.model_copy(
+        update={
+            "role": token_data.role,
+            "church_id": token_data.church_id,
+            "is_superuser": token_data.su,
+        }
+    )
+
+
+def get_current_auth_user(session: SessionDep, token: TokenDep) -> AuthUser:
+    """
+    What authorization needs from the user. Role, church and superuser come
+    from the token claims; only the user's token version and activation are
+    looked up, in the per-process cache (no database round trip once the
+    user is cached). Tokens issued without claims use the cached user.
+    """
+    token_data = _decode_token(token)
+    user = get_auth_user(session, _token_user_id(token_data))
+    return _authorize_auth_user(token_data, user)
+
+
+async def get_current_auth_user_async(
+    session: AsyncSessionDep, token: TokenDep
+) -> AuthUser:
+    """get_current_auth_user for async routes."""
+    token_data = _decode_token(token)
+    user = await get_auth_user_async(session, _token_user_id(token_data))
+    return _authorize_auth_user(token_data, user)
+
+
+CurrentAuthUser = Annotated[AuthUser, Depends(get_current_auth_user)]
+AsyncCurrentAuthUser = Annotated[AuthUser, Depends(get_current_auth_user_async)]
+
+
+def get_current_active_superuser(current_user: CurrentAuthUser) -> AuthUser:
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=403, detail="The user doesn't have enough privileges"
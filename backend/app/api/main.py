@@ -1,6 +1,15 @@
 from fastapi import APIRouter
 
-from app.api.routes import events, items, login, private, users, utils
+from app.api.routes import (
+    campaigns,
+    events,
+    exports,
+    items,
+    login,
+    private,
+    users,
+    utils,
+)
 from app.core.config import settings
 
 api_router = APIRouter()
@@ -9,6 +18,8 @@ api_router.include_router(users.router)
 api_router.include_router(utils.router)
 api_router.include_router(items.router)
 api_router.include_router(events.router, prefix="/events", tags=["events"])
+api_router.include_router(exports.router)
+api_router.include_router(campaigns.router)
 
 
 if settings.ENVIRONMENT == "local":
@@ -0,0 +1,84 @@
+import uuid
+from typing import Any
+
+from fastapi import APIRouter, HTTPException
+from sqlmodel import col, select
+
+from app import campaigns
+from app.api.deps import CurrentAuthUser, SessionDep
+from app.api.routes.events import check_admin
+from app.core.config import settings
+from app.email_outbox import wake_outbox_worker
+from app.models_events import (
+    EmailCampaign,
+    EmailCampaignCreate,
+    EmailCampaignPublic,
+    Event,
+)
+
+router = APIRouter(prefix="/events/{event_id}/campaigns", tags=["campaigns"])
+
+
+@router.post("/", response_model=EmailCampaignPublic, status_code=202)
+def create_campaign(
+    *,
+    session: SessionDep,
+    current_user: CurrentAuthUser,
+    event_id: uuid.UUID,
+    campaign_in: EmailCampaignCreate,
+) -> Any:
+    """
+    Email every recipient of the audience of an event, in the background.
+    Admin only.
+    """
+    check_admin(current_user)
+    event = session.get(Event, event_id)
+    if not event:
+        raise HTTPException(status_code=404, detail="Event not found")
+    if not settings.emails_enabled:
+        # No outbox worker would ever deliver it
+        raise HTTPException(status_code=400, detail="EMAILS_DISABLED")
+
+    campaign = campaigns.create_campaign(
+        session, event=event, campaign_in=campaign_in, created_by_id=current_user.id
+    )
+    if not campaign:
+        raise HTTPException(status_code=400, detail="CAMPAIGN_NO_RECIPIENTS")
+    wake_outbox_worker()
+    return campaigns.get_campaigns_progress(session, [campaign])[0]
+
+
+@router.get("/", response_model=list[EmailCampaignPublic])
+def read_campaigns(
+    *, session: SessionDep, current_user: CurrentAuthUser, event_id: uuid.UUID
+) -> Any:
+    """
+    List the campaigns of an event with their delivery progress, newest first.
+    Admin only.
+    """
+    check_admin(current_user)
+    event_campaigns = session.exec(
+        select(EmailCampaign)
+        .where(EmailCampaign.event_id == event_id)
+        .order_by(col(EmailCampaign.created_at).desc())
+    ).all()
+    return campaigns.get_campaigns_progress(session, event_campaigns)
+
+
+@router.get("/{campaign_id}", response_model=EmailCampaignPublic)
+def read_campaign(
+    *,
+    session: SessionDep,
+    current_user: CurrentAuthUser,
+    event_id: uuid.UUID,
+    campaign_id: uuid.UUID,
+) -> Any:
+    """
+    Get a campaign with its delivery progress.
+    Admin only.
+    """
+    check_admin(current_user)
+    campaign = session.get(EmailCampaign, campaign_id)
+    if not campaign or campaign.event_id != event_id:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return campaigns.get_campaigns_progress(session, [campaign])[0]
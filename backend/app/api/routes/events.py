@@ -1,19 +1,63 @@
 import uuid
-from datetime import datetime, timezone
-from typing import Any, Annotated, cast
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, cast
 
 import csv
+import hashlib
 import io
+import json
+import zlib
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import StreamingResponse
-from sqlmodel import SQLModel, col, func, or_, select
-
-from app.api.deps import CurrentUser, SessionDep, get_current_active_superuser
-from app.models import User, UserPublic, UserRole
+from pydantic import model_validator
+from sqlalchemy import DateTime, Integer, Uuid, column, text, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from sqlmodel import (
+    Field,
+    Session,
+    SQLModel,
+    and_,
+    col,
+    delete,
+    func,
+    or_,
+    select,
+    update,
+)
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.api.deps import (
+    AsyncCurrentAuthUser,
+    AsyncSessionDep,
+    CurrentAuthUser,
+    SessionDep,
+    get_current_active_superuser,
+    get_current_auth_user,
+    short_statement_timeout,
+    short_statement_timeout_async,
+)
+from app.core.config import settings
+from app.core.db import engine, set_statement_timeout
+from app.crud_events import (
+    ATTENDEE_EXPORT_HEADER,
+    EXPORT_BATCH_SIZE,
+    cleanup_duplicate_attendees,
+    format_export_row,
+    iter_attendee_export_rows,
+    reconcile_event_counters,
+)
+from app.duplicates import DEFAULT_MIN_SCORE, PersonRecord, find_duplicate_candidates
+from app.models import AuthUser, User, UserPublic, UserRole
 from app.models_events import (
     Attendee,
     AttendeeCreate,
     AttendeePublic,
+    AttendeeTombstone,
     Church,
     ChurchCreate,
     ChurchesPublic,
@@ -23,18 +67,20 @@ from app.models_events import (
     EventCreate,
     EventPublic,
     EventUpdate,
+    fold_name,
+    normalize_document_id,
 )
 
 router = APIRouter()
 
 
 # --- Dependencies ---
-def check_admin(user: User) -> None:
+def check_admin(user: AuthUser) -> None:
     if user.role != UserRole.ADMIN and not user.is_superuser:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
 
-def check_digiter(user: User) -> None:
+def check_digiter(user: AuthUser) -> None:
     if (
         user.role not in [UserRole.DIGITER, UserRole.ADMIN, UserRole.SUPERVISOR]
         and not user.is_superuser
@@ -42,7 +88,7 @@ def check_digiter(user: User) -> None:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
 
-def check_supervisor(user: User) -> None:
+def check_supervisor(user: AuthUser) -> None:
     if user.role not in [UserRole.ADMIN, UserRole.SUPERVISOR] and not user.is_superuser:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
@@ -50,7 +96,7 @@ def check_supervisor(user: User) -> None:
 # --- Churches (Admin) ---
 @router.post("/churches", response_model=ChurchPublic)
 def create_church(
-    *, session: SessionDep, current_user: CurrentUser, church_in: ChurchCreate
+    *, session: SessionDep, current_user: CurrentAuthUser, church_in: ChurchCreate
 ) -> Any:
     """Create new church."""
     check_admin(current_user)
@@ -61,10 +107,12 @@ def create_church(
     return church
 
 
-@router.get("/churches", response_model=ChurchesPublic)
-def read_churches(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
-) -> Any:
+@router.get(
+    "/churches",
+    response_model=ChurchesPublic,
+    dependencies=[Depends(get_current_auth_user)],
+)
+def read_churches(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
     """Retrieve churches."""
     count_statement = select(func.count()).select_from(Church)
     count = session.exec(count_statement).one()
@@ -76,7 +124,7 @@ def read_churches(
 # --- Events (Admin) ---
 @router.post("/", response_model=EventPublic)
 def create_event(
-    *, session: SessionDep, current_user: CurrentUser, event_in: EventCreate
+    *, session: SessionDep, current_user: CurrentAuthUser, event_in: EventCreate
 ) -> Any:
     """Create new event."""
     check_supervisor(current_user)
@@ -89,7 +137,7 @@ def create_event(
 
 @router.get("/", response_model=list[EventPublic])
 def read_events(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+    session: SessionDep, current_user: CurrentAuthUser, skip: int = 0, limit: int = 100
 ) -> Any:
     """Retrieve events."""
     if current_user.is_superuser or current_user.role in [
@@ -123,7 +171,7 @@ def read_events(
 def get_my_events(
     *,
     session: SessionDep,
-    current_user: CurrentUser,
+    current_user: CurrentAuthUser,
 ) -> Any:
     """
     Get all active events that the current user's church is invited to.
@@ -144,10 +192,12 @@ def get_my_events(
     return events
 
 
-@router.get("/{event_id}", response_model=EventPublic)
-def read_event(
-    *, session: SessionDep, current_user: CurrentUser, event_id: uuid.UUID
-) -> Any:
+@router.get(
+    "/{event_id}",
+    response_model=EventPublic,
+    dependencies=[Depends(get_current_auth_user)],
+)
+def read_event(*, session: SessionDep, event_id: uuid.UUID) -> Any:
     """Get event by ID."""
     event = session.get(Event, event_id)
     if not event:
@@ -159,7 +209,7 @@ def read_event(
 def update_event(
     *,
     session: SessionDep,
-    current_user: CurrentUser,
+    current_user: CurrentAuthUser,
     event_id: uuid.UUID,
     event_in: EventUpdate,
 ) -> Any:
@@ -181,7 +231,7 @@ def update_event(
 def invite_church_to_event(
     *,
     session: SessionDep,
-    current_user: CurrentUser,
+    current_user: CurrentAuthUser,
     event_id: uuid.UUID,
     church_id: uuid.UUID,
     quota: int,
@@ -214,10 +264,12 @@ def invite_church_to_event(
     return event
 
 
-@router.get("/{event_id}/churches", response_model=ChurchesPublic)
-def get_event_churches(
-    *, session: SessionDep, current_user: CurrentUser, event_id: uuid.UUID
-) -> Any:
+@router.get(
+    "/{event_id}/churches",
+    response_model=ChurchesPublic,
+    dependencies=[Depends(get_current_auth_user)],
+)
+def get_event_churches(*, session: SessionDep, event_id: uuid.UUID) -> Any:
     """
     Get all churches invited to this event.
     Accessible to all logged in users (needed for onboarding).
@@ -250,7 +302,7 @@ class EventStats(SQLModel):
 
 @router.get("/{event_id}/my-registration-count", response_model=int)
 def get_my_registration_count(
-    *, session: SessionDep, current_user: CurrentUser, event_id: uuid.UUID
+    *, session: SessionDep, current_user: CurrentAuthUser, event_id: uuid.UUID
 ) -> Any:
     """
     Get the total number of approved/registered attendees by the current user for this event.
@@ -265,74 +317,114 @@ def get_my_registration_count(
 
 
 @router.get("/{event_id}/stats", response_model=EventStats)
-def get_event_stats(
-    *, session: SessionDep, current_user: CurrentUser, event_id: uuid.UUID
+async def get_event_stats(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentAuthUser,
+    event_id: uuid.UUID,
 ) -> Any:
     """
     Get detailed statistics for an event.
     """
     check_supervisor(current_user)
-    event = session.get(Event, event_id)
+    # The dashboard is refreshed constantly during the event, so the whole
+    # payload is built with two fixed queries regardless of the number of
+    # invited churches, reading the counters kept on EventChurchLink.
+    event = await session.get(Event, event_id)
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
 
-    # Get all links (churches invited)
-    links = session.exec(
-        select(EventChurchLink).where(EventChurchLink.event_id == event_id)
-    ).all()
-
-    total_registered = sum(link.registered_count for link in links)
-
-    church_stats = []
-    for link in links:
-        church = session.get(Church, link.church_id)
-        church_name = church.name if church else "Unknown"
-        # Optional: Count digiters for this church
-        digiters_count = session.exec(
-            select(func.count())
-            .select_from(User)
-            .where(User.church_id == link.church_id, User.role == UserRole.DIGITER)
-        ).one()
-
-        church_stats.append(
-            {
-                "church_id": link.church_id,
-                "church_name": church_name,
-                "quota_limit": link.quota_limit,
-                "registered_count": link.registered_count,
-                "checked_in_count": session.exec(
-                    select(func.count())
-                    .select_from(Attendee)
-                    .where(
-                        Attendee.event_id == event_id,
-                        Attendee.church_id == link.church_id,
-                        Attendee.checked_in_at != None,
-                    )
-                ).one(),
-                "digiters_count": digiters_count,
-            }
+    digiters_by_church = (
+        select(User.church_id, func.count().label("digiters_count"))
+        .where(
+            User.role == UserRole.DIGITER,
+            col(User.church_id).in_(
+                select(EventChurchLink.church_id).where(
+                    EventChurchLink.event_id == event_id
+                )
+            ),
         )
+        .group_by(col(User.church_id))
+        .subquery()
+    )
+    rows = (
+        await session.exec(
+            select(  # type: ignore[call-overload]
+                EventChurchLink.church_id,
+                func.coalesce(Church.name, "Unknown"),
+                EventChurchLink.quota_limit,
+                EventChurchLink.registered_count,
+                EventChurchLink.checked_in_count,
+                func.coalesce(digiters_by_church.c.digiters_count, 0),
+            )
+            .outerjoin(Church, cast(Any, Church.id == EventChurchLink.church_id))
+            .outerjoin(
+                digiters_by_church,
+                digiters_by_church.c.church_id == EventChurchLink.church_id,
+            )
+            .where(EventChurchLink.event_id == event_id)
+            .order_by(Church.name)
+        )
+    ).all()
 
-    checked_in_count = session.exec(
-        select(func.count())
-        .select_from(Attendee)
-        .where(Attendee.event_id == event_id, Attendee.checked_in_at != None)
-    ).one()
+    church_stats = [
+        {
+            "church_id": church_id,
+            "church_name": church_name,
+            "quota_limit": quota_limit,
+            "registered_count": registered_count,
+            "checked_in_count": church_checked_in,
+            "digiters_count": digiters_count,
+        }
+        for (
+            church_id,
+            church_name,
+            quota_limit,
+            registered_count,
+            church_checked_in,
+            digiters_count,
+        ) in rows
+    ]
 
     return EventStats(
         event_name=event.name,
         total_quota=event.total_quota,
-        total_registered=total_registered,
-        checked_in_count=checked_in_count,
+        total_registered=sum(stat["registered_count"] for stat in church_stats),
+        checked_in_count=sum(stat["checked_in_count"] for stat in church_stats),
         church_stats=church_stats,
     )
 
 
-@router.get("/{event_id}/attendees", response_model=list[AttendeePublic])
+def _search_attendees(statement: Any, q: str, match_document: bool = False) -> Any:
+    """
+    Filter an Attendee query by name (and optionally document) and rank the
+    best matches first. Names are compared accent-folded, so "jose garcia"
+    finds "José García"; typos are caught by pg_trgm word similarity. All
+    predicates are served by the trigram GIN indexes on Attendee.
+    """
+    folded = fold_name(q) or ""
+    conditions = [
+        col(Attendee.search_name).ilike(f"%{folded}%"),
+        col(Attendee.search_name).op("%>")(folded),
+    ]
+    if match_document:
+        conditions.append(col(Attendee.document_id).ilike(f"%{q.strip()}%"))
+    return statement.where(or_(*conditions)).order_by(
+        func.word_similarity(folded, Attendee.search_name).desc(),
+        col(Attendee.full_name),
+        col(Attendee.id),
+    )
+
+
+@router.get(
+    "/{event_id}/attendees",
+    response_model=list[AttendeePublic],
+    dependencies=[Depends(short_statement_timeout)],
+)
 def get_event_attendees(
     *,
     session: SessionDep,
-    current_user: CurrentUser,
+    current_user: CurrentAuthUser,
     event_id: uuid.UUID,
     skip: int = 0,
     limit: int = 100,
@@ -352,12 +444,7 @@ def get_event_attendees(
     )
 
     if q:
-        statement = statement.where(
-            or_(
-                col(Attendee.full_name).ilike(f"%{q}%"),
-                col(Attendee.document_id).ilike(f"%{q}%"),
-            )
-        )
+        statement = _search_attendees(statement, q, match_document=True)
 
     # Privacy Isolation: If not Admin/Supervisor, only show attendees from their own church
     # UNLESS they are searching (q is present), in which case they can find anyone in the event (Check-in use case)
@@ -385,61 +472,40 @@ def get_event_attendees(
     return results
 
 
-@router.get("/{event_id}/attendees/export-csv")
-def get_event_attendees_csv(
-    *,
-    session: SessionDep,
-    current_user: Annotated[User, Depends(get_current_active_superuser)],
-    event_id: uuid.UUID,
-) -> Any:
+def _iter_attendees_csv(event_id: uuid.UUID) -> Iterator[str]:
     """
-    Export all attendees for an event to CSV.
-    Superadmin only.
+    Yield the attendee CSV in chunks of EXPORT_BATCH_SIZE rows. Runs after the
+    request session is closed, so it uses its own session.
     """
-    statement = (
-        select(Attendee, Church.name, User.email)
-        .join(Church, cast(Any, Attendee.church_id == Church.id))
-        .join(User, cast(Any, Attendee.registered_by_id == User.id))
-        .where(Attendee.event_id == event_id)
-    )
-    results = session.exec(statement).all()
-
     output = io.StringIO()
     output.write("\ufeff")  # UTF-8 BOM for Microsoft Excel
     writer = csv.writer(output)
+    writer.writerow(ATTENDEE_EXPORT_HEADER)
 
-    # Header
-    writer.writerow(
-        [
-            "Full Name",
-            "Document ID",
-            "Church (Iglesia)",
-            "Registered By (Email)",
-            "Registration Date",
-            "Checked-in At",
-        ]
-    )
+    with Session(engine) as session:
+        set_statement_timeout(session, settings.DB_LONG_STATEMENT_TIMEOUT_MS)
+        for count, row in enumerate(iter_attendee_export_rows(session, event_id), 1):
+            writer.writerow(format_export_row(row))
+            if count % EXPORT_BATCH_SIZE == 0:
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate()
 
-    for attendee, church_name, email in results:
-        writer.writerow(
-            [
-                attendee.full_name,
-                attendee.document_id or "N/A",
-                church_name,
-                email,
-                attendee.created_at.strftime("%Y-%m-%d %H:%M:%S")
-                if attendee.created_at
-                else "N/A",
-                attendee.checked_in_at.strftime("%Y-%m-%d %H:%M:%S")
-                if attendee.checked_in_at
-                else "N/A",
-            ]
-        )
+    yield output.getvalue()
 
-    output.seek(0)
+
+@router.get(
+    "/{event_id}/attendees/export-csv",
+    dependencies=[Depends(get_current_active_superuser)],
+)
+def get_event_attendees_csv(*, event_id: uuid.UUID) -> Any:
+    """
+    Export all attendees for an event to CSV.
+    Superadmin only.
+    """
     filename = f"attendees_event_{event_id}.csv"
     return StreamingResponse(
-        iter([output.getvalue()]),
+        _iter_attendees_csv(event_id),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
@@ -447,7 +513,7 @@ def get_event_attendees_csv(
 
 @router.get("/{event_id}/digiters", response_model=list[UserPublic])
 def get_event_digiters(
-    *, session: SessionDep, current_user: CurrentUser, event_id: uuid.UUID
+    *, session: SessionDep, current_user: CurrentAuthUser, event_id: uuid.UUID
 ) -> Any:
     """
     Get all digiters associated with churches invited to this event.
@@ -487,7 +553,7 @@ class BulkInviteRequest(SQLModel):
 def invite_churches_bulk(
     *,
     session: SessionDep,
-    current_user: CurrentUser,
+    current_user: CurrentAuthUser,
     event_id: uuid.UUID,
     data: BulkInviteRequest,
 ) -> Any:
@@ -528,7 +594,7 @@ class BulkInviteCreateRequest(SQLModel):
 def invite_churches_create_bulk(
     *,
     session: SessionDep,
-    current_user: CurrentUser,
+    current_user: CurrentAuthUser,
     event_id: uuid.UUID,
     data: BulkInviteCreateRequest,
 ) -> Any:
@@ -568,105 +634,350 @@ def invite_churches_create_bulk(
 
 
 # --- Attendees (Digiter) ---
-@router.post("/{event_id}/register", response_model=AttendeePublic)
-def register_attendee(
-    *,
-    session: SessionDep,
-    current_user: CurrentUser,
-    event_id: uuid.UUID,
-    attendee_in: AttendeeCreate,
-) -> Any:
+async def _get_open_event(session: AsyncSession, event_id: uuid.UUID) -> Event:
     """
-    Register an attendee for an event.
-    Transactional check: Ensures Church Quota is not exceeded and Date is valid.
+    Load an event and ensure it is currently accepting registrations.
     """
-    check_digiter(current_user)
-
-    # Get Event and lock it to prevent race conditions on global quota validation
-    event_statement = select(Event).where(Event.id == event_id).with_for_update()
-    event = session.exec(event_statement).first()
-
+    event = await session.get(Event, event_id)
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
 
     if not event.is_active:
         raise HTTPException(status_code=400, detail="EVENT_NOT_ACTIVE")
 
-    # Date Validation
-    from datetime import datetime
-
     if event.max_registration_date and datetime.now() > event.max_registration_date:
         raise HTTPException(status_code=400, detail="EVENT_REGISTRATION_CLOSED")
 
-    if not current_user.church_id:
-        raise HTTPException(status_code=400, detail="USER_NO_CHURCH")
+    return event
+
 
-    # Lock the Link row for update to prevent race conditions
+async def _add_church_registrations(
+    session: AsyncSession, event_id: uuid.UUID, church_id: uuid.UUID, seats: int
+) -> Any:
+    """
+    Add `seats` to the church counter and return its name, or None if the
+    church is not invited. This only contends with digiters of the same church.
+    """
     statement = (
-        select(EventChurchLink)
+        update(EventChurchLink)
         .where(
-            EventChurchLink.event_id == event_id,
-            EventChurchLink.church_id == current_user.church_id,
+            col(EventChurchLink.event_id) == event_id,
+            col(EventChurchLink.church_id) == church_id,
+        )
+        .values(registered_count=EventChurchLink.registered_count + seats)
+        .returning(
+            select(Church.name)
+            .where(Church.id == EventChurchLink.church_id)
+            .scalar_subquery()
+            .label("church_name")
         )
-        .with_for_update()
     )
+    return (await session.exec(statement)).first()  # type: ignore
 
-    link = session.exec(statement).first()
 
-    if not link:
-        raise HTTPException(status_code=400, detail="CHURCH_NOT_INVITED")
+async def _add_church_checkins(
+    session: AsyncSession, event_id: uuid.UUID, checkins: dict[uuid.UUID, int]
+) -> None:
+    """
+    Add the number of new check-ins per church to the link counters, in the
+    same transaction as the attendee update. Attendee rows are always locked
+    before the links (as in registration), so this can't deadlock with them.
+    """
+    checkins = {church_id: n for church_id, n in checkins.items() if n}
+    if not checkins:
+        return
+    counts = values(
+        column("church_id", Uuid), column("checked_in", Integer), name="checkins"
+    ).data(sorted(checkins.items()))
+    await session.exec(  # type: ignore
+        update(EventChurchLink)
+        .where(
+            col(EventChurchLink.event_id) == event_id,
+            col(EventChurchLink.church_id) == counts.c.church_id,
+        )
+        .values(checked_in_count=EventChurchLink.checked_in_count + counts.c.checked_in)
+        .execution_options(synchronize_session=False)
+    )
 
-    # --- Global Quota Validation ---
-    # Calculate current total registrations for this event across all churches
-    total_reg_statement: Any = select(func.sum(EventChurchLink.registered_count)).where(
-        EventChurchLink.event_id == event_id
+
+def _open_event_filter(event_id: uuid.UUID) -> Any:
+    """The event, if it is currently accepting registrations."""
+    return and_(
+        col(Event.id) == event_id,
+        col(Event.is_active).is_(True),
+        or_(
+            col(Event.max_registration_date).is_(None),
+            col(Event.max_registration_date) >= datetime.now(),
+        ),
     )
-    total_registered = session.exec(total_reg_statement).one() or 0
 
-    if total_registered >= event.total_quota:
-        raise HTTPException(status_code=400, detail="EVENT_QUOTA_EXCEEDED")
 
-    # Note: We still use the link quota for reference, but we don't block registration
-    # if the church exceeded its specific quota, as requested by the user.
-    # We only block if the EVENT total quota is reached.
+async def _admit_event_seats(
+    session: AsyncSession, event_id: uuid.UUID, seats: int
+) -> Any:
+    """
+    Reserve `seats` places on the event quota with a single conditional UPDATE.
+    Returns the event name row, or None if the event is closed or has no room left.
 
-    # Create Attendee
-    attendee = Attendee(
+    There is no SELECT ... FOR UPDATE and no SUM over the links. Callers update
+    the church link before this, so the event row is only held until their commit.
+    """
+    statement = (
+        update(Event)
+        .where(
+            _open_event_filter(event_id),
+            col(Event.registered_count) + seats <= Event.total_quota,
+        )
+        .values(registered_count=Event.registered_count + seats)
+        .returning(col(Event.name))
+    )
+    return (await session.exec(statement)).first()  # type: ignore
+
+
+async def _insert_attendees(
+    session: AsyncSession, attendees: list[Attendee]
+) -> set[uuid.UUID]:
+    """
+    Insert attendees with one multi-row INSERT ... ON CONFLICT DO NOTHING and
+    return the ids that were actually inserted. Attendees whose normalized
+    document is already registered for the event are skipped by the database.
+    """
+    if not attendees:
+        return set()
+    # Always insert in the same key order so concurrent batches can't deadlock
+    # on the unique index.
+    rows = sorted(attendees, key=lambda a: a.document_key or "")
+    statement = (
+        pg_insert(Attendee)
+        .values([a.model_dump() for a in rows])
+        .on_conflict_do_nothing(
+            index_elements=["event_id", "document_key"],
+            index_where=text("document_key IS NOT NULL"),
+        )
+        .returning(col(Attendee.id))
+    )
+    try:
+        result = await session.exec(statement)  # type: ignore
+    except IntegrityError:
+        # Nothing was checked before the insert: most likely an unknown event
+        await session.rollback()
+        await _get_open_event(session, rows[0].event_id)
+        raise
+    return set(result.scalars().all())
+
+
+def _new_attendee(
+    attendee_in: AttendeeCreate, event_id: uuid.UUID, current_user: AuthUser
+) -> Attendee:
+    return Attendee(
         **attendee_in.model_dump(),
+        document_key=normalize_document_id(attendee_in.document_id),
+        search_name=fold_name(attendee_in.full_name),
         event_id=event_id,
         church_id=current_user.church_id,
         registered_by_id=current_user.id,
     )
-    session.add(attendee)
 
-    # Update count
-    link.registered_count += 1
-    session.add(link)
 
-    session.commit()
-    session.refresh(attendee)
+@router.post("/{event_id}/register", response_model=AttendeePublic)
+async def register_attendee(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentAuthUser,
+    event_id: uuid.UUID,
+    attendee_in: AttendeeCreate,
+) -> Any:
+    """
+    Register an attendee for an event.
+    Transactional check: Ensures Event Quota is not exceeded and Date is valid.
+    A document already registered for the event returns 409 ALREADY_REGISTERED
+    without touching the quota counters, if the event is still open.
+    """
+    check_digiter(current_user)
+
+    if not current_user.church_id:
+        await _get_open_event(session, event_id)
+        raise HTTPException(status_code=400, detail="USER_NO_CHURCH")
+
+    # Create Attendee (the unique index on the normalized document rejects duplicates)
+    attendee = _new_attendee(attendee_in, event_id, current_user)
+    if not await _insert_attendees(session, [attendee]):
+        await _get_open_event(session, event_id)
+        raise HTTPException(status_code=409, detail="ALREADY_REGISTERED")
+
+    link_row = await _add_church_registrations(
+        session, event_id, current_user.church_id, seats=1
+    )
+    if not link_row:
+        await session.rollback()
+        await _get_open_event(session, event_id)
+        raise HTTPException(status_code=400, detail="CHURCH_NOT_INVITED")
+
+    # Note: We still use the link quota for reference, but we don't block registration
+    # if the church exceeded its specific quota, as requested by the user.
+    # We only block if the EVENT total quota is reached.
+
+    # --- Global Quota Admission ---
+    event_row = await _admit_event_seats(session, event_id, seats=1)
+    if not event_row:
+        await session.rollback()
+        await _get_open_event(session, event_id)
+        raise HTTPException(status_code=400, detail="EVENT_QUOTA_EXCEEDED")
 
     # Convert to AttendeePublic and populate metadata for the frontend
-    # Since AttendeePublic is the response_model, FastAPI will handle the conversion
-    # if we return the object, but we want to ensure these extra fields are set.
+    # before committing, so we don't need to refresh the attendee afterwards.
     res = AttendeePublic.model_validate(attendee)
     res.registered_by_email = current_user.email
-    res.event_name = event.name
+    res.event_name = event_row.name
+    res.church_name = link_row.church_name
 
-    church = session.get(Church, attendee.church_id)
-    if church:
-        res.church_name = church.name
+    await session.commit()
 
     return res
 
 
+class BulkRegisterRequest(SQLModel):
+    attendees: list[AttendeeCreate] = Field(min_length=1, max_length=500)
+    partial: bool = Field(
+        default=False,
+        description="Register as many attendees as the quota allows instead of all-or-nothing",
+    )
+
+
+class BulkRegisterRowResult(SQLModel):
+    index: int
+    status: str
+    attendee: AttendeePublic | None = None
+
+
+class BulkRegisterResult(SQLModel):
+    registered_count: int
+    rejected_count: int
+    results: list[BulkRegisterRowResult]
+
+
+@router.post("/{event_id}/register-bulk", response_model=BulkRegisterResult)
+async def register_attendees_bulk(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentAuthUser,
+    event_id: uuid.UUID,
+    data: BulkRegisterRequest,
+) -> Any:
+    """
+    Register a list of attendees (a family, a bus) in a single transaction.
+    By default the new attendees are admitted or rejected as a whole against the
+    event quota. With `partial`, they are admitted in order until the quota is
+    reached and the rest are reported as EVENT_QUOTA_EXCEEDED.
+    Documents that are already registered are reported as ALREADY_REGISTERED.
+    """
+    check_digiter(current_user)
+
+    if not current_user.church_id:
+        await _get_open_event(session, event_id)
+        raise HTTPException(status_code=400, detail="USER_NO_CHURCH")
+
+    attendees = [_new_attendee(a, event_id, current_user) for a in data.attendees]
+    statuses = ["ALREADY_REGISTERED"] * len(attendees)
+
+    # The same person listed twice in the request only counts once
+    candidates = []
+    seen_keys = set()
+    for index, attendee in enumerate(attendees):
+        if attendee.document_key:
+            if attendee.document_key in seen_keys:
+                continue
+            seen_keys.add(attendee.document_key)
+        candidates.append(index)
+
+    inserted_ids = await _insert_attendees(
+        session, [attendees[i] for i in candidates]
+    )
+    new = [i for i in candidates if attendees[i].id in inserted_ids]
+    if not new:
+        # Only duplicates: still 404/400 if the event is unknown or closed
+        await _get_open_event(session, event_id)
+
+    admitted = 0
+    event_name = link_name = None
+    if new:
+        requested = len(new)
+        link_row = await _add_church_registrations(
+            session, event_id, current_user.church_id, seats=requested
+        )
+        if not link_row:
+            await session.rollback()
+            await _get_open_event(session, event_id)
+            raise HTTPException(status_code=400, detail="CHURCH_NOT_INVITED")
+
+        # --- Global Quota Admission ---
+        admitted = requested
+        event_row = await _admit_event_seats(session, event_id, seats=admitted)
+        if not event_row and data.partial:
+            # Fewer seats only help if the event is open: 404/400 otherwise
+            await _get_open_event(session, event_id)
+        while not event_row and data.partial:
+            # Not enough room for everyone: retry with whatever is left right now.
+            remaining = (
+                await session.exec(
+                    select(Event.total_quota - Event.registered_count).where(
+                        _open_event_filter(event_id)
+                    )
+                )
+            ).first()
+            retry = min(requested, remaining or 0)
+            if retry <= 0 or retry == admitted:
+                # Full, closed since the check above, or no room freed up
+                break
+            admitted = retry
+            event_row = await _admit_event_seats(session, event_id, seats=admitted)
+
+        if not event_row:
+            await session.rollback()
+            await _get_open_event(session, event_id)
+            raise HTTPException(status_code=400, detail="EVENT_QUOTA_EXCEEDED")
+
+        surplus = new[admitted:]
+        if surplus:
+            # Remove the rows that did not fit and give back their church seats
+            await session.exec(  # type: ignore
+                delete(Attendee).where(
+                    col(Attendee.id).in_([attendees[i].id for i in surplus])
+                )
+            )
+            await _add_church_registrations(
+                session, event_id, current_user.church_id, seats=-len(surplus)
+            )
+            for index in surplus:
+                statuses[index] = "EVENT_QUOTA_EXCEEDED"
+        for index in new[:admitted]:
+            statuses[index] = "REGISTERED"
+        event_name, link_name = event_row.name, link_row.church_name
+
+    results = []
+    for index, (attendee, status) in enumerate(zip(attendees, statuses, strict=True)):
+        res = None
+        if status == "REGISTERED":
+            res = AttendeePublic.model_validate(attendee)
+            res.registered_by_email = current_user.email
+            res.event_name = event_name
+            res.church_name = link_name
+        results.append(BulkRegisterRowResult(index=index, status=status, attendee=res))
+
+    await session.commit()
+
+    return BulkRegisterResult(
+        registered_count=admitted,
+        rejected_count=len(attendees) - admitted,
+        results=results,
+    )
 
 
 @router.delete("/{event_id}/attendees/{attendee_id}", response_model=dict[str, str])
 def delete_attendee(
     *,
     session: SessionDep,
-    current_user: CurrentUser,
+    current_user: CurrentAuthUser,
     event_id: uuid.UUID,
     attendee_id: uuid.UUID,
 ) -> Any:
@@ -675,7 +986,8 @@ def delete_attendee(
     """
     check_digiter(current_user)
 
-    attendee = session.get(Attendee, attendee_id)
+    # Lock the attendee before the link, in the same order as check-in
+    attendee = session.get(Attendee, attendee_id, with_for_update=True)
     if not attendee:
         raise HTTPException(status_code=404, detail="Attendee not found")
 
@@ -701,8 +1013,18 @@ def delete_attendee(
     if link:
         if link.registered_count > 0:
             link.registered_count -= 1
-            session.add(link)
+        if attendee.checked_in_at and link.checked_in_count > 0:
+            link.checked_in_count -= 1
+        session.add(link)
+
+    # Release the seat on the event-level counter (locked after the link, like registration)
+    session.exec(  # type: ignore
+        update(Event)
+        .where(col(Event.id) == event_id, col(Event.registered_count) > 0)
+        .values(registered_count=Event.registered_count - 1)
+    )
 
+    session.add(AttendeeTombstone(attendee_id=attendee.id, event_id=event_id))
     session.delete(attendee)
     session.commit()
 
@@ -711,7 +1033,7 @@ def delete_attendee(
 
 @router.get("/{event_id}/duplicates", response_model=list[dict[str, Any]])
 def get_event_duplicates(
-    *, session: SessionDep, current_user: CurrentUser, event_id: uuid.UUID
+    *, session: SessionDep, current_user: CurrentAuthUser, event_id: uuid.UUID
 ) -> Any:
     """
     Get groups of attendees that share the same document_id for a specific event.
@@ -748,82 +1070,121 @@ def get_event_duplicates(
     return results
 
 
-@router.post("/{event_id}/duplicates/cleanup", response_model=dict[str, Any])
-def cleanup_event_duplicates(
-    *, session: SessionDep, current_user: CurrentUser, event_id: uuid.UUID
+@router.get("/{event_id}/duplicates/candidates", response_model=list[dict[str, Any]])
+def get_event_duplicate_candidates(
+    *,
+    session: SessionDep,
+    current_user: CurrentAuthUser,
+    event_id: uuid.UUID,
+    min_score: float = DEFAULT_MIN_SCORE,
+    limit: int = 100,
 ) -> Any:
     """
-    Delete duplicate attendee registrations, keeping only the most recent one.
-    Also synchronizes church counts.
+    Get groups of attendees that are probably the same person: similar names
+    and similar (or missing) documents, usually registered by different
+    churches. Best groups first.
     """
     check_admin(current_user)
 
-    # 1. Identificar duplicados
-    statement = (
-        select(Attendee.document_id)
-        .where(Attendee.event_id == event_id)
-        .where(Attendee.document_id != None)
-        .where(Attendee.document_id != "")
-        .group_by(Attendee.document_id)
-        .having(func.count(Attendee.id) > 1)
-    )
-    duplicate_ids = session.exec(statement).all()
-
-    total_deleted = 0
-    impacted_church_ids = set()
-    for doc_id in duplicate_ids:
-        attendees = session.exec(
-            select(Attendee)
-            .where(Attendee.event_id == event_id, Attendee.document_id == doc_id)
-            .order_by(col(Attendee.created_at).desc())  # El más reciente primero
-        ).all()
+    records = session.exec(
+        select(
+            Attendee.id,
+            Attendee.search_name,
+            Attendee.document_key,
+            Attendee.church_id,
+        ).where(Attendee.event_id == event_id)
+    ).all()
+    groups = find_duplicate_candidates(
+        [PersonRecord(*record) for record in records], min_score=min_score
+    )[:limit]
 
-        # Mantener el primero (más reciente), borrar el resto
-        to_delete = attendees[1:]
-        for a in to_delete:
-            impacted_church_ids.add(a.church_id)
-            session.delete(a)
-            total_deleted += 1
+    member_ids = [member_id for group in groups for member_id in group.member_ids]
+    attendees_data = session.exec(
+        select(Attendee, User.email, Church.name)
+        .join(User, cast(Any, Attendee.registered_by_id == User.id))
+        .join(Church, cast(Any, Attendee.church_id == Church.id))
+        .where(col(Attendee.id).in_(member_ids))
+    ).all()
 
-    session.commit()
+    attendees_by_id = {}
+    for attendee, email, church_name in attendees_data:
+        attendee_public = AttendeePublic.model_validate(attendee)
+        attendee_public.registered_by_email = email
+        attendee_public.church_name = church_name
+        attendees_by_id[attendee.id] = attendee_public
+
+    return [
+        {
+            "score": group.score,
+            "cross_church": group.cross_church,
+            "attendees": [attendees_by_id[member_id] for member_id in group.member_ids],
+        }
+        for group in groups
+    ]
 
-    # 2. Resincronizar contadores para las iglesias afectadas (o todas por seguridad)
-    # Por ahora solo las afectadas para eficiencia
-    synced_churches = 0
-    for church_id in impacted_church_ids:
-        link = session.exec(
-            select(EventChurchLink).where(
-                EventChurchLink.event_id == event_id,
-                EventChurchLink.church_id == church_id,
-            )
-        ).first()
 
-        if link:
-            actual_count = session.exec(
-                select(func.count(Attendee.id)).where(
-                    Attendee.event_id == event_id, Attendee.church_id == church_id
-                )
-            ).one()
-            link.registered_count = actual_count
-            session.add(link)
-            synced_churches += 1
+@router.post("/{event_id}/duplicates/cleanup", response_model=dict[str, Any])
+def cleanup_event_duplicates(
+    *,
+    session: SessionDep,
+    current_user: CurrentAuthUser,
+    event_id: uuid.UUID,
+    dry_run: bool = False,
+) -> Any:
+    """
+    Delete duplicate attendee registrations, keeping only the most recent one.
+    Also synchronizes church counts. With dry_run, only reports the
+    registrations that would be deleted.
+    """
+    check_admin(current_user)
 
-    session.commit()
+    removed = cleanup_duplicate_attendees(
+        session=session, event_id=event_id, dry_run=dry_run
+    )
+    total_deleted = len(removed)
+    synced_churches = len({row["church_id"] for row in removed})
 
+    action = "Would clean up" if dry_run else "Successfully cleaned up"
     return {
-        "message": f"Successfully cleaned up {total_deleted} duplicates across {synced_churches} churches.",
+        "message": f"{action} {total_deleted} duplicates across {synced_churches} churches.",
         "deleted_count": total_deleted,
         "synced_churches": synced_churches,
+        "dry_run": dry_run,
+        "removed": jsonable_encoder(removed),
     }
 
 
 @router.post(
-    "/{event_id}/attendees/{attendee_id}/checkin", response_model=AttendeePublic
+    "/{event_id}/counters/reconcile",
+    response_model=dict[str, Any],
+    dependencies=[Depends(get_current_active_superuser)],
+)
+def reconcile_event_church_counters(
+    *, session: SessionDep, event_id: uuid.UUID, dry_run: bool = False
+) -> Any:
+    """
+    Detect (and unless dry_run, repair) drift between the registered and
+    checked-in counters of each invited church and the attendee table.
+    Superadmin only.
+    """
+    if not session.get(Event, event_id):
+        raise HTTPException(status_code=404, detail="Event not found")
+
+    drift = reconcile_event_counters(
+        session=session, event_id=event_id, repair=not dry_run
+    )
+    return {"repaired": not dry_run, "drift": jsonable_encoder(drift)}
+
+
+@router.post(
+    "/{event_id}/attendees/{attendee_id}/checkin",
+    response_model=AttendeePublic,
+    dependencies=[Depends(short_statement_timeout_async)],
 )
-def checkin_attendee(
+async def checkin_attendee(
     *,
-    session: SessionDep,
-    current_user: CurrentUser,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentAuthUser,
     event_id: uuid.UUID,
     attendee_id: uuid.UUID,
 ) -> Any:
@@ -831,7 +1192,8 @@ def checkin_attendee(
     Mark an attendee as checked in.
     """
     check_digiter(current_user)
-    attendee = session.get(Attendee, attendee_id)
+    # Locked so two scanners can't both count the same check-in
+    attendee = await session.get(Attendee, attendee_id, with_for_update=True)
 
     if not attendee:
         raise HTTPException(status_code=404, detail="Attendee not found")
@@ -847,16 +1209,21 @@ def checkin_attendee(
     attendee.checked_in_at = datetime.now(timezone.utc)
     attendee.checked_in_by_id = current_user.id
     session.add(attendee)
-    session.commit()
-    session.refresh(attendee)
+    await _add_church_checkins(session, event_id, {attendee.church_id: 1})
+    await session.commit()
+    await session.refresh(attendee)
     return attendee
 
 
-@router.get("/{event_id}/attendees/search-by-name", response_model=list[AttendeePublic])
-def search_attendees_by_name(
+@router.get(
+    "/{event_id}/attendees/search-by-name",
+    response_model=list[AttendeePublic],
+    dependencies=[Depends(short_statement_timeout_async)],
+)
+async def search_attendees_by_name(
     *,
-    session: SessionDep,
-    current_user: CurrentUser,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentAuthUser,
     event_id: uuid.UUID,
     q: str,
     limit: int = 10,
@@ -871,7 +1238,7 @@ def search_attendees_by_name(
 
     # Search Logic:
     # 1. Base query matches event_id
-    # 2. Name matches fuzzy query
+    # 2. Name matches fuzzy query (accent-insensitive, ranked by similarity)
     # 3. GLOBAL SEARCH: Digitizers can see anyone in the event (no church filter).
 
     statement = (
@@ -879,11 +1246,10 @@ def search_attendees_by_name(
         .join(User, cast(Any, Attendee.registered_by_id == User.id))
         .join(Church, cast(Any, Attendee.church_id == Church.id))
         .where(Attendee.event_id == event_id)
-        .where(col(Attendee.full_name).ilike(f"%{q}%"))
-        .limit(limit)
     )
+    statement = _search_attendees(statement, q).limit(limit)
 
-    attendees_data = session.exec(statement).all()
+    attendees_data = (await session.exec(statement)).all()
 
     results = []
     for attendee, email, church_name in attendees_data:
@@ -896,12 +1262,14 @@ def search_attendees_by_name(
 
 
 @router.get(
-    "/{event_id}/attendees/search", response_model=AttendeePublic | None
+    "/{event_id}/attendees/search",
+    response_model=AttendeePublic | None,
+    dependencies=[Depends(short_statement_timeout_async)],
 )
-def search_attendee_by_document(
+async def search_attendee_by_document(
     *,
-    session: SessionDep,
-    current_user: CurrentUser,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentAuthUser,
     event_id: uuid.UUID,
     document_id: str,
 ) -> Any:
@@ -910,16 +1278,20 @@ def search_attendee_by_document(
     """
     check_digiter(current_user)
 
+    document_key = normalize_document_id(document_id)
+    if not document_key:
+        raise HTTPException(status_code=404, detail="Attendee not found")
+
     # Global search (Cross-church) for the check-in process
     statement = (
         select(Attendee, User.email, Church.name)
         .join(User, cast(Any, Attendee.registered_by_id == User.id))
         .join(Church, cast(Any, Attendee.church_id == Church.id))
         .where(Attendee.event_id == event_id)
-        .where(Attendee.document_id == document_id)
+        .where(Attendee.document_key == document_key)
     )
 
-    result = session.exec(statement).first()
+    result = (await session.exec(statement)).first()
 
     if not result:
         # 404 handled by frontend to show "Not Registered" card
@@ -930,3 +1302,375 @@ def search_attendee_by_document(
     attendee_public.registered_by_email = email
     attendee_public.church_name = church_name
     return attendee_public
+
+
+# Rows changed by transactions that were still in flight when a roster was read
+# carry an updated_at slightly before the read, so cursors overlap by this much.
+ROSTER_SYNC_OVERLAP = timedelta(seconds=30)
+ROSTER_BATCH_SIZE = 2000
+
+
+def roster_document_hash(document_id: str | None) -> str | None:
+    """
+    Hash of the normalized document, as sent in the roster. Devices compute the
+    same hash from a scanned document to look it up in their local index.
+    """
+    document_key = normalize_document_id(document_id)
+    if not document_key:
+        return None
+    return hashlib.sha256(document_key.encode()).hexdigest()[:16]
+
+
+def _iter_roster(
+    event_id: uuid.UUID, since: datetime | None, cursor: datetime
+) -> Iterator[bytes]:
+    """
+    Yield the roster as gzip-compressed NDJSON, reading the attendees with a
+    server-side cursor. Runs after the request session is closed, so it uses
+    its own session.
+    """
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+
+    def line(data: dict[str, Any]) -> bytes:
+        return (json.dumps(data, separators=(",", ":")) + "\n").encode()
+
+    buffer = [
+        line(
+            {
+                "type": "meta",
+                "event_id": str(event_id),
+                "cursor": cursor.isoformat(),
+                "full": since is None,
+            }
+        )
+    ]
+    with Session(engine) as session:
+        # Streams the whole roster, like an export
+        set_statement_timeout(session, settings.DB_LONG_STATEMENT_TIMEOUT_MS)
+        statement = (
+            select(  # type: ignore[call-overload]
+                Attendee.id,
+                Attendee.document_key,
+                Attendee.full_name,
+                Church.name,
+                Attendee.checked_in_at,
+            )
+            .join(Church, cast(Any, Attendee.church_id == Church.id))
+            .where(Attendee.event_id == event_id)
+        )
+        if since:
+            statement = statement.where(Attendee.updated_at > since)
+
+        rows = session.exec(statement.execution_options(yield_per=ROSTER_BATCH_SIZE))
+        for attendee_id, document_key, full_name, church_name, checked_in_at in rows:
+            buffer.append(
+                line(
+                    {
+                        "type": "attendee",
+                        "id": str(attendee_id),
+                        "doc": roster_document_hash(document_key),
+                        "name": full_name,
+                        "church": church_name,
+                        "checked_in": checked_in_at is not None,
+                    }
+                )
+            )
+            if len(buffer) >= ROSTER_BATCH_SIZE:
+                yield compressor.compress(b"".join(buffer))
+                buffer = []
+
+        if since:
+            deleted = session.exec(
+                select(AttendeeTombstone.attendee_id).where(
+                    AttendeeTombstone.event_id == event_id,
+                    AttendeeTombstone.deleted_at > since,
+                )
+            )
+            for attendee_id in deleted:
+                buffer.append(line({"type": "deleted", "id": str(attendee_id)}))
+
+    yield compressor.compress(b"".join(buffer)) + compressor.flush()
+
+
+@router.get("/{event_id}/attendees/roster")
+def get_event_roster(
+    *,
+    session: SessionDep,
+    current_user: CurrentAuthUser,
+    event_id: uuid.UUID,
+    since: datetime | None = None,
+) -> Any:
+    """
+    Compact roster for offline check-in stations, as gzip-compressed NDJSON.
+
+    The first line is `{"type": "meta", "cursor": ...}`. Then one line per
+    attendee with its id, document hash (see `roster_document_hash`), name,
+    church and checked-in flag. Pass the returned cursor as `since` to only get
+    the attendees that changed, plus `{"type": "deleted"}` lines for removed
+    ones. Cursors overlap a little, so apply lines as upserts by id.
+    """
+    check_digiter(current_user)
+    if not session.get(Event, event_id):
+        raise HTTPException(status_code=404, detail="Event not found")
+
+    if since and since.tzinfo:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    cursor = datetime.utcnow() - ROSTER_SYNC_OVERLAP
+
+    return StreamingResponse(
+        _iter_roster(event_id, since, cursor),
+        media_type="application/x-ndjson",
+        headers={"Content-Encoding": "gzip"},
+    )
+
+
+@router.post(
+    "/{event_id}/checkin-by-document",
+    response_model=AttendeePublic,
+    dependencies=[Depends(short_statement_timeout_async)],
+)
+async def checkin_attendee_by_document(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentAuthUser,
+    event_id: uuid.UUID,
+    document_id: str,
+) -> Any:
+    """
+    Scan and check in: find an attendee by document_id and check them in with a
+    single conditional UPDATE.
+    Returns 404 if nobody is registered with that document, and 409 with the
+    original check-in time and who did it if they were already checked in.
+    """
+    check_digiter(current_user)
+
+    document_key = normalize_document_id(document_id)
+    if not document_key:
+        raise HTTPException(status_code=404, detail="Attendee not found")
+
+    registered_by_email = (
+        select(User.email)
+        .where(User.id == Attendee.registered_by_id)
+        .scalar_subquery()
+        .label("registered_by_email")
+    )
+    church_name = (
+        select(Church.name)
+        .where(Church.id == Attendee.church_id)
+        .scalar_subquery()
+        .label("church_name")
+    )
+    statement = (
+        update(Attendee)
+        .where(
+            col(Attendee.event_id) == event_id,
+            col(Attendee.document_key) == document_key,
+            col(Attendee.checked_in_at).is_(None),
+        )
+        .values(
+            checked_in_at=datetime.now(timezone.utc),
+            checked_in_by_id=current_user.id,
+            updated_at=datetime.utcnow(),
+        )
+        .returning(Attendee, registered_by_email, church_name)
+    )
+    result = (await session.exec(statement)).first()  # type: ignore
+
+    if not result:
+        # Only reached on the unhappy path: tell "not registered" from "already in"
+        checked_in_by = aliased(User)
+        existing = (
+            await session.exec(
+                select(Attendee, Church.name, checked_in_by.email)
+                .join(Church, cast(Any, Attendee.church_id == Church.id))
+                .outerjoin(
+                    checked_in_by,
+                    cast(Any, Attendee.checked_in_by_id == checked_in_by.id),
+                )
+                .where(Attendee.event_id == event_id)
+                .where(Attendee.document_key == document_key)
+            )
+        ).first()
+        if not existing:
+            raise HTTPException(status_code=404, detail="Attendee not found")
+
+        attendee, existing_church_name, checked_in_by_email = existing
+        attendee_public = AttendeePublic.model_validate(attendee)
+        attendee_public.church_name = existing_church_name
+        attendee_public.checked_in_by_email = checked_in_by_email
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "message": "Attendee already checked in",
+                "checked_in_at": jsonable_encoder(attendee.checked_in_at),
+                "checked_in_by_email": checked_in_by_email,
+                "attendee": jsonable_encoder(attendee_public),
+            },
+        )
+
+    attendee, email, church = result
+    attendee_public = AttendeePublic.model_validate(attendee)
+    attendee_public.registered_by_email = email
+    attendee_public.church_name = church
+    attendee_public.checked_in_by_email = current_user.email
+
+    await _add_church_checkins(session, event_id, {attendee.church_id: 1})
+    await session.commit()
+
+    return attendee_public
+
+
+class CheckinScan(SQLModel):
+    attendee_id: uuid.UUID | None = None
+    document_id: str | None = None
+    scanned_at: datetime = Field(description="When the scanner read the code")
+
+    @model_validator(mode="after")
+    def _check_identifier(self) -> "CheckinScan":
+        if not self.attendee_id and not self.document_id:
+            raise ValueError("Either attendee_id or document_id is required")
+        return self
+
+
+class BatchCheckinRequest(SQLModel):
+    scans: list[CheckinScan] = Field(min_length=1, max_length=1000)
+
+
+class BatchCheckinRowResult(SQLModel):
+    index: int
+    status: str
+    attendee_id: uuid.UUID | None = None
+    checked_in_at: datetime | None = None
+
+
+class BatchCheckinResult(SQLModel):
+    checked_in_count: int
+    results: list[BatchCheckinRowResult]
+
+
+@dataclass
+class _ScannedAttendee:
+    id: uuid.UUID
+    church_id: uuid.UUID
+    document_key: str | None
+    checked_in_at: datetime | None
+
+
+@router.post(
+    "/{event_id}/checkin-batch",
+    response_model=BatchCheckinResult,
+    dependencies=[Depends(short_statement_timeout_async)],
+)
+async def checkin_attendees_batch(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentAuthUser,
+    event_id: uuid.UUID,
+    data: BatchCheckinRequest,
+) -> Any:
+    """
+    Apply a backlog of scans (e.g. from a scanner that was offline) at once.
+    Each scan identifies the attendee by attendee_id or document_id and carries
+    the time it was scanned. When an attendee is scanned more than once, the
+    earliest time is kept; attendees that are already checked in are left as
+    they are. Returns a status per scan:
+    CHECKED_IN, ALREADY_CHECKED_IN or NOT_FOUND.
+    """
+    check_digiter(current_user)
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    scans = []
+    for scan in data.scans:
+        scanned_at = scan.scanned_at
+        if scanned_at.tzinfo:
+            scanned_at = scanned_at.astimezone(timezone.utc).replace(tzinfo=None)
+        # A phone with a wrong clock can't check someone in the future
+        scans.append(
+            (scan.attendee_id, normalize_document_id(scan.document_id), min(scanned_at, now))
+        )
+
+    attendee_ids = {attendee_id for attendee_id, _, _ in scans if attendee_id}
+    document_keys = {key for attendee_id, key, _ in scans if not attendee_id and key}
+
+    # Lock the scanned attendees once, in a stable order
+    result = (
+        await session.exec(
+            select(
+                Attendee.id,
+                Attendee.church_id,
+                Attendee.document_key,
+                Attendee.checked_in_at,
+            )
+            .where(
+                Attendee.event_id == event_id,
+                or_(
+                    col(Attendee.id).in_(attendee_ids),
+                    col(Attendee.document_key).in_(document_keys),
+                ),
+            )
+            .order_by(col(Attendee.id))
+            .with_for_update()
+        )
+    ).all()
+    rows = [_ScannedAttendee(*row) for row in result]
+    by_id = {row.id: row for row in rows}
+    by_key = {row.document_key: row for row in rows if row.document_key}
+
+    # Earliest scan per attendee
+    matches: list[_ScannedAttendee | None] = []
+    earliest: dict[uuid.UUID, tuple[datetime, int]] = {}
+    for index, (attendee_id, document_key, scanned_at) in enumerate(scans):
+        if attendee_id:
+            row = by_id.get(attendee_id)
+        else:
+            row = by_key.get(document_key) if document_key else None
+        matches.append(row)
+        if row and (row.id not in earliest or scanned_at < earliest[row.id][0]):
+            earliest[row.id] = (scanned_at, index)
+
+    to_update = {
+        attendee_id: scanned_at
+        for attendee_id, (scanned_at, _) in earliest.items()
+        if by_id[attendee_id].checked_in_at is None
+    }
+    if to_update:
+        # One set-based UPDATE ... FROM (VALUES ...) for the whole backlog
+        scan_values = values(
+            column("id", Uuid), column("checked_in_at", DateTime), name="scans"
+        ).data(list(to_update.items()))
+        await session.exec(  # type: ignore
+            update(Attendee)
+            .where(col(Attendee.id) == scan_values.c.id)
+            .values(
+                checked_in_at=scan_values.c.checked_in_at,
+                checked_in_by_id=current_user.id,
+                updated_at=datetime.utcnow(),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        checkins: dict[uuid.UUID, int] = {}
+        for attendee_id in to_update:
+            church_id = by_id[attendee_id].church_id
+            checkins[church_id] = checkins.get(church_id, 0) + 1
+        await _add_church_checkins(session, event_id, checkins)
+    await session.commit()
+
+    results = []
+    checked_in_count = 0
+    for index, row in enumerate(matches):
+        if not row:
+            results.append(BatchCheckinRowResult(index=index, status="NOT_FOUND"))
+            continue
+        scanned_at, first_index = earliest[row.id]
+        newly_checked_in = row.checked_in_at is None and first_index == index
+        checked_in_count += newly_checked_in
+        results.append(
+            BatchCheckinRowResult(
+                index=index,
+                status="CHECKED_IN" if newly_checked_in else "ALREADY_CHECKED_IN",
+                attendee_id=row.id,
+                checked_in_at=to_update.get(row.id, row.checked_in_at),
+            )
+        )
+
+    return BatchCheckinResult(checked_in_count=checked_in_count, results=results)
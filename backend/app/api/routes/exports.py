@@ -0,0 +1,107 @@
+import uuid
+from typing import Annotated, Any
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from sqlmodel import Field, SQLModel, col, func, select
+
+from app import exports
+from app.api.deps import SessionDep, get_current_active_superuser
+from app.exports import ExportFormat, ExportJob, ExportStatus
+from app.models import AuthUser
+from app.models_events import Event
+
+router = APIRouter(prefix="/exports", tags=["exports"])
+
+MEDIA_TYPES = {
+    ExportFormat.CSV: "text/csv",
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.XLSX: "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ExportFormat.PARQUET: "application/vnd.apache.parquet",
+    ExportFormat.ARROW: "application/vnd.apache.arrow.file",
+}
+
+
+class ExportJobCreate(SQLModel):
+    event_ids: list[uuid.UUID] = Field(min_length=1, max_length=50)
+    format: ExportFormat = ExportFormat.CSV
+
+
+@router.post("/", response_model=ExportJob, status_code=202)
+def create_export(
+    *,
+    session: SessionDep,
+    current_user: Annotated[AuthUser, Depends(get_current_active_superuser)],
+    job_in: ExportJobCreate,
+) -> Any:
+    """
+    Enqueue an attendee export for one or more events.
+    Superadmin only.
+    """
+    if (
+        job_in.format in exports.COLUMNAR_FORMATS
+        and not exports.columnar_export_available()
+    ):
+        raise HTTPException(status_code=400, detail="EXPORT_FORMAT_UNAVAILABLE")
+
+    event_ids = set(job_in.event_ids)
+    found = session.exec(
+        select(func.count()).select_from(Event).where(col(Event.id).in_(event_ids))
+    ).one()
+    if found != len(event_ids):
+        raise HTTPException(status_code=404, detail="Event not found")
+
+    try:
+        return exports.enqueue_export(
+            event_ids=job_in.event_ids,
+            format=job_in.format,
+            created_by_id=current_user.id,
+        )
+    except exports.ExportQueueFullError:
+        raise HTTPException(status_code=429, detail="EXPORT_QUEUE_FULL")
+
+
+@router.get(
+    "/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=list[ExportJob],
+)
+def read_exports() -> Any:
+    """
+    List the export jobs that have not expired yet, newest first.
+    """
+    exports.evict_expired_jobs()
+    exports.fail_orphaned_jobs()
+    return exports.list_jobs()
+
+
+@router.get(
+    "/{job_id}",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=ExportJob,
+)
+def read_export(job_id: uuid.UUID) -> Any:
+    """
+    Get the status and progress of an export job.
+    """
+    job = exports.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return job
+
+
+@router.get("/{job_id}/download", dependencies=[Depends(get_current_active_superuser)])
+def download_export(job_id: uuid.UUID) -> Any:
+    """
+    Download the artifact of a finished export job.
+    """
+    job = exports.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export not found")
+    if job.status != ExportStatus.DONE:
+        raise HTTPException(status_code=409, detail="EXPORT_NOT_READY")
+
+    path = exports.artifact_path(job)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Export not found")
+    return FileResponse(path, media_type=MEDIA_TYPES[job.format], filename=job.filename)
@@ -1,4 +1,3 @@
-from datetime import timedelta
 from typing import Annotated, Any
 
 from fastapi import APIRouter, Depends, HTTPException
@@ -7,7 +6,7 @@ from fastapi.security import OAuth2PasswordRequestForm
 
 from app import crud
 from app.api.deps import CurrentUser, SessionDep, get_current_active_superuser
-from app.core import security
+from app.core import google_auth, security
 from app.core.config import settings
 from app.core.security import get_password_hash
 from app.models import Message, NewPassword, Token, TokenGoogle, UserCreate, UserPublic
@@ -22,40 +21,33 @@ router = APIRouter(tags=["login"])
 
 
 @router.post("/login/access-token")
-def login_access_token(
+async def login_access_token(
     session: SessionDep, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
 ) -> Token:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
-    user = crud.authenticate(
+    user = await crud.authenticate_async(
         session=session, email=form_data.username, password=form_data.password
     )
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    return Token(
-        access_token=security.create_access_token(
-            user.id, expires_delta=access_token_expires
-        )
-    )
+    return Token(access_token=security.create_user_access_token(user))
 
 
 @router.post("/login/google")
 def login_google(token_data: TokenGoogle, session: SessionDep) -> Token:
     """
     Login with Google ID Token.
-    Verifies the token with Google, creates a user if not exists, and returns a JWT.
+    Verifies the token against Google's certificates, creates a user if not exists,
+    and returns a JWT.
     """
     try:
-        # Verify the token
-        from google.auth.transport import requests
-        from google.oauth2 import id_token
-
-        id_info = id_token.verify_oauth2_token(  # type: ignore[no-untyped-call]
-            token_data.token, requests.Request(), settings.GOOGLE_CLIENT_ID
+        # Verify the token locally, against Google's cached certificates
+        id_info = google_auth.google_id_token_verifier.verify(
+            token_data.token, settings.GOOGLE_CLIENT_ID
         )
 
         email = id_info.get("email")
@@ -80,16 +72,15 @@ def login_google(token_data: TokenGoogle, session: SessionDep) -> Token:
         if not user.is_active:
              raise HTTPException(status_code=400, detail="Inactive user")
 
-        access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-        return Token(
-            access_token=security.create_access_token(
-                user.id, expires_delta=access_token_expires
-            )
-        )
+        return Token(access_token=security.create_user_access_token(user))
 
     except ValueError as e:
         # Invalid token
         raise HTTPException(status_code=400, detail=f"Invalid Google Token: {str(e)}")
+    except google_auth.GoogleCertsUnavailableError:
+        raise HTTPException(status_code=503, detail="GOOGLE_CERTS_UNAVAILABLE")
+    except (HTTPException, security.PasswordHashQueueFullError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Google Login Failed: {str(e)}")
 
@@ -1,8 +1,20 @@
+import csv
+import io
+import secrets
 import uuid
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import SQLModel, col, delete, func, select
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Response,
+    UploadFile,
+)
+from pydantic import EmailStr, ValidationError
+from sqlalchemy import ARRAY, Uuid, any_, bindparam, case
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Field, SQLModel, col, delete, func, or_, select, update
 
 from app import crud
 from app.api.deps import (
@@ -11,7 +23,14 @@ from app.api.deps import (
     get_current_active_superuser,
 )
 from app.core.config import settings
-from app.core.security import get_password_hash, verify_password
+from app.core.security import (
+    create_user_access_token,
+    get_password_hash,
+    get_password_hashes,
+    verify_password,
+)
+from app.core.user_cache import invalidate_auth_users
+from app.email_outbox import enqueue_email, wake_outbox_worker
 from app.models import (
     Item,
     Message,
@@ -25,6 +44,7 @@ from app.models import (
     UserUpdate,
     UserUpdateMe,
 )
+from app.models_events import Church
 from app.utils import generate_new_account_email, send_email, verify_recaptcha
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -87,10 +107,15 @@ def create_user(*, session: SessionDep, user_in: UserCreate) -> Any:
 
 @router.patch("/me", response_model=UserPublic)
 def update_user_me(
-    *, session: SessionDep, user_in: UserUpdateMe, current_user: CurrentUser
+    *,
+    session: SessionDep,
+    user_in: UserUpdateMe,
+    current_user: CurrentUser,
+    response: Response,
 ) -> Any:
     """
-    Update own user.
+    Update own user. Changing the church revokes the user's access tokens,
+    so a new one is returned in the X-Access-Token header.
     """
 
     if user_in.email:
@@ -100,10 +125,13 @@ def update_user_me(
                 status_code=409, detail="User with this email already exists"
             )
     user_data = user_in.model_dump(exclude_unset=True)
+    token_version = current_user.token_version
     current_user.sqlmodel_update(user_data)
     session.add(current_user)
     session.commit()
     session.refresh(current_user)
+    if current_user.token_version != token_version:
+        response.headers["X-Access-Token"] = create_user_access_token(current_user)
     return current_user
 
 
@@ -176,6 +204,212 @@ def register_user(session: SessionDep, user_in: UserRegister) -> Any:
     return user
 
 
+class UserImportRow(SQLModel):
+    email: EmailStr = Field(max_length=255)
+    full_name: str | None = Field(default=None, max_length=255)
+    # Generated (and sent in the welcome email) when missing
+    password: str | None = Field(default=None, min_length=8, max_length=128)
+    role: UserRole = UserRole.DIGITER
+    church_id: uuid.UUID | None = None
+    church_name: str | None = None
+
+
+USERS_IMPORT_MAX_ROWS = 500
+
+
+class UsersImportRequest(SQLModel):
+    users: list[UserImportRow] = Field(min_length=1, max_length=USERS_IMPORT_MAX_ROWS)
+    send_welcome_email: bool = True
+
+
+class UserImportRowResult(SQLModel):
+    index: int
+    email: str | None = None
+    status: str
+    detail: str | None = None
+    user: UserPublic | None = None
+
+
+class UsersImportResult(SQLModel):
+    created_count: int
+    rejected_count: int
+    results: list[UserImportRowResult]
+
+
+def _import_users(
+    session: SessionDep,
+    rows: list[UserImportRow | None],
+    results: list[UserImportRowResult],
+    send_welcome_email: bool,
+) -> UsersImportResult:
+    """
+    Create the users of the valid rows (None rows were already reported in
+    results) with one lookup of existing emails and churches, one batch of
+    password hashes and one multi-row INSERT.
+    """
+    emails = {row.email for row in rows if row}
+    existing = set(
+        session.exec(select(User.email).where(col(User.email).in_(emails))).all()
+    )
+
+    church_ids = {row.church_id for row in rows if row and row.church_id}
+    church_names = {row.church_name for row in rows if row and row.church_name}
+    churches = session.exec(
+        select(Church.id, Church.name).where(
+            or_(col(Church.id).in_(church_ids), col(Church.name).in_(church_names))
+        )
+    ).all()
+    name_by_id: dict[uuid.UUID | None, str] = dict(churches)
+    id_by_name = {name: church_id for church_id, name in churches}
+
+    accepted: list[tuple[int, UserImportRow, uuid.UUID | None]] = []
+    seen = set()
+    for index, row in enumerate(rows):
+        if row is None:
+            continue
+        church_id = row.church_id or id_by_name.get(row.church_name or "")
+        if row.email in seen:
+            results[index].status = "DUPLICATE_IN_REQUEST"
+        elif row.email in existing:
+            results[index].status = "ALREADY_EXISTS"
+        elif (row.church_id or row.church_name) and church_id not in name_by_id:
+            results[index].status = "CHURCH_NOT_FOUND"
+        else:
+            accepted.append((index, row, church_id))
+        seen.add(row.email)
+
+    passwords = [row.password or secrets.token_urlsafe(12) for _, row, _ in accepted]
+    hashes = get_password_hashes(passwords)
+    users = [
+        User(
+            email=row.email,
+            full_name=row.full_name,
+            role=row.role,
+            church_id=church_id,
+            hashed_password=hashed_password,
+        )
+        for (_, row, church_id), hashed_password in zip(accepted, hashes, strict=True)
+    ]
+
+    inserted_ids: set[uuid.UUID] = set()
+    if users:
+        # Emails registered since the lookup above are skipped by the database
+        statement = (
+            pg_insert(User)
+            .values([user.model_dump() for user in sorted(users, key=lambda u: u.email)])
+            .on_conflict_do_nothing(index_elements=["email"])
+            .returning(col(User.id))
+        )
+        inserted_ids = set(session.exec(statement).scalars().all())  # type: ignore
+
+    for (index, _, church_id), user, password in zip(
+        accepted, users, passwords, strict=True
+    ):
+        if user.id not in inserted_ids:
+            results[index].status = "ALREADY_EXISTS"
+            continue
+        results[index].status = "CREATED"
+        results[index].user = UserPublic.model_validate(
+            user, update={"church_name": name_by_id.get(church_id)}
+        )
+        if send_welcome_email and settings.emails_enabled:
+            email_data = generate_new_account_email(
+                email_to=user.email, username=user.email, password=password
+            )
+            enqueue_email(
+                session,
+                email_to=user.email,
+                subject=email_data.subject,
+                html_content=email_data.html_content,
+            )
+    # The welcome emails are queued with the users
+    session.commit()
+    wake_outbox_worker()
+
+    return UsersImportResult(
+        created_count=len(inserted_ids),
+        rejected_count=len(rows) - len(inserted_ids),
+        results=results,
+    )
+
+
+@router.post(
+    "/import",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=UsersImportResult,
+)
+def import_users(
+    *,
+    session: SessionDep,
+    data: UsersImportRequest,
+) -> Any:
+    """
+    Create many users at once, e.g. the digiters of a new event. Each row is
+    reported as CREATED, ALREADY_EXISTS, DUPLICATE_IN_REQUEST or
+    CHURCH_NOT_FOUND. Welcome emails are queued in the email outbox.
+    """
+    results = [
+        UserImportRowResult(index=index, email=row.email, status="PENDING")
+        for index, row in enumerate(data.users)
+    ]
+    return _import_users(
+        session, list(data.users), results, data.send_welcome_email
+    )
+
+
+@router.post(
+    "/import/csv",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=UsersImportResult,
+)
+def import_users_csv(
+    *,
+    session: SessionDep,
+    file: UploadFile,
+    send_welcome_email: bool = True,
+) -> Any:
+    """
+    import_users from a UTF-8 CSV file with an email column and optional
+    full_name, password, role, church_id and church_name columns. Rows that
+    don't validate are reported as INVALID.
+    """
+    try:
+        content = file.file.read().decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV_NOT_UTF8")
+    reader = csv.DictReader(io.StringIO(content))
+    if "email" not in (reader.fieldnames or []):
+        raise HTTPException(status_code=400, detail="CSV_MISSING_EMAIL_COLUMN")
+    records = list(reader)
+    if not records:
+        raise HTTPException(status_code=400, detail="CSV_EMPTY")
+    if len(records) > USERS_IMPORT_MAX_ROWS:
+        raise HTTPException(status_code=400, detail="CSV_TOO_MANY_ROWS")
+
+    rows: list[UserImportRow | None] = []
+    results = []
+    for index, record in enumerate(records):
+        values = {
+            key: value.strip()
+            for key, value in record.items()
+            if key and value and value.strip()
+        }
+        result = UserImportRowResult(
+            index=index, email=values.get("email"), status="PENDING"
+        )
+        try:
+            rows.append(UserImportRow.model_validate(values))
+        except ValidationError as e:
+            rows.append(None)
+            result.status = "INVALID"
+            result.detail = "; ".join(
+                f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+                for error in e.errors()
+            )
+        results.append(result)
+    return _import_users(session, rows, results, send_welcome_email)
+
+
 class UserBulkUpdate(SQLModel):
     ids: list[uuid.UUID]
     role: UserRole | None = None
@@ -199,24 +433,52 @@ def update_users_bulk(
     data: UserBulkUpdate
 ) -> Any:
     """
-    Update multiple users at once (Role, Church, Activation).
+    Update multiple users at once (Role, Church, Activation) with a single
+    UPDATE. Ids that don't exist are returned in not_found_ids.
     Only Superuser or Admin can do this.
     """
     check_admin(current_user)
 
-    for user_id in data.ids:
-        user = session.get(User, user_id)
-        if user:
-            if data.role:
-                user.role = data.role
-            if data.church_id:
-                user.church_id = data.church_id
-            if data.is_active is not None:
-                user.is_active = data.is_active
-            session.add(user)
-
-    session.commit()
-    return {"message": "Users updated successfully"}
+    ids = list(dict.fromkeys(data.ids))
+    changes: dict[str, Any] = {}
+    if data.role:
+        changes["role"] = data.role
+    if data.church_id:
+        changes["church_id"] = data.church_id
+    if data.is_active is not None:
+        changes["is_active"] = data.is_active
+
+    id_matches = col(User.id) == any_(bindparam("ids", ids, type_=ARRAY(Uuid())))
+    if changes:
+        # All of these are token claims: bump the version of the users for
+        # whom something actually changes, revoking their tokens
+        changed = or_(
+            *(
+                getattr(User, name).is_distinct_from(value)
+                for name, value in changes.items()
+            )
+        )
+        statement = (
+            update(User)
+            .where(id_matches)
+            .values(
+                **changes,
+                token_version=User.token_version + case((changed, 1), else_=0),
+            )
+            .returning(col(User.id))
+        )
+        updated_ids = set(session.exec(statement).scalars().all())  # type: ignore
+        # Bulk UPDATE skips the ORM events that keep the auth cache in sync
+        invalidate_auth_users(session, updated_ids)
+        session.commit()
+    else:
+        updated_ids = set(session.exec(select(User.id).where(id_matches)).all())
+
+    return {
+        "message": "Users updated successfully",
+        "updated_count": len(updated_ids),
+        "not_found_ids": [user_id for user_id in ids if user_id not in updated_ids],
+    }
 
 
 @router.get("/{user_id}", response_model=UserPublic)
@@ -1,7 +1,10 @@
+from typing import Any
+
 from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
 from app.api.deps import get_current_active_superuser
+from app.core.metrics import metrics
 from app.models import Message
 from app.utils import generate_test_email, send_email
 
@@ -29,3 +32,11 @@ def test_email(email_to: EmailStr) -> Message:
 @router.get("/health-check/")
 async def health_check() -> bool:
     return True
+
+
+@router.get("/metrics/", dependencies=[Depends(get_current_active_superuser)])
+def read_metrics() -> dict[str, Any]:
+    """
+    Counters, gauges and timings of the API worker process serving the request.
+    """
+    return metrics.snapshot()
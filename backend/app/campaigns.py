@@ -0,0 +1,224 @@
+"""
+Email campaigns: one email to every recipient of an event's audience.
+
+Creating a campaign only saves it, with the count of its recipients. The
+email outbox workers (app.email_outbox) then queue its emails with
+queue_campaign_emails: each call renders a batch of recipients with the
+compiled template cache (app.utils.email_templates) and inserts their
+emails in the outbox in its own transaction, along with the email of the
+last recipient queued. A campaign interrupted by a restart resumes after
+that recipient, and its queued emails are still in the outbox. The
+workers deliver them at the configured rate, after the transactional
+emails. Progress is the count of the campaign's outbox emails in each
+status.
+"""
+
+import uuid
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Any
+
+from markupsafe import Markup, escape
+from sqlalchemy import insert
+from sqlmodel import Session, col, func, select
+from sqlmodel.sql.expression import Select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models import EmailOutbox, EmailStatus, User, UserRole
+from app.models_events import (
+    CampaignAudience,
+    Church,
+    EmailCampaign,
+    EmailCampaignCreate,
+    EmailCampaignPublic,
+    Event,
+    EventChurchLink,
+)
+from app.utils import email_templates
+
+INSERT_BATCH_SIZE = 1000
+
+AUDIENCE_ROLES = {
+    CampaignAudience.DIGITERS: [UserRole.DIGITER],
+    CampaignAudience.CHURCH_CONTACTS: [UserRole.SUPERVISOR, UserRole.ADMIN],
+    CampaignAudience.ALL: [UserRole.DIGITER, UserRole.SUPERVISOR, UserRole.ADMIN],
+}
+
+
+def campaign_recipients_query(
+    *, event_id: uuid.UUID, audience: CampaignAudience
+) -> Select[Any]:
+    """(email, full_name, church_name) of the active users of the audience."""
+    return (
+        select(User.email, User.full_name, Church.name)
+        .join(Church, col(User.church_id) == Church.id)
+        .join(EventChurchLink, col(EventChurchLink.church_id) == Church.id)
+        .where(
+            EventChurchLink.event_id == event_id,
+            col(User.role).in_(AUDIENCE_ROLES[audience]),
+            col(User.is_active).is_(True),
+        )
+    )
+
+
+def count_campaign_recipients(
+    session: Session, *, event_id: uuid.UUID, audience: CampaignAudience
+) -> int:
+    recipients = campaign_recipients_query(event_id=event_id, audience=audience)
+    return session.exec(select(func.count()).select_from(recipients.subquery())).one()
+
+
+def get_campaign_recipients(
+    session: Session,
+    *,
+    event_id: uuid.UUID,
+    audience: CampaignAudience,
+    after: str | None = None,
+    limit: int | None = None,
+) -> Sequence[Any]:
+    """The recipients ordered by email, from the first one after the given email."""
+    statement = campaign_recipients_query(event_id=event_id, audience=audience)
+    if after is not None:
+        statement = statement.where(col(User.email) > after)
+    return session.exec(statement.order_by(col(User.email)).limit(limit)).all()
+
+
+def format_event_dates(event: Event) -> str:
+    dates = [d.strftime("%Y-%m-%d") for d in (event.start_date, event.end_date) if d]
+    return " - ".join(dict.fromkeys(dates))
+
+
+def render_campaign_email(
+    *, event: Event, message: str, full_name: str | None, church_name: str
+) -> str:
+    # The template doesn't autoescape: escape what users typed
+    return email_templates.get_template("event_notification.html").render(
+        project_name=settings.PROJECT_NAME,
+        event_name=escape(event.name),
+        full_name=escape(full_name or ""),
+        church_name=escape(church_name),
+        event_dates=format_event_dates(event),
+        message=Markup("<br>").join(escape(line) for line in message.splitlines()),
+        link=settings.FRONTEND_HOST,
+    )
+
+
+def create_campaign(
+    session: Session,
+    *,
+    event: Event,
+    campaign_in: EmailCampaignCreate,
+    created_by_id: uuid.UUID | None,
+) -> EmailCampaign | None:
+    """
+    Save a campaign for the outbox workers to queue its emails. None if its
+    audience is empty.
+    """
+    recipient_count = count_campaign_recipients(
+        session, event_id=event.id, audience=campaign_in.audience
+    )
+    if not recipient_count:
+        return None
+    campaign = EmailCampaign.model_validate(
+        campaign_in,
+        update={
+            "event_id": event.id,
+            "created_by_id": created_by_id,
+            "recipient_count": recipient_count,
+        },
+    )
+    session.add(campaign)
+    session.commit()
+    session.refresh(campaign)
+    return campaign
+
+
+def queue_campaign_emails(batch_size: int = INSERT_BATCH_SIZE) -> int:
+    """
+    Render and queue the emails of the next batch of recipients of a
+    campaign, returning how many were queued (0 once every campaign is
+    queued). The campaign is locked while its batch is queued, so workers
+    never queue the same recipients.
+    """
+    with Session(engine) as session:
+        campaign = session.exec(
+            select(EmailCampaign)
+            .where(col(EmailCampaign.queued_at).is_(None))
+            .order_by(col(EmailCampaign.created_at))
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        ).first()
+        if not campaign:
+            return 0
+        event = session.get_one(Event, campaign.event_id)
+        recipients = get_campaign_recipients(
+            session,
+            event_id=campaign.event_id,
+            audience=campaign.audience,
+            after=campaign.queued_until,
+            limit=batch_size,
+        )
+        now = datetime.utcnow()
+        if recipients:
+            rows = [
+                {
+                    "id": uuid.uuid4(),
+                    "email_to": email,
+                    "subject": campaign.subject,
+                    "html_content": render_campaign_email(
+                        event=event,
+                        message=campaign.message,
+                        full_name=full_name,
+                        church_name=church_name,
+                    ),
+                    "status": EmailStatus.PENDING,
+                    "attempts": 0,
+                    "next_attempt_at": now,
+                    "created_at": now,
+                    "campaign_id": campaign.id,
+                }
+                for email, full_name, church_name in recipients
+            ]
+            session.exec(insert(EmailOutbox), params=rows)  # type: ignore
+            campaign.queued_count += len(rows)
+            campaign.queued_until = recipients[-1][0]
+        if len(recipients) < batch_size:
+            # The audience may have changed since the campaign was created
+            campaign.recipient_count = campaign.queued_count
+            campaign.queued_at = now
+        session.add(campaign)
+        session.commit()
+        return len(recipients)
+
+
+def get_campaigns_progress(
+    session: Session, campaigns: Sequence[EmailCampaign]
+) -> list[EmailCampaignPublic]:
+    """
+    The campaigns with the count of their emails in each status. The
+    recipients not queued yet are pending.
+    """
+    counts: dict[uuid.UUID | None, dict[EmailStatus, int]] = {
+        c.id: {} for c in campaigns
+    }
+    if campaigns:
+        rows = session.exec(
+            select(EmailOutbox.campaign_id, EmailOutbox.status, func.count())
+            .where(col(EmailOutbox.campaign_id).in_(list(counts)))
+            .group_by(col(EmailOutbox.campaign_id), col(EmailOutbox.status))
+        ).all()
+        for campaign_id, status, count in rows:
+            counts[campaign_id][EmailStatus(status)] = count
+    return [
+        EmailCampaignPublic.model_validate(
+            campaign,
+            update={
+                "pending_count": counts[campaign.id].get(EmailStatus.PENDING, 0)
+                + max(campaign.recipient_count - campaign.queued_count, 0),
+                "sent_count": counts[campaign.id].get(EmailStatus.SENT, 0),
+                "failed_count": counts[campaign.id].get(EmailStatus.FAILED, 0),
+            },
+        )
+        for campaign in campaigns
+    ]
@@ -50,6 +50,8 @@ class Settings(BaseSettings):
 
     PROJECT_NAME: str
     GOOGLE_CLIENT_ID: str | None = None
+    # Certificates of the keys signing Google ID tokens (app.core.google_auth)
+    GOOGLE_CERTS_URL: str = "https://www.googleapis.com/oauth2/v1/certs"
     GOOGLE_RECAPTCHA_SECRET: str | None = None
     SENTRY_DSN: HttpUrl | None = None
     POSTGRES_SERVER: str
@@ -70,6 +72,41 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    # Postgres itself, when POSTGRES_SERVER is a PgBouncer in transaction
+    # pooling mode: LISTEN and migrations need a session of their own
+    POSTGRES_DIRECT_SERVER: str | None = None
+    POSTGRES_DIRECT_PORT: int | None = None
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def SQLALCHEMY_DIRECT_DATABASE_URI(self) -> PostgresDsn:
+        return PostgresDsn.build(
+            scheme="postgresql+psycopg",
+            username=self.POSTGRES_USER,
+            password=self.POSTGRES_PASSWORD,
+            host=self.POSTGRES_DIRECT_SERVER or self.POSTGRES_SERVER,
+            port=self.POSTGRES_DIRECT_PORT or self.POSTGRES_PORT,
+            path=self.POSTGRES_DB,
+        )
+
+    # Connection pools of each API worker process (app.core.db), one for the
+    # sync engine and one for the async engine. Size them so that
+    # workers x 2 x (DB_POOL_SIZE + DB_MAX_OVERFLOW) fits in the server's
+    # (or PgBouncer's) connection limit.
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    # Seconds to wait for a free connection before answering 503 DB_BUSY
+    DB_POOL_TIMEOUT: float = 10.0
+    DB_POOL_RECYCLE_SECONDS: int = 30 * 60
+    DB_POOL_PRE_PING: bool = True
+    # POSTGRES_SERVER is a PgBouncer in transaction pooling mode
+    DB_PGBOUNCER: bool = False
+    # Per-statement timeouts, 0 disables them. Check-in and search routes use
+    # the short one, exports the long one and everything else the default.
+    DB_STATEMENT_TIMEOUT_MS: int = 30_000
+    DB_SHORT_STATEMENT_TIMEOUT_MS: int = 5_000
+    DB_LONG_STATEMENT_TIMEOUT_MS: int = 30 * 60 * 1000
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
@@ -93,6 +130,37 @@ class Settings(BaseSettings):
         return bool(self.SMTP_HOST and self.EMAILS_FROM_EMAIL)
 
     EMAIL_TEST_USER: EmailStr = "test@example.com"
+
+    # Outbox delivery (app.email_outbox), by each API worker process
+    # Threads delivering concurrently, each with its own SMTP connection
+    EMAIL_OUTBOX_WORKERS: int = 2
+    EMAIL_OUTBOX_BATCH_SIZE: int = 50
+    EMAIL_OUTBOX_POLL_SECONDS: float = 2.0
+    # Shared by the threads, 0 sends as fast as the SMTP server accepts
+    EMAIL_SEND_RATE_PER_SECOND: float = 10.0
+    EMAIL_MAX_ATTEMPTS: int = 5
+    SMTP_TIMEOUT_SECONDS: float = 30.0
+    # Idle SMTP connections are closed after this long
+    SMTP_IDLE_SECONDS: float = 60.0
+
+    # Background attendee exports (artifacts kept on local disk)
+    EXPORTS_DIR: str = "/tmp/app-exports"
+    EXPORT_WORKERS: int = 2
+    EXPORT_MAX_PENDING: int = 20
+    EXPORT_TTL_SECONDS: int = 60 * 60 * 24
+    # A process touches the jobs it queued or runs this often; a waiting or
+    # running job it stops touching (e.g. it restarted) is marked FAILED
+    EXPORT_HEARTBEAT_SECONDS: int = 15
+
+    # Per-process cache of the users behind access tokens (app.core.user_cache)
+    AUTH_USER_CACHE_TTL_SECONDS: int = 60
+    AUTH_USER_CACHE_MAX_SIZE: int = 10_000
+
+    # bcrypt process pool of each API worker process (app.core.security),
+    # 0 workers hashes inline
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 64
+
     FIRST_SUPERUSER: EmailStr
     FIRST_SUPERUSER_PASSWORD: str
 
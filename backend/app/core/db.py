@@ -1,10 +1,112 @@
+import time
+from typing import Any
+
+from sqlalchemy import Connection, Engine, event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.orm import SessionTransaction
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, QueuePool
 from sqlmodel import Session, create_engine, select
 
 from app import crud
 from app.core.config import settings
+from app.core.metrics import metrics
 from app.models import User, UserCreate, UserRole
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+# Session.info key of the statement timeout of the session's transactions
+STATEMENT_TIMEOUT_KEY = "statement_timeout_ms"
+
+
+class TimedQueuePool(QueuePool):
+    """A QueuePool reporting how long checkouts wait for a connection."""
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            metrics.increment("db.pool.timeouts")
+            raise
+        finally:
+            metrics.observe(
+                "db.pool.checkout_seconds", time.perf_counter() - started_at
+            )
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool, TimedQueuePool):
+    """The TimedQueuePool of async engines."""
+
+
+def _engine_options(pgbouncer: bool) -> dict[str, Any]:
+    connect_args: dict[str, Any] = {}
+    if pgbouncer:
+        # Prepared statements don't survive PgBouncer's transaction pooling
+        # (each transaction may run on another server connection), and it
+        # rejects startup options: the default statement timeout is set per
+        # transaction instead, see _set_transaction_statement_timeout
+        connect_args["prepare_threshold"] = None
+    elif settings.DB_STATEMENT_TIMEOUT_MS:
+        connect_args["options"] = (
+            f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"
+        )
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "connect_args": connect_args,
+    }
+
+
+def create_db_engine(url: str, *, pgbouncer: bool = settings.DB_PGBOUNCER) -> Engine:
+    return create_engine(
+        url, poolclass=TimedQueuePool, **_engine_options(pgbouncer)
+    )
+
+
+def create_async_db_engine(
+    url: str, *, pgbouncer: bool = settings.DB_PGBOUNCER
+) -> AsyncEngine:
+    return create_async_engine(
+        url, poolclass=TimedAsyncQueuePool, **_engine_options(pgbouncer)
+    )
+
+
+engine = create_db_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+# For the async routes (AsyncSessionDep). It has a pool of its own, with
+# the same settings: a worker process holds up to twice the connections.
+async_engine = create_async_db_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+
+
+def _apply_statement_timeout(connection: Connection, milliseconds: int) -> None:
+    # Like SET LOCAL: only for the current transaction, so the connection
+    # goes back to the pool (or PgBouncer) with its default
+    connection.execute(
+        text("SELECT set_config('statement_timeout', :value, true)"),
+        {"value": str(milliseconds)},
+    )
+
+
+@event.listens_for(Session, "after_begin")
+def _set_transaction_statement_timeout(
+    session: Session, _transaction: SessionTransaction, connection: Connection
+) -> None:
+    milliseconds = session.info.get(STATEMENT_TIMEOUT_KEY)
+    if milliseconds is None and settings.DB_PGBOUNCER:
+        milliseconds = settings.DB_STATEMENT_TIMEOUT_MS
+    if milliseconds is not None:
+        _apply_statement_timeout(connection, milliseconds)
+
+
+def set_statement_timeout(session: Session, milliseconds: int) -> None:
+    """
+    Set the statement timeout of the session's transactions, the current one
+    included. 0 disables it.
+    """
+    session.info[STATEMENT_TIMEOUT_KEY] = milliseconds
+    if session.in_transaction():
+        _apply_statement_timeout(session.connection(), milliseconds)
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
@@ -53,7 +155,7 @@ def init_db(session: Session) -> None:
     }
 
 
-    
+
     # Specific Event Config (from user request)
     event_configs = {
         "MIRA Madrid": {"date": datetime.datetime(2026, 2, 1), "quota": 1300},
@@ -68,7 +170,7 @@ def init_db(session: Session) -> None:
         existing_event = session.exec(select(Event).where(Event.name == event_name)).first()
         if not existing_event:
             config = event_configs.get(event_name, {"date": datetime.datetime.now(), "quota": 1000})
-            
+
             existing_event = Event(
                 name=event_name,
                 description=f"Evento en {event_name.replace('MIRA ', '')} {current_year}",
@@ -0,0 +1,150 @@
+"""
+Local verification of Google ID tokens, for login_google.
+
+Google signs ID tokens with keys it rotates every few days and publishes at
+GOOGLE_CERTS_URL with a Cache-Control max-age. The certificates are fetched
+over a pooled HTTP session and cached for that long. A background thread
+(start_google_certs_refresher, started with the app) refreshes them shortly
+before they expire, so logins don't wait for Google. The only fetches made
+during a login are:
+
+- the first one, if the refresher hasn't fetched the certificates yet;
+- after they expired, if the refresher keeps failing;
+- for a token signed with a key id that isn't cached (a key rotated in
+  earlier than the cache expected), at most once per
+  UNKNOWN_KEY_REFETCH_SECONDS.
+"""
+
+import logging
+import re
+import threading
+import time
+from typing import Any
+
+import requests
+from google.auth import jwt as google_jwt
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+# Certificates without a Cache-Control max-age are kept this long
+DEFAULT_MAX_AGE_SECONDS = 3600
+# The refresher fetches the certificates this long before they expire
+REFRESH_MARGIN_SECONDS = 300
+UNKNOWN_KEY_REFETCH_SECONDS = 60
+CLOCK_SKEW_SECONDS = 10
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+class GoogleCertsUnavailableError(Exception):
+    pass
+
+
+class GoogleIdTokenVerifier:
+    def __init__(self, certs_url: str, timeout: float = 10) -> None:
+        self.certs_url = certs_url
+        self.timeout = timeout
+        # Keeps the connection to Google alive between fetches
+        self._session = requests.Session()
+        self._fetch_lock = threading.Lock()
+        self._certs: dict[str, str] = {}
+        self.expires_at = 0.0
+        self.fetched_at = float("-inf")
+
+    def verify(self, token: str, audience: str | None) -> dict[str, Any]:
+        """
+        The claims of a valid ID token for audience. Raises ValueError for
+        invalid tokens, like google.oauth2.id_token.verify_oauth2_token.
+        """
+        header = google_jwt.decode_header(token)  # type: ignore[no-untyped-call]
+        certs = self._get_certs(header.get("kid"))
+        claims: dict[str, Any] = google_jwt.decode(  # type: ignore[no-untyped-call]
+            token,
+            certs=certs,
+            audience=audience,
+            clock_skew_in_seconds=CLOCK_SKEW_SECONDS,
+        )
+        if claims.get("iss") not in GOOGLE_ISSUERS:
+            raise ValueError(f"Wrong issuer: {claims.get('iss')}")
+        return claims
+
+    def _get_certs(self, key_id: str | None) -> dict[str, str]:
+        now = time.monotonic()
+        if not self._certs or now >= self.expires_at:
+            self.refresh()
+        elif (
+            key_id not in self._certs
+            and now - self.fetched_at >= UNKNOWN_KEY_REFETCH_SECONDS
+        ):
+            self.refresh()
+        return self._certs
+
+    def refresh(self) -> None:
+        """Fetch the certificates, unless another thread just did."""
+        requested_at = time.monotonic()
+        with self._fetch_lock:
+            if self.fetched_at >= requested_at:
+                return
+            try:
+                response = self._session.get(self.certs_url, timeout=self.timeout)
+                response.raise_for_status()
+                certs = response.json()
+            except (requests.RequestException, ValueError) as e:
+                raise GoogleCertsUnavailableError(str(e)) from e
+
+            fetched_at = time.monotonic()
+            match = _MAX_AGE.search(response.headers.get("Cache-Control", ""))
+            max_age = int(match.group(1)) if match else DEFAULT_MAX_AGE_SECONDS
+            # Time the response already spent in an HTTP cache
+            age = response.headers.get("Age", "")
+            if age.isdigit():
+                max_age -= int(age)
+            # Readers only ever see a complete set of certificates
+            self._certs = dict(certs)
+            self.expires_at = fetched_at + max(max_age, 0)
+            self.fetched_at = fetched_at
+
+
+google_id_token_verifier = GoogleIdTokenVerifier(settings.GOOGLE_CERTS_URL)
+
+
+class GoogleCertsRefresher(threading.Thread):
+    """Refreshes the verifier's certificates before they expire."""
+
+    def __init__(self, verifier: GoogleIdTokenVerifier) -> None:
+        super().__init__(name="google-certs-refresher", daemon=True)
+        self.verifier = verifier
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join(timeout=5)
+
+    def run(self) -> None:
+        retry_seconds = 5.0
+        while not self._stop_event.is_set():
+            try:
+                self.verifier.refresh()
+            except GoogleCertsUnavailableError:
+                logger.warning(
+                    "Could not fetch Google certificates, retrying in %ss",
+                    retry_seconds,
+                    exc_info=True,
+                )
+                self._stop_event.wait(retry_seconds)
+                retry_seconds = min(retry_seconds * 2, 300)
+                continue
+            retry_seconds = 5.0
+            expires_in = self.verifier.expires_at - time.monotonic()
+            self._stop_event.wait(max(expires_in - REFRESH_MARGIN_SECONDS, 60))
+
+
+def start_google_certs_refresher() -> GoogleCertsRefresher | None:
+    if not settings.GOOGLE_CLIENT_ID:
+        return None
+    refresher = GoogleCertsRefresher(google_id_token_verifier)
+    refresher.start()
+    return refresher
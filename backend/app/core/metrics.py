@@ -0,0 +1,49 @@
+"""
+In-process metrics: counters, gauges and timings, exposed by
+GET /utils/metrics/. Each API worker process reports its own values.
+"""
+
+import threading
+from typing import Any
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[str, int] = {}
+        self._gauges: dict[str, float] = {}
+        # name -> [count, total seconds, max seconds]
+        self._timings: dict[str, list[float]] = {}
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            timing = self._timings.setdefault(name, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings": {
+                    name: {
+                        "count": int(count),
+                        "avg_seconds": total / count if count else 0.0,
+                        "max_seconds": maximum,
+                    }
+                    for name, (count, total, maximum) in self._timings.items()
+                },
+            }
+
+
+metrics = Metrics()
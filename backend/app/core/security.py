@@ -1,10 +1,23 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta, timezone
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 import jwt
 from passlib.context import CryptContext
 
 from app.core.config import settings
+from app.core.metrics import metrics
+
+if TYPE_CHECKING:
+    from app.models import User
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -12,16 +25,204 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 ALGORITHM = "HS256"
 
 
-def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
+def create_access_token(
+    subject: str | Any,
+    expires_delta: timedelta,
+    *,
+    role: str | None = None,
+    church_id: uuid.UUID | None = None,
+    is_superuser: bool = False,
+    token_version: int | None = None,
+) -> str:
+    """
+    With a token_version, the token also carries the user's authorization
+    claims (role, church_id, su), so requests can be authorized without
+    loading the user. The claims are only trusted while token_version is
+    the user's current one.
+    """
     expire = datetime.now(timezone.utc) + expires_delta
-    to_encode = {"exp": expire, "sub": str(subject)}
+    to_encode: dict[str, Any] = {"exp": expire, "sub": str(subject)}
+    if token_version is not None:
+        to_encode.update(
+            role=role,
+            church_id=str(church_id) if church_id else None,
+            su=is_superuser,
+            ver=token_version,
+        )
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+def create_user_access_token(user: "User") -> str:
+    """An access token for the user, with their current claims."""
+    return create_access_token(
+        user.id,
+        expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+        role=user.role,
+        church_id=user.church_id,
+        is_superuser=user.is_superuser,
+        token_version=user.token_version,
+    )
+
+
+# --- Password hashing ---
+# bcrypt is deliberately slow (~0.3s per hash or check). Running it inline
+# would hold the calling worker thread and the CPU for that long, so a login
+# storm would starve every other request. Hashes are computed in a bounded
+# process pool instead, with lowered CPU priority, and at most
+# PASSWORD_HASH_MAX_PENDING of them queued per API worker process.
+
+
+class PasswordHashQueueFullError(Exception):
+    pass
+
+
+# Nice increment of the hashing processes: request handling wins the CPU
+HASH_WORKER_NICENESS = 10
+
+_hash_executor: ProcessPoolExecutor | None = None
+_hash_lock = threading.Lock()
+_hash_pending = 0
+
+
+def _init_hash_worker() -> None:
+    os.nice(HASH_WORKER_NICENESS)
+
+
+def _get_hash_executor() -> ProcessPoolExecutor:
+    global _hash_executor
+    with _hash_lock:
+        if _hash_executor is None:
+            # Not forked: the API process runs threads (listeners, pools)
+            _hash_executor = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_hash_worker,
+            )
+        return _hash_executor
+
+
+def _reset_hash_executor(broken: ProcessPoolExecutor) -> None:
+    global _hash_executor
+    with _hash_lock:
+        if _hash_executor is broken:
+            _hash_executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_hash_executor() -> None:
+    global _hash_executor
+    with _hash_lock:
+        executor, _hash_executor = _hash_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _hash_done(submitted_at: float) -> None:
+    global _hash_pending
+    with _hash_lock:
+        _hash_pending -= 1
+        metrics.set_gauge("password_hash.queue_depth", _hash_pending)
+    metrics.observe("password_hash.seconds", time.monotonic() - submitted_at)
+
+
+def _submit_hash_job(fn: Callable[..., Any], *args: Any) -> "Future[Any]":
+    """
+    Queue a hashing job, raising PasswordHashQueueFullError when
+    PASSWORD_HASH_MAX_PENDING jobs are already waiting or running.
+    """
+    global _hash_pending
+    with _hash_lock:
+        if _hash_pending >= settings.PASSWORD_HASH_MAX_PENDING:
+            metrics.increment("password_hash.rejected")
+            raise PasswordHashQueueFullError()
+        _hash_pending += 1
+        metrics.set_gauge("password_hash.queue_depth", _hash_pending)
+    metrics.increment("password_hash.submitted")
+
+    submitted_at = time.monotonic()
+    try:
+        future = _run_hash_job(fn, *args)
+    except BaseException:
+        _hash_done(submitted_at)
+        raise
+    future.add_done_callback(lambda _: _hash_done(submitted_at))
+    return future
+
+
+def _run_hash_job(fn: Callable[..., Any], *args: Any) -> "Future[Any]":
+    if settings.PASSWORD_HASH_WORKERS <= 0:
+        # Inline hashing, e.g. for scripts
+        future: Future[Any] = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    executor = _get_hash_executor()
+    try:
+        return executor.submit(fn, *args)
+    except BrokenProcessPool:
+        # A hashing process died, start a fresh pool once
+        _reset_hash_executor(executor)
+        return _get_hash_executor().submit(fn, *args)
+
+
+def _verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
-def get_password_hash(password: str) -> str:
+def _get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+
+def _get_password_hashes(passwords: list[str]) -> list[str]:
+    return [pwd_context.hash(password) for password in passwords]
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Blocks the calling thread, but not the CPU, see verify_password_async."""
+    return bool(
+        _submit_hash_job(_verify_password, plain_password, hashed_password).result()
+    )
+
+
+def get_password_hash(password: str) -> str:
+    return str(_submit_hash_job(_get_password_hash, password).result())
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password for async routes, holding no thread while it waits."""
+    future = _submit_hash_job(_verify_password, plain_password, hashed_password)
+    return bool(await asyncio.wrap_future(future))
+
+
+async def get_password_hash_async(password: str) -> str:
+    future = _submit_hash_job(_get_password_hash, password)
+    return str(await asyncio.wrap_future(future))
+
+
+def get_password_hashes(passwords: list[str], chunk_size: int = 8) -> list[str]:
+    """
+    Hash many passwords across the hashing processes. Only one chunk per
+    process is queued at a time, so logins arriving meanwhile wait for a
+    chunk, not for the whole batch.
+    """
+    chunks = [
+        passwords[i : i + chunk_size] for i in range(0, len(passwords), chunk_size)
+    ]
+    hashes: list[list[str]] = [[] for _ in chunks]
+    in_flight: dict[Future[Any], int] = {}
+    next_chunk = 0
+    while next_chunk < len(chunks) or in_flight:
+        while next_chunk < len(chunks) and len(in_flight) < max(
+            settings.PASSWORD_HASH_WORKERS, 1
+        ):
+            future = _submit_hash_job(_get_password_hashes, chunks[next_chunk])
+            in_flight[future] = next_chunk
+            next_chunk += 1
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            hashes[in_flight.pop(future)] = future.result()
+    return [password_hash for chunk in hashes for password_hash in chunk]
@@ -0,0 +1,254 @@
+"""
+Per-process cache of the users behind access tokens.
+
+get_current_auth_user would otherwise load the user on every request. The
+cache keeps the AuthUser projection for AUTH_USER_CACHE_TTL_SECONDS, with at
+most AUTH_USER_CACHE_MAX_SIZE users (least recently used evicted first).
+
+Every API worker process has its own cache, so changes are broadcast with
+Postgres NOTIFY on AUTH_USER_CHANNEL:
+
+- Updating or deleting a User through the ORM notifies automatically. Bulk
+  UPDATE/DELETE statements skip the ORM events and must call
+  invalidate_auth_users.
+- NOTIFY is transactional: the other processes hear about a change when it
+  is committed, never before.
+- Each process listens on the channel in a background thread, started with
+  the app (start_invalidation_listener). When the listener connection is
+  lost, the cache is cleared once it is back, since notifications may have
+  been missed. The TTL bounds how stale an entry can get meanwhile.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Iterable
+from typing import Any
+
+import psycopg
+from sqlalchemy import event, make_url, text
+from sqlalchemy.orm import Mapper, object_session
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.models import AuthUser, User
+
+logger = logging.getLogger(__name__)
+
+AUTH_USER_CHANNEL = "auth_user_invalidated"
+# Payload of a notification that clears the whole cache
+INVALIDATE_ALL = "*"
+
+_PENDING_INVALIDATIONS = "auth_user_invalidations"
+
+
+class AuthUserCache:
+    """Thread-safe TTL + LRU map of user id -> AuthUser."""
+
+    def __init__(self, ttl_seconds: float, max_size: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: OrderedDict[uuid.UUID, tuple[float, AuthUser]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation, see put()
+        self.generation = 0
+
+    def get(self, user_id: uuid.UUID) -> AuthUser | None:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def put(self, user: AuthUser, generation: int) -> None:
+        """
+        Cache a user loaded while the cache was at the given generation. If
+        anything was invalidated since, the user may be stale and is not
+        cached.
+        """
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[user.id] = (time.monotonic() + self.ttl_seconds, user)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_ids: Iterable[uuid.UUID]) -> None:
+        with self._lock:
+            self.generation += 1
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+auth_user_cache = AuthUserCache(
+    ttl_seconds=settings.AUTH_USER_CACHE_TTL_SECONDS,
+    max_size=settings.AUTH_USER_CACHE_MAX_SIZE,
+)
+
+
+def get_auth_user(session: Session, user_id: uuid.UUID) -> AuthUser | None:
+    """The AuthUser of user_id, from the cache or loaded (and cached)."""
+    user = auth_user_cache.get(user_id)
+    if user is not None:
+        return user
+
+    generation = auth_user_cache.generation
+    row = session.exec(
+        select(  # type: ignore[call-overload]
+            User.id,
+            User.email,
+            User.is_active,
+            User.is_superuser,
+            User.role,
+            User.church_id,
+            User.token_version,
+        ).where(User.id == user_id)
+    ).first()
+    if row is None:
+        return None
+    user = AuthUser(
+        id=row.id,
+        email=row.email,
+        is_active=row.is_active,
+        is_superuser=row.is_superuser,
+        role=row.role,
+        church_id=row.church_id,
+        token_version=row.token_version,
+    )
+    auth_user_cache.put(user, generation)
+    return user
+
+
+async def get_auth_user_async(
+    session: AsyncSession, user_id: uuid.UUID
+) -> AuthUser | None:
+    """get_auth_user for async routes."""
+    user = auth_user_cache.get(user_id)
+    if user is not None:
+        return user
+    return await session.run_sync(get_auth_user, user_id)  # type: ignore
+
+
+def invalidate_auth_users(session: Session, user_ids: Iterable[uuid.UUID]) -> None:
+    """
+    Drop the users from every process cache once the session commits. Needed
+    after bulk UPDATE/DELETE statements on User, which skip the ORM events.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    session.exec(  # type: ignore
+        text(
+            "SELECT pg_notify(:channel, user_id)"
+            " FROM unnest(CAST(:user_ids AS text[])) AS user_id"
+        ).bindparams(
+            channel=AUTH_USER_CHANNEL,
+            user_ids=[str(user_id) for user_id in user_ids],
+        )
+    )
+    session.info.setdefault(_PENDING_INVALIDATIONS, set()).update(user_ids)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _notify_user_changed(_mapper: Mapper[Any], connection: Any, target: User) -> None:
+    connection.execute(
+        text("SELECT pg_notify(:channel, :user_id)"),
+        {"channel": AUTH_USER_CHANNEL, "user_id": str(target.id)},
+    )
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_INVALIDATIONS, set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session) -> None:
+    # This process doesn't wait for its own notification
+    user_ids = session.info.pop(_PENDING_INVALIDATIONS, None)
+    if user_ids:
+        auth_user_cache.invalidate(user_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session: Session) -> None:
+    session.info.pop(_PENDING_INVALIDATIONS, None)
+
+
+class InvalidationListener(threading.Thread):
+    """LISTENs on AUTH_USER_CHANNEL and invalidates this process' cache."""
+
+    def __init__(self, conninfo: str, poll_seconds: float = 1.0) -> None:
+        super().__init__(name="auth-user-cache-listener", daemon=True)
+        self.conninfo = conninfo
+        self.poll_seconds = poll_seconds
+        self._stop_event = threading.Event()
+        # Set while the channel is being listened on, for tests and health checks
+        self.listening = threading.Event()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join(timeout=self.poll_seconds * 5)
+
+    def run(self) -> None:
+        retry_seconds = self.poll_seconds
+        while not self._stop_event.is_set():
+            try:
+                with psycopg.connect(self.conninfo, autocommit=True) as conn:
+                    conn.execute(f"LISTEN {AUTH_USER_CHANNEL}")
+                    # Changes made while nobody was listening were missed
+                    auth_user_cache.clear()
+                    self.listening.set()
+                    retry_seconds = self.poll_seconds
+                    while not self._stop_event.is_set():
+                        for notify in conn.notifies(timeout=self.poll_seconds):
+                            self._handle(notify.payload)
+            except psycopg.Error:
+                logger.warning(
+                    "Auth user cache listener disconnected, retrying in %ss",
+                    retry_seconds,
+                    exc_info=True,
+                )
+            self.listening.clear()
+            self._stop_event.wait(retry_seconds)
+            retry_seconds = min(retry_seconds * 2, 30)
+
+    @staticmethod
+    def _handle(payload: str) -> None:
+        if payload == INVALIDATE_ALL:
+            auth_user_cache.clear()
+            return
+        try:
+            user_id = uuid.UUID(payload)
+        except ValueError:
+            logger.warning("Ignoring invalid auth user notification %r", payload)
+            return
+        auth_user_cache.invalidate([user_id])
+
+
+def start_invalidation_listener() -> InvalidationListener:
+    # LISTEN needs a session of its own: never through PgBouncer
+    conninfo = (
+        make_url(str(settings.SQLALCHEMY_DIRECT_DATABASE_URI))
+        .set(drivername="postgresql")
+        .render_as_string(hide_password=False)
+    )
+    listener = InvalidationListener(conninfo)
+    listener.start()
+    return listener
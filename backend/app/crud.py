@@ -2,8 +2,9 @@ import uuid
 from typing import Any
 
 from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
 
-from app.core.security import get_password_hash, verify_password
+from app.core.security import get_password_hash, verify_password, verify_password_async
 from app.models import Item, ItemCreate, User, UserCreate, UserUpdate
 
 
@@ -46,6 +47,18 @@ def authenticate(*, session: Session, email: str, password: str) -> User | None:
     return db_user
 
 
+async def authenticate_async(
+    *, session: Session, email: str, password: str
+) -> User | None:
+    """authenticate for async routes: no thread is held during the bcrypt check."""
+    db_user = await run_in_threadpool(get_user_by_email, session=session, email=email)
+    if not db_user:
+        return None
+    if not await verify_password_async(password, db_user.hashed_password):
+        return None
+    return db_user
+
+
 def create_item(*, session: Session, item_in: ItemCreate, owner_id: uuid.UUID) -> Item:
     db_item = Item.model_validate(item_in, update={"owner_id": owner_id})
     session.add(db_item)
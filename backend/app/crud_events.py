@@ -0,0 +1,393 @@
+import uuid
+from collections.abc import Iterator
+from typing import Any, cast
+
+from sqlalchemy import Integer, Uuid, column, tuple_, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, col, delete, func, select, update
+
+from app.models import User
+from app.models_events import (
+    Attendee,
+    AttendeeTombstone,
+    Church,
+    Event,
+    EventChurchLink,
+)
+
+EXPORT_BATCH_SIZE = 2000
+
+ATTENDEE_EXPORT_HEADER = [
+    "Full Name",
+    "Document ID",
+    "Church (Iglesia)",
+    "Registered By (Email)",
+    "Registration Date",
+    "Checked-in At",
+]
+
+
+def iter_attendee_export_rows(session: Session, event_id: uuid.UUID) -> Iterator[Any]:
+    """
+    Yield one row per attendee of the event, in the ATTENDEE_EXPORT_HEADER
+    column order and with the raw database types. Rows are read with a
+    server-side cursor, so memory stays flat whatever the size of the event.
+    """
+    statement = (
+        select(  # type: ignore[call-overload]
+            Attendee.full_name,
+            Attendee.document_id,
+            Church.name,
+            User.email,
+            Attendee.created_at,
+            Attendee.checked_in_at,
+        )
+        .join(Church, cast(Any, Attendee.church_id == Church.id))
+        .join(User, cast(Any, Attendee.registered_by_id == User.id))
+        .where(Attendee.event_id == event_id)
+    )
+    yield from session.exec(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+
+
+def iter_attendee_analytics_rows(
+    session: Session, event_id: uuid.UUID
+) -> Iterator[Any]:
+    """
+    Like iter_attendee_export_rows, with ids, the church quota and who
+    checked the attendee in, for the typed (Parquet/Arrow) exports:
+    (event_id, attendee_id, full_name, document_id, church_id, church_name,
+    quota_limit, registered_by_email, created_at, checked_in_at,
+    checked_in_by_email).
+    """
+    registered_by = aliased(User)
+    checked_in_by = aliased(User)
+    statement = (
+        select(  # type: ignore[call-overload]
+            Attendee.event_id,
+            Attendee.id,
+            Attendee.full_name,
+            Attendee.document_id,
+            Attendee.church_id,
+            Church.name,
+            EventChurchLink.quota_limit,
+            registered_by.email,
+            Attendee.created_at,
+            Attendee.checked_in_at,
+            checked_in_by.email,
+        )
+        .join(Church, cast(Any, Attendee.church_id == Church.id))
+        .join(registered_by, cast(Any, Attendee.registered_by_id == registered_by.id))
+        .outerjoin(
+            EventChurchLink,
+            cast(
+                Any,
+                (EventChurchLink.event_id == Attendee.event_id)
+                & (EventChurchLink.church_id == Attendee.church_id),
+            ),
+        )
+        .outerjoin(
+            checked_in_by, cast(Any, Attendee.checked_in_by_id == checked_in_by.id)
+        )
+        .where(Attendee.event_id == event_id)
+    )
+    yield from session.exec(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+
+
+def format_export_row(row: Any) -> list[str]:
+    """
+    Format an export row as text, the way the CSV export has always shown it.
+    """
+    full_name, document_id, church_name, email, created_at, checked_in_at = row
+    return [
+        full_name,
+        document_id or "N/A",
+        church_name,
+        email,
+        created_at.strftime("%Y-%m-%d %H:%M:%S") if created_at else "N/A",
+        checked_in_at.strftime("%Y-%m-%d %H:%M:%S") if checked_in_at else "N/A",
+    ]
+
+
+def reconcile_event_counters(
+    *, session: Session, event_id: uuid.UUID | None = None, repair: bool = True
+) -> list[dict[str, Any]]:
+    """
+    Compare the registered/checked-in counters of EventChurchLink with the
+    attendee table and return the links that drifted. With repair=True the
+    drifted links are fixed, every event total is recomputed from its links
+    and the transaction is committed.
+
+    The links are locked before counting, so registrations and check-ins
+    running at the same time wait and apply their increment on top of the
+    repaired value instead of being lost.
+    """
+    links = select(EventChurchLink.event_id, EventChurchLink.church_id)
+    if event_id:
+        links = links.where(EventChurchLink.event_id == event_id)
+    if repair:
+        session.exec(
+            links.order_by(
+                col(EventChurchLink.event_id), col(EventChurchLink.church_id)
+            ).with_for_update()
+        ).all()
+
+    actual = select(
+        Attendee.event_id,
+        Attendee.church_id,
+        func.count().label("registered_count"),
+        func.count(col(Attendee.checked_in_at)).label("checked_in_count"),
+    )
+    if event_id:
+        actual = actual.where(Attendee.event_id == event_id)
+    actual_counts = actual.group_by(
+        col(Attendee.event_id), col(Attendee.church_id)
+    ).subquery()
+    actual_registered = func.coalesce(actual_counts.c.registered_count, 0)
+    actual_checked_in = func.coalesce(actual_counts.c.checked_in_count, 0)
+
+    statement = (
+        select(  # type: ignore[call-overload]
+            EventChurchLink.event_id,
+            EventChurchLink.church_id,
+            EventChurchLink.registered_count,
+            actual_registered,
+            EventChurchLink.checked_in_count,
+            actual_checked_in,
+        )
+        .outerjoin(
+            actual_counts,
+            (actual_counts.c.event_id == EventChurchLink.event_id)
+            & (actual_counts.c.church_id == EventChurchLink.church_id),
+        )
+        .where(
+            (EventChurchLink.registered_count != actual_registered)
+            | (EventChurchLink.checked_in_count != actual_checked_in)
+        )
+    )
+    if event_id:
+        statement = statement.where(EventChurchLink.event_id == event_id)
+
+    drift = [
+        {
+            "event_id": link_event_id,
+            "church_id": church_id,
+            "registered_count": registered_count,
+            "actual_registered_count": actual_registered_count,
+            "checked_in_count": checked_in_count,
+            "actual_checked_in_count": actual_checked_in_count,
+        }
+        for (
+            link_event_id,
+            church_id,
+            registered_count,
+            actual_registered_count,
+            checked_in_count,
+            actual_checked_in_count,
+        ) in session.exec(statement).all()
+    ]
+    if not repair:
+        return drift
+
+    if drift:
+        fixed = values(
+            column("event_id", Uuid),
+            column("church_id", Uuid),
+            column("registered_count", Integer),
+            column("checked_in_count", Integer),
+            name="fixed",
+        ).data(
+            [
+                (
+                    row["event_id"],
+                    row["church_id"],
+                    row["actual_registered_count"],
+                    row["actual_checked_in_count"],
+                )
+                for row in drift
+            ]
+        )
+        session.exec(  # type: ignore
+            update(EventChurchLink)
+            .where(
+                col(EventChurchLink.event_id) == fixed.c.event_id,
+                col(EventChurchLink.church_id) == fixed.c.church_id,
+            )
+            .values(
+                registered_count=fixed.c.registered_count,
+                checked_in_count=fixed.c.checked_in_count,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    _resync_event_totals(session, {event_id} if event_id else None)
+    session.commit()
+
+    return drift
+
+
+def _ranked_duplicates(event_id: uuid.UUID | None) -> Any:
+    """
+    Attendees ranked inside each (event, normalized document) group, newest
+    first, with the id of the registration that is kept (rn = 1).
+    Same normalization as app.models_events.normalize_document_id.
+    """
+    document_key = func.nullif(
+        func.regexp_replace(func.upper(Attendee.document_id), "[^0-9A-Z]", "", "g"),
+        "",
+    )
+    partition_by = (col(Attendee.event_id), document_key)
+    order_by = (col(Attendee.created_at).desc(), col(Attendee.id).desc())
+    statement = select(
+        Attendee.id,
+        func.row_number()
+        .over(partition_by=partition_by, order_by=order_by)
+        .label("rn"),
+        func.first_value(Attendee.id)
+        .over(partition_by=partition_by, order_by=order_by)
+        .label("kept_attendee_id"),
+    ).where(document_key.is_not(None))
+    if event_id:
+        statement = statement.where(Attendee.event_id == event_id)
+    return statement.subquery("ranked")
+
+
+def cleanup_duplicate_attendees(
+    *, session: Session, event_id: uuid.UUID | None = None, dry_run: bool = False
+) -> list[dict[str, Any]]:
+    """
+    Remove every registration whose normalized document is registered again,
+    more recently, in the same event, and return the removed rows (with the
+    id of the registration that was kept). With dry_run nothing is changed
+    and the rows that would be removed are returned.
+
+    The removal is a single DELETE ... USING over a row_number() window. The
+    removed attendees get tombstones for roster sync, and the counters of the
+    affected church links (and their events) are recomputed in one UPDATE.
+    """
+    ranked = _ranked_duplicates(event_id)
+    columns = (
+        Attendee.id,
+        Attendee.event_id,
+        Attendee.church_id,
+        Attendee.document_id,
+        Attendee.full_name,
+        Attendee.created_at,
+        Attendee.checked_in_at,
+        ranked.c.kept_attendee_id,
+    )
+    if dry_run:
+        rows = session.exec(
+            select(*columns)  # type: ignore[call-overload]
+            .join(ranked, cast(Any, ranked.c.id == Attendee.id))
+            .where(ranked.c.rn > 1)
+            .order_by(col(Attendee.event_id), col(Attendee.document_id))
+        ).all()
+    else:
+        rows = session.exec(
+            delete(Attendee)
+            .where(col(Attendee.id) == ranked.c.id, ranked.c.rn > 1)
+            .returning(*columns)  # type: ignore[call-overload]
+            .execution_options(synchronize_session=False)
+        ).all()
+
+    removed = [
+        {
+            "attendee_id": attendee_id,
+            "event_id": removed_event_id,
+            "church_id": church_id,
+            "document_id": document_id,
+            "full_name": full_name,
+            "created_at": created_at,
+            "checked_in_at": checked_in_at,
+            "kept_attendee_id": kept_attendee_id,
+        }
+        for (
+            attendee_id,
+            removed_event_id,
+            church_id,
+            document_id,
+            full_name,
+            created_at,
+            checked_in_at,
+            kept_attendee_id,
+        ) in rows
+    ]
+    if dry_run or not removed:
+        return removed
+
+    session.exec(  # type: ignore
+        pg_insert(AttendeeTombstone)
+        .values(
+            [
+                {"attendee_id": row["attendee_id"], "event_id": row["event_id"]}
+                for row in removed
+            ]
+        )
+        .on_conflict_do_nothing()
+    )
+    _resync_church_counters(
+        session, {(row["event_id"], row["church_id"]) for row in removed}
+    )
+    session.commit()
+    return removed
+
+
+def _resync_church_counters(
+    session: Session, links: set[tuple[uuid.UUID, uuid.UUID]]
+) -> None:
+    """
+    Recompute registered/checked-in counters of the given (event, church)
+    links with one UPDATE ... FROM (grouped counts), then the event totals.
+    """
+    link_key = tuple_(col(EventChurchLink.event_id), col(EventChurchLink.church_id))
+    counts = (
+        select(
+            EventChurchLink.event_id,
+            EventChurchLink.church_id,
+            func.count(col(Attendee.id)).label("registered_count"),
+            func.count(col(Attendee.checked_in_at)).label("checked_in_count"),
+        )
+        .outerjoin(
+            Attendee,
+            cast(
+                Any,
+                (Attendee.event_id == EventChurchLink.event_id)
+                & (Attendee.church_id == EventChurchLink.church_id),
+            ),
+        )
+        .where(link_key.in_(sorted(links)))
+        .group_by(col(EventChurchLink.event_id), col(EventChurchLink.church_id))
+        .subquery("counts")
+    )
+    session.exec(  # type: ignore
+        update(EventChurchLink)
+        .where(
+            col(EventChurchLink.event_id) == counts.c.event_id,
+            col(EventChurchLink.church_id) == counts.c.church_id,
+        )
+        .values(
+            registered_count=counts.c.registered_count,
+            checked_in_count=counts.c.checked_in_count,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    _resync_event_totals(session, {event_id for event_id, _ in links})
+
+
+def _resync_event_totals(
+    session: Session, event_ids: set[uuid.UUID] | None = None
+) -> None:
+    """
+    The event-level counter is always the sum of its links. Recompute it for
+    the given events (all events when event_ids is None).
+    """
+    links_total = (
+        select(func.coalesce(func.sum(EventChurchLink.registered_count), 0))
+        .where(EventChurchLink.event_id == Event.id)
+        .scalar_subquery()
+    )
+    statement = update(Event).values(registered_count=links_total)
+    if event_ids is not None:
+        statement = statement.where(col(Event.id).in_(event_ids))
+    session.exec(statement.execution_options(synchronize_session=False))  # type: ignore
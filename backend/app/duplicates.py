@@ -0,0 +1,301 @@
+"""
+Fuzzy duplicate-person detection for attendees.
+
+The exact check in get_event_duplicates only catches identical documents. Most
+real duplicates are the same person registered by two churches, with a typo
+in the document or without one. This engine finds them without comparing all
+pairs:
+
+1. Blocking: every attendee gets a few keys. These are pairs of phonetic name
+   tokens, plus the first and last digits of its normalized document. Only
+   attendees that share a key are compared. Keys shared by more than
+   MAX_BLOCK_SIZE attendees are too common to tell anyone apart, and are
+   skipped.
+2. Scoring: candidate pairs get a name similarity (token-wise, order and
+   missing second surname tolerant), combined with a document similarity
+   when both have one.
+3. Grouping: pairs scoring at least min_score are merged with union-find
+   into ranked candidate groups.
+"""
+
+import re
+import uuid
+from collections import defaultdict
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import combinations
+
+MAX_BLOCK_SIZE = 100
+DOCUMENT_BLOCK_LENGTH = 5
+DEFAULT_MIN_SCORE = 0.8
+
+# Particles that don't identify anyone ("María de los Ángeles")
+NAME_PARTICLES = {"de", "del", "la", "las", "los", "y", "da", "das", "do", "dos", "e"}
+
+_TOKEN_SEPARATOR = re.compile(r"[^a-z0-9]+")
+_REPEATED_LETTER = re.compile(r"(.)\1+")
+
+_PHONETIC_RULES = [
+    (re.compile(r"[^a-z]"), ""),
+    (re.compile(r"ph"), "f"),
+    (re.compile(r"ch"), "x"),
+    (re.compile(r"ll|y"), "i"),
+    (re.compile(r"qu|c(?=[aou])|k|q"), "k"),
+    (re.compile(r"c(?=[ei])|z|s"), "s"),
+    (re.compile(r"c"), "k"),
+    (re.compile(r"g(?=[ei])|j"), "j"),
+    (re.compile(r"gu(?=[ei])"), "g"),
+    (re.compile(r"v|w"), "b"),
+    (re.compile(r"h"), ""),
+]
+
+
+@dataclass
+class PersonRecord:
+    """
+    The fields the engine needs from an attendee: the name already folded
+    (Attendee.search_name) and the normalized document (document_key).
+    """
+
+    id: uuid.UUID
+    search_name: str | None
+    document_key: str | None = None
+    church_id: uuid.UUID | None = None
+
+
+@dataclass
+class CandidateGroup:
+    score: float
+    member_ids: list[uuid.UUID] = field(default_factory=list)
+    cross_church: bool = False
+
+
+@lru_cache(maxsize=100_000)
+def phonetic_key(token: str) -> str:
+    """
+    Spanish-oriented phonetic key: b/v, c/s/z, g/j, ll/y and silent h sound
+    alike and repeated letters are dropped. "Gonzalez" and "Gonsales" both
+    give "gonsales". Vowels are kept: without them too many different names
+    share a key and the blocks get large.
+    """
+    for pattern, replacement in _PHONETIC_RULES:
+        token = pattern.sub(replacement, token)
+    return _REPEATED_LETTER.sub(r"\1", token)
+
+
+def name_tokens(search_name: str | None) -> tuple[str, ...]:
+    """The identifying tokens of a name folded with fold_name."""
+    return tuple(
+        token
+        for token in _TOKEN_SEPARATOR.split(search_name or "")
+        if len(token) > 1 and token not in NAME_PARTICLES
+    )
+
+
+@lru_cache(maxsize=100_000)
+def _bigrams(token: str) -> frozenset[str]:
+    padded = f" {token} "
+    return frozenset(padded[i : i + 2] for i in range(len(padded) - 1))
+
+
+@lru_cache(maxsize=500_000)
+def _token_similarity(a: str, b: str) -> float:
+    """
+    Dice coefficient of the character bigrams, at least 0.8 when both tokens
+    sound the same ("garcia" / "garsia").
+    """
+    if a == b:
+        return 1.0
+    bigrams_a, bigrams_b = _bigrams(a), _bigrams(b)
+    dice = 2 * len(bigrams_a & bigrams_b) / (len(bigrams_a) + len(bigrams_b))
+    if phonetic_key(a) == phonetic_key(b):
+        return max(dice, 0.8)
+    return dice
+
+
+def name_similarity(
+    a: Sequence[str], b: Sequence[str], min_similarity: float = 0.0
+) -> float:
+    """
+    Average, over the tokens of the shorter name, of the best match in the
+    other name. Word order and a missing second surname don't lower it.
+    When the average can't reach min_similarity, 0.0 is returned early.
+    """
+    if not a or not b:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    # Every token can add at most 1.0 to the total
+    missing = len(a) * (1 - min_similarity)
+    total = 0.0
+    for token in a:
+        best = 0.0
+        for other in b:
+            if token == other:
+                best = 1.0
+                break
+            similarity = (
+                _token_similarity(token, other)
+                if token < other
+                else _token_similarity(other, token)
+            )
+            if similarity > best:
+                best = similarity
+        missing -= 1 - best
+        if missing < -1e-9:
+            return 0.0
+        total += best
+    return total / len(a)
+
+
+def document_similarity(a: str, b: str, min_similarity: float = 0.0) -> float:
+    """
+    1 - normalized Levenshtein distance between two document keys. When the
+    similarity can't reach min_similarity, 0.0 is returned as soon as that is
+    known.
+    """
+    if a == b:
+        return 1.0
+    longest = max(len(a), len(b))
+    max_distance = int((1 - min_similarity) * longest + 1e-9)
+    if max_distance == 0 or abs(len(a) - len(b)) > max_distance:
+        return 0.0
+    # Typos are local: drop the common prefix and suffix before the DP
+    shortest = min(len(a), len(b))
+    start = 0
+    while start < shortest and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < shortest - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start : len(a) - end], b[start : len(b) - end]
+    # A single edit (the usual typo) leaves at most one character on each side
+    if len(a) <= 1 and len(b) <= 1:
+        return 1 - 1 / longest
+    if max_distance == 1:
+        return 0.0
+    # Only the cells within max_distance of the diagonal can stay in bounds
+    out_of_bounds = max_distance + 1
+    previous = [j if j <= max_distance else out_of_bounds for j in range(len(b) + 1)]
+    for i, char_a in enumerate(a, 1):
+        current = [out_of_bounds] * (len(b) + 1)
+        if i <= max_distance:
+            current[0] = i
+        row_minimum = current[0]
+        for j in range(max(1, i - max_distance), min(len(b), i + max_distance) + 1):
+            distance = previous[j - 1] + (char_a != b[j - 1])
+            if previous[j] + 1 < distance:
+                distance = previous[j] + 1
+            if current[j - 1] + 1 < distance:
+                distance = current[j - 1] + 1
+            current[j] = distance
+            if distance < row_minimum:
+                row_minimum = distance
+        # Row minimums never decrease: the distance is already too large
+        if row_minimum > max_distance:
+            return 0.0
+        previous = current
+    if previous[-1] > max_distance:
+        return 0.0
+    return 1 - previous[-1] / longest
+
+
+def pair_score(
+    tokens_a: Sequence[str],
+    tokens_b: Sequence[str],
+    document_a: str | None,
+    document_b: str | None,
+    min_score: float = 0.0,
+) -> float:
+    """
+    Similarity of two people in [0, 1]. Scores that can't reach min_score
+    may be returned lower than they are, without finishing the document
+    comparison.
+    """
+    if document_a and document_b:
+        name = name_similarity(tokens_a, tokens_b, (min_score - 0.4) / 0.6)
+        if 0.6 * name + 0.4 < min_score:
+            return 0.6 * name
+        needed = (min_score - 0.6 * name) / 0.4
+        return 0.6 * name + 0.4 * document_similarity(document_a, document_b, needed)
+    # Without both documents the name alone is weaker evidence
+    return 0.9 * name_similarity(tokens_a, tokens_b, min_score / 0.9)
+
+
+def _blocking_keys(tokens: Sequence[str], document_key: str | None) -> list[str]:
+    phonetic = sorted({phonetic_key(token) for token in tokens} - {""})
+    if len(phonetic) == 1:
+        keys = [f"name:{phonetic[0]}"]
+    else:
+        keys = [f"name:{first}:{second}" for first, second in combinations(phonetic, 2)]
+    if document_key and len(document_key) >= DOCUMENT_BLOCK_LENGTH:
+        # A typo at the end keeps the prefix, one at the start keeps the suffix
+        keys.append(f"doc-prefix:{document_key[:DOCUMENT_BLOCK_LENGTH]}")
+        keys.append(f"doc-suffix:{document_key[-DOCUMENT_BLOCK_LENGTH:]}")
+    return keys
+
+
+def find_duplicate_candidates(
+    records: Sequence[PersonRecord], min_score: float = DEFAULT_MIN_SCORE
+) -> list[CandidateGroup]:
+    """
+    Group the records that probably are the same person, best groups first.
+    """
+    tokens = [name_tokens(record.search_name) for record in records]
+    documents = [record.document_key for record in records]
+
+    blocks: dict[str, list[int]] = defaultdict(list)
+    for index in range(len(records)):
+        for key in _blocking_keys(tokens[index], documents[index]):
+            blocks[key].append(index)
+
+    # Union-find over the pairs that score high enough
+    parent = list(range(len(records)))
+
+    def find(index: int) -> int:
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    # Records share several keys: each pair is scored once, keyed a * n + b
+    compared: set[int] = set()
+    best_score: dict[int, float] = {}
+    for members in blocks.values():
+        if len(members) < 2 or len(members) > MAX_BLOCK_SIZE:
+            continue
+        for a, b in combinations(members, 2):
+            pair = a * len(records) + b
+            if pair in compared:
+                continue
+            compared.add(pair)
+            score = pair_score(
+                tokens[a], tokens[b], documents[a], documents[b], min_score
+            )
+            if score < min_score:
+                continue
+            root_a, root_b = find(a), find(b)
+            group_score = max(
+                score, best_score.get(root_a, 0.0), best_score.get(root_b, 0.0)
+            )
+            parent[root_b] = root_a
+            best_score[root_a] = group_score
+
+    groups: dict[int, list[int]] = defaultdict(list)
+    for index in range(len(records)):
+        root = find(index)
+        if root in best_score:
+            groups[root].append(index)
+
+    result = [
+        CandidateGroup(
+            score=round(best_score[root], 4),
+            member_ids=[records[index].id for index in members],
+            cross_church=len({records[index].church_id for index in members}) > 1,
+        )
+        for root, members in groups.items()
+        if len(members) > 1
+    ]
+    result.sort(key=lambda group: (-group.score, -len(group.member_ids)))
+    return result
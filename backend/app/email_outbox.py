@@ -0,0 +1,426 @@
+"""
+Outbox of outgoing emails.
+
+send_email (app.utils) only stores the email in the EmailOutbox table, so
+requests never wait for the SMTP server and queued emails survive restarts.
+Each API worker process runs EMAIL_OUTBOX_WORKERS OutboxWorker threads,
+started with the app when emails are enabled. Each of them:
+
+- queues the emails of the next batch of recipients of a campaign, if any
+  (app.campaigns.queue_campaign_emails);
+- claims up to EMAIL_OUTBOX_BATCH_SIZE due emails with FOR UPDATE SKIP
+  LOCKED, so workers never claim the same email. A claim leases the email
+  for LEASE_SECONDS by moving its next_attempt_at: if the process dies,
+  another worker picks it up once the lease is over. Emails of campaigns
+  (app.campaigns) are claimed after the others, so a large campaign
+  doesn't delay password resets;
+- sends them over its own SMTP connection, kept open between batches and
+  closed after SMTP_IDLE_SECONDS without mail;
+- shares the process' limit of EMAIL_SEND_RATE_PER_SECOND emails per second;
+- retries failed emails with exponential backoff, up to EMAIL_MAX_ATTEMPTS
+  attempts. Emails refused permanently by the server (5xx) are not retried.
+
+Once an email is sent or given up, its content is cleared: only the
+recipient, subject and delivery status are kept.
+
+Delivery is at least once: an email whose delivery was cut short may be
+sent again. The number of emails waiting is the email_outbox.pending gauge
+of GET /utils/metrics/.
+"""
+
+import logging
+import smtplib
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formataddr, formatdate, make_msgid
+
+from sqlmodel import Session, col, func, select, update
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.metrics import metrics
+from app.models import EmailOutbox, EmailStatus
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 300
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 60 * 60
+
+# One per running OutboxWorker of this process, see wake_outbox_worker
+_wakeups: set[threading.Event] = set()
+
+
+def enqueue_email(
+    session: Session, *, email_to: str, subject: str, html_content: str
+) -> EmailOutbox:
+    """Queue an email, delivered once the session commits."""
+    email = EmailOutbox(email_to=email_to, subject=subject, html_content=html_content)
+    session.add(email)
+    return email
+
+
+def wake_outbox_worker() -> None:
+    """Have this process' workers look for due emails now, not at their next poll."""
+    for wakeup in list(_wakeups):
+        wakeup.set()
+
+
+class RateLimiter:
+    """Spaces out sends to rate_per_second, across the threads sharing it."""
+
+    def __init__(self, rate_per_second: float) -> None:
+        self.interval = 1 / rate_per_second if rate_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    def reserve(self) -> float:
+        """Reserve the next send slot, returning how long to wait for it."""
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            send_at = max(now, self._next_at)
+            self._next_at = send_at + self.interval
+            return send_at - now
+
+
+@dataclass
+class OutgoingEmail:
+    id: uuid.UUID
+    email_to: str
+    subject: str
+    html_content: str
+    attempts: int
+
+
+def build_message(email: OutgoingEmail) -> EmailMessage:
+    from_email = str(settings.EMAILS_FROM_EMAIL)
+    message = EmailMessage()
+    message["Subject"] = email.subject
+    message["From"] = formataddr((settings.EMAILS_FROM_NAME or "", from_email))
+    message["To"] = email.email_to
+    message["Date"] = formatdate(usegmt=True)
+    message["Message-ID"] = make_msgid(domain=from_email.rpartition("@")[2])
+    message.set_content(email.html_content, subtype="html")
+    return message
+
+
+class SMTPConnection:
+    """An SMTP connection, opened when needed and reused between emails."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        *,
+        tls: bool = False,
+        ssl: bool = False,
+        user: str | None = None,
+        password: str | None = None,
+        timeout: float = 30.0,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.tls = tls
+        self.ssl = ssl
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self._smtp: smtplib.SMTP | None = None
+        self.last_used = 0.0
+
+    @classmethod
+    def from_settings(cls) -> "SMTPConnection":
+        assert settings.SMTP_HOST, "no provided configuration for email variables"
+        return cls(
+            settings.SMTP_HOST,
+            settings.SMTP_PORT,
+            tls=settings.SMTP_TLS,
+            ssl=settings.SMTP_SSL,
+            user=settings.SMTP_USER,
+            password=settings.SMTP_PASSWORD,
+            timeout=settings.SMTP_TIMEOUT_SECONDS,
+        )
+
+    @property
+    def is_open(self) -> bool:
+        return self._smtp is not None
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp: smtplib.SMTP
+        if self.ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.tls:
+                smtp.starttls()
+        if self.user:
+            smtp.login(self.user, self.password or "")
+        metrics.increment("email_outbox.smtp_connections")
+        return smtp
+
+    def send(self, message: EmailMessage) -> None:
+        if self._smtp is None:
+            self._smtp = self._connect()
+        try:
+            self._smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            # The message may have been accepted before the server hung up:
+            # sending it again here could deliver it twice, leave the retry
+            # to the outbox
+            self.close()
+            raise
+        self.last_used = time.monotonic()
+
+    def close(self) -> None:
+        smtp, self._smtp = self._smtp, None
+        if smtp is None:
+            return
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+
+def claim_emails(batch_size: int) -> list[OutgoingEmail]:
+    """Lease the next due emails to this worker."""
+    now = datetime.utcnow()
+    due = (
+        select(EmailOutbox.id)
+        .where(
+            EmailOutbox.status == EmailStatus.PENDING,
+            EmailOutbox.next_attempt_at <= now,
+        )
+        .order_by(
+            col(EmailOutbox.campaign_id).is_not(None),
+            col(EmailOutbox.next_attempt_at),
+        )
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    statement = (
+        update(EmailOutbox)
+        .where(col(EmailOutbox.id).in_(due.scalar_subquery()))
+        .values(
+            attempts=EmailOutbox.attempts + 1,
+            next_attempt_at=now + timedelta(seconds=LEASE_SECONDS),
+        )
+        .returning(
+            col(EmailOutbox.id),
+            col(EmailOutbox.email_to),
+            col(EmailOutbox.subject),
+            col(EmailOutbox.html_content),
+            col(EmailOutbox.attempts),
+        )
+    )
+    with Session(engine) as session:
+        rows = session.exec(statement).all()  # type: ignore
+        session.commit()
+    return [OutgoingEmail(*row) for row in rows]
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(
+        seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+    )
+
+
+@dataclass
+class _Failure:
+    email: OutgoingEmail
+    error: str
+    permanent: bool = False
+
+
+def record_results(
+    sent_ids: list[uuid.UUID],
+    failures: list[_Failure],
+    unsent: list[OutgoingEmail],
+    max_attempts: int,
+    unsent_delay: timedelta = timedelta(0),
+) -> None:
+    """
+    Mark the sent emails, schedule the retries and give back the unsent
+    emails (claimed, but not attempted) after unsent_delay.
+
+    The content of the emails that won't be delivered again is dropped: it
+    may hold passwords and password reset links.
+    """
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        if sent_ids:
+            session.exec(  # type: ignore
+                update(EmailOutbox)
+                .where(col(EmailOutbox.id).in_(sent_ids))
+                .values(
+                    status=EmailStatus.SENT,
+                    sent_at=now,
+                    last_error=None,
+                    html_content="",
+                )
+            )
+        for failure in failures:
+            values: dict[str, object] = {"last_error": failure.error[:1000]}
+            if failure.permanent or failure.email.attempts >= max_attempts:
+                values["status"] = EmailStatus.FAILED
+                values["html_content"] = ""
+                metrics.increment("email_outbox.failed")
+            else:
+                values["next_attempt_at"] = now + retry_delay(failure.email.attempts)
+                metrics.increment("email_outbox.retried")
+            session.exec(  # type: ignore
+                update(EmailOutbox)
+                .where(col(EmailOutbox.id) == failure.email.id)
+                .values(**values)
+            )
+        if unsent:
+            session.exec(  # type: ignore
+                update(EmailOutbox)
+                .where(col(EmailOutbox.id).in_([email.id for email in unsent]))
+                .values(
+                    attempts=EmailOutbox.attempts - 1,
+                    next_attempt_at=now + unsent_delay,
+                )
+            )
+        session.commit()
+    metrics.increment("email_outbox.sent", len(sent_ids))
+
+
+def count_pending_emails() -> int:
+    with Session(engine) as session:
+        return session.exec(
+            select(func.count())
+            .select_from(EmailOutbox)
+            .where(EmailOutbox.status == EmailStatus.PENDING)
+        ).one()
+
+
+class OutboxWorker(threading.Thread):
+    """
+    Delivers the outbox over a persistent SMTP connection. fill_outbox, if
+    given, is called before claiming each batch to queue more emails and
+    returns how many it queued.
+    """
+
+    def __init__(
+        self,
+        connection: SMTPConnection,
+        *,
+        batch_size: int = 50,
+        rate_limiter: RateLimiter | None = None,
+        poll_seconds: float = 2.0,
+        idle_seconds: float = 60.0,
+        max_attempts: int = 5,
+        fill_outbox: Callable[[], int] | None = None,
+    ) -> None:
+        super().__init__(name="email-outbox-worker", daemon=True)
+        self.connection = connection
+        self.batch_size = batch_size
+        self.rate_limiter = rate_limiter or RateLimiter(0)
+        self.poll_seconds = poll_seconds
+        self.idle_seconds = idle_seconds
+        self.max_attempts = max_attempts
+        self.fill_outbox = fill_outbox
+        self._stop_event = threading.Event()
+        self._wakeup = threading.Event()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._wakeup.set()
+        self.join(timeout=self.connection.timeout + 5)
+
+    def run(self) -> None:
+        _wakeups.add(self._wakeup)
+        while not self._stop_event.is_set():
+            claimed = 0
+            # Before draining: a wakeup set meanwhile is for emails not claimed yet
+            self._wakeup.clear()
+            try:
+                claimed = self.process_batch()
+                metrics.set_gauge("email_outbox.pending", count_pending_emails())
+            except Exception:
+                logger.exception("Email outbox worker failed, retrying")
+            if claimed >= self.batch_size:
+                # More emails are probably due: have the idle workers help
+                wake_outbox_worker()
+            else:
+                # Drained: wait for new emails
+                if (
+                    self.connection.is_open
+                    and time.monotonic() - self.connection.last_used > self.idle_seconds
+                ):
+                    self.connection.close()
+                self._wakeup.wait(self.poll_seconds)
+        _wakeups.discard(self._wakeup)
+        self.connection.close()
+
+    def _throttle(self) -> None:
+        wait = self.rate_limiter.reserve()
+        if wait > 0:
+            self._stop_event.wait(wait)
+
+    def process_batch(self) -> int:
+        """Deliver one batch of due emails, returning how many were claimed."""
+        if self.fill_outbox:
+            self.fill_outbox()
+        emails = claim_emails(self.batch_size)
+        sent_ids: list[uuid.UUID] = []
+        failures: list[_Failure] = []
+        unsent: list[OutgoingEmail] = []
+        unsent_delay = timedelta(0)
+        for index, email in enumerate(emails):
+            if self._stop_event.is_set():
+                unsent = emails[index:]
+                break
+            self._throttle()
+            started_at = time.monotonic()
+            try:
+                self.connection.send(build_message(email))
+            except smtplib.SMTPRecipientsRefused as e:
+                failures.append(_Failure(email, str(e), permanent=True))
+            except smtplib.SMTPResponseException as e:
+                failures.append(_Failure(email, str(e), permanent=e.smtp_code >= 500))
+            except (smtplib.SMTPException, OSError) as e:
+                # The server is unreachable: the rest of the batch waits too
+                self.connection.close()
+                failures.append(_Failure(email, str(e)))
+                unsent = emails[index + 1 :]
+                unsent_delay = retry_delay(1)
+                break
+            else:
+                sent_ids.append(email.id)
+                metrics.observe(
+                    "email_outbox.send_seconds", time.monotonic() - started_at
+                )
+        if emails:
+            record_results(sent_ids, failures, unsent, self.max_attempts, unsent_delay)
+        return len(emails)
+
+
+def start_email_outbox_workers(
+    fill_outbox: Callable[[], int] | None = None,
+) -> list[OutboxWorker]:
+    if not settings.emails_enabled:
+        return []
+    rate_limiter = RateLimiter(settings.EMAIL_SEND_RATE_PER_SECOND)
+    workers = [
+        OutboxWorker(
+            SMTPConnection.from_settings(),
+            batch_size=settings.EMAIL_OUTBOX_BATCH_SIZE,
+            rate_limiter=rate_limiter,
+            poll_seconds=settings.EMAIL_OUTBOX_POLL_SECONDS,
+            idle_seconds=settings.SMTP_IDLE_SECONDS,
+            max_attempts=settings.EMAIL_MAX_ATTEMPTS,
+            fill_outbox=fill_outbox,
+        )
+        for _ in range(settings.EMAIL_OUTBOX_WORKERS)
+    ]
+    for worker in workers:
+        worker.start()
+    return workers
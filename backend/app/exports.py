@@ -0,0 +1,538 @@
+"""
+Background attendee exports.
+
+Exports run in a bounded thread pool outside the request path. The state of
+each job is a small JSON file next to its artifact in settings.EXPORTS_DIR,
+so every API worker process can report progress and serve the download of
+any job, whichever process ran it. Jobs and artifacts older than
+settings.EXPORT_TTL_SECONDS are evicted.
+
+The process that queued a job keeps its file fresh (progress saves, and a
+heartbeat thread while it waits in the pool). A waiting or running job whose
+file goes stale belongs to a process that is gone: it is marked FAILED, so
+it doesn't hold a slot of EXPORT_MAX_PENDING until it expires.
+"""
+
+import csv
+import importlib.util
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+import zipfile
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from enum import Enum
+from pathlib import Path
+from typing import Any
+from xml.sax.saxutils import escape
+
+from pydantic import computed_field
+from sqlmodel import Session, SQLModel, col, func, select
+
+from app.core.config import settings
+from app.core.db import engine, set_statement_timeout
+from app.crud_events import (
+    ATTENDEE_EXPORT_HEADER,
+    EXPORT_BATCH_SIZE,
+    format_export_row,
+    iter_attendee_analytics_rows,
+    iter_attendee_export_rows,
+)
+from app.models_events import Attendee, Event
+
+logger = logging.getLogger(__name__)
+
+
+class ExportFormat(str, Enum):
+    CSV = "csv"
+    XLSX = "xlsx"
+    NDJSON = "ndjson"
+    # Typed columnar formats for analytics, need the optional pyarrow package
+    PARQUET = "parquet"
+    ARROW = "arrow"
+
+
+COLUMNAR_FORMATS = {ExportFormat.PARQUET, ExportFormat.ARROW}
+
+
+class ExportStatus(str, Enum):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+
+
+class ExportJob(SQLModel):
+    id: uuid.UUID
+    format: ExportFormat
+    event_ids: list[uuid.UUID]
+    created_by_id: uuid.UUID
+    created_at: datetime
+    status: ExportStatus = ExportStatus.PENDING
+    finished_at: datetime | None = None
+    total_rows: int = 0
+    rows_written: int = 0
+    error: str | None = None
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def progress(self) -> float:
+        if self.status == ExportStatus.DONE:
+            return 1.0
+        if not self.total_rows:
+            return 0.0
+        return min(self.rows_written / self.total_rows, 1.0)
+
+    @property
+    def filename(self) -> str:
+        return f"attendees_export_{self.id}.{self.format.value}"
+
+
+class ExportQueueFullError(Exception):
+    pass
+
+
+EXPORT_COLUMNS = ["Event", *ATTENDEE_EXPORT_HEADER]
+NDJSON_FIELDS = [
+    "event",
+    "full_name",
+    "document_id",
+    "church",
+    "registered_by",
+    "created_at",
+    "checked_in_at",
+]
+
+ACTIVE_STATUSES = (ExportStatus.PENDING, ExportStatus.RUNNING)
+# Heartbeats a job can miss before it is considered orphaned
+ORPHANED_AFTER_HEARTBEATS = 4
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+# Jobs queued by this process that are not finished yet
+_active_job_ids: set[uuid.UUID] = set()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.EXPORT_WORKERS, thread_name_prefix="export"
+            )
+            threading.Thread(
+                target=_heartbeat, name="export-heartbeat", daemon=True
+            ).start()
+        return _executor
+
+
+def _heartbeat() -> None:
+    # Only touches the files: the content is written by the job's own thread
+    while True:
+        time.sleep(settings.EXPORT_HEARTBEAT_SECONDS)
+        with _executor_lock:
+            job_ids = list(_active_job_ids)
+        for job_id in job_ids:
+            try:
+                os.utime(_job_path(job_id))
+            except FileNotFoundError:
+                continue
+
+
+# --- Job storage ---
+def _exports_dir() -> Path:
+    path = Path(settings.EXPORTS_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _job_path(job_id: uuid.UUID) -> Path:
+    return _exports_dir() / f"{job_id}.json"
+
+
+def artifact_path(job: ExportJob) -> Path:
+    return _exports_dir() / job.filename
+
+
+def save_job(job: ExportJob) -> None:
+    # Written to a temporary file and renamed, so readers never see half a job
+    path = _job_path(job.id)
+    tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+    tmp_path.write_text(job.model_dump_json(exclude={"progress"}))
+    os.replace(tmp_path, path)
+
+
+def get_job(job_id: uuid.UUID) -> ExportJob | None:
+    """The job, marked FAILED first if it is orphaned (see fail_orphaned_jobs)."""
+    path = _job_path(job_id)
+    try:
+        job = ExportJob.model_validate_json(path.read_text())
+    except FileNotFoundError:
+        return None
+    _fail_if_orphaned(path, job, _stale_before(time.time()))
+    return job
+
+
+def list_jobs() -> list[ExportJob]:
+    jobs = []
+    for path in _exports_dir().glob("*.json"):
+        try:
+            jobs.append(ExportJob.model_validate_json(path.read_text()))
+        except (FileNotFoundError, ValueError):
+            # Evicted or being replaced meanwhile
+            continue
+    return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+
+def _remove_job_files(job: ExportJob) -> None:
+    artifact = artifact_path(job)
+    for path in (artifact, artifact.with_suffix(".part"), _job_path(job.id)):
+        path.unlink(missing_ok=True)
+
+
+def _stale_before(now: float) -> float:
+    return now - ORPHANED_AFTER_HEARTBEATS * settings.EXPORT_HEARTBEAT_SECONDS
+
+
+def _fail_if_orphaned(path: Path, job: ExportJob, stale_before: float) -> bool:
+    if job.status not in ACTIVE_STATUSES or job.id in _active_job_ids:
+        return False
+    try:
+        if path.stat().st_mtime >= stale_before:
+            return False
+    except FileNotFoundError:
+        return False
+    job.status = ExportStatus.FAILED
+    job.error = "Interrupted: the process running the export stopped"
+    job.finished_at = datetime.utcnow()
+    save_job(job)
+    return True
+
+
+def fail_orphaned_jobs(now: float | None = None) -> int:
+    """
+    Mark FAILED the waiting or running jobs of other processes that have not
+    been touched for ORPHANED_AFTER_HEARTBEATS heartbeats. Returns their number.
+    """
+    stale_before = _stale_before(now or time.time())
+    failed = 0
+    for path in _exports_dir().glob("*.json"):
+        try:
+            if path.stat().st_mtime >= stale_before:
+                continue
+            job = ExportJob.model_validate_json(path.read_text())
+        except (FileNotFoundError, ValueError):
+            continue
+        failed += _fail_if_orphaned(path, job, stale_before)
+    return failed
+
+
+def evict_expired_jobs(now: datetime | None = None) -> int:
+    """
+    Remove the jobs (and their artifacts) that finished, or were created,
+    more than EXPORT_TTL_SECONDS ago. Returns the number of evicted jobs.
+    """
+    now = now or datetime.utcnow()
+    expires_before = now - timedelta(seconds=settings.EXPORT_TTL_SECONDS)
+    evicted = 0
+    for job in list_jobs():
+        if (job.finished_at or job.created_at) < expires_before:
+            _remove_job_files(job)
+            evicted += 1
+    return evicted
+
+
+# --- Writers ---
+# Each writer consumes (event_name, row) pairs and writes them to `path`.
+ExportRows = Iterator[tuple[str, Any]]
+
+
+def _write_csv(path: Path, rows: ExportRows) -> None:
+    with path.open("w", newline="", encoding="utf-8-sig") as f:  # BOM for Excel
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_COLUMNS)
+        for event_name, row in rows:
+            writer.writerow([event_name, *format_export_row(row)])
+
+
+def _write_ndjson(path: Path, rows: ExportRows) -> None:
+    with path.open("w", encoding="utf-8") as f:
+        for event_name, row in rows:
+            full_name, document_id, church, email, created_at, checked_in_at = row
+            data = [
+                event_name,
+                full_name,
+                document_id,
+                church,
+                email,
+                created_at.isoformat() if created_at else None,
+                checked_in_at.isoformat() if checked_in_at else None,
+            ]
+            f.write(
+                json.dumps(
+                    dict(zip(NDJSON_FIELDS, data, strict=True)), ensure_ascii=False
+                )
+            )
+            f.write("\n")
+
+
+_XLSX_STATIC_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        "</Relationships>"
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Attendees" sheetId="1" r:id="rId1"/></sheets>'
+        "</workbook>"
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        "</Relationships>"
+    ),
+}
+
+# Control characters are not allowed in XML 1.0
+_XML_ILLEGAL = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _xlsx_row(values: list[str]) -> str:
+    cells = "".join(
+        f'<c t="inlineStr"><is><t>{escape(_XML_ILLEGAL.sub("", value))}</t></is></c>'
+        for value in values
+    )
+    return f"<row>{cells}</row>"
+
+
+def _write_xlsx(path: Path, rows: ExportRows) -> None:
+    """
+    Minimal single-sheet workbook with inline strings. The sheet is written
+    straight into the zip entry, so rows are never all held in memory.
+    """
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, content in _XLSX_STATIC_PARTS.items():
+            zf.writestr(name, content)
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b"<sheetData>"
+            )
+            sheet.write(_xlsx_row(EXPORT_COLUMNS).encode())
+            for event_name, row in rows:
+                sheet.write(_xlsx_row([event_name, *format_export_row(row)]).encode())
+            sheet.write(b"</sheetData></worksheet>")
+
+
+def columnar_export_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _arrow_batches(rows: ExportRows) -> Iterator[Any]:
+    import pyarrow as pa
+
+    schema = _arrow_schema()
+    batch: list[tuple[str, Any]] = []
+    for item in rows:
+        batch.append(item)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield _arrow_batch(pa, schema, batch)
+            batch = []
+    if batch:
+        yield _arrow_batch(pa, schema, batch)
+
+
+def _arrow_schema() -> Any:
+    import pyarrow as pa
+
+    timestamp = pa.timestamp("us", tz="UTC")  # stored as naive UTC in the database
+    return pa.schema(
+        [
+            ("event_id", pa.string()),
+            ("event_name", pa.string()),
+            ("attendee_id", pa.string()),
+            ("full_name", pa.string()),
+            ("document_id", pa.string()),
+            ("church_id", pa.string()),
+            ("church_name", pa.string()),
+            ("church_quota_limit", pa.int32()),
+            ("registered_by_email", pa.string()),
+            ("created_at", timestamp),
+            ("checked_in_at", timestamp),
+            ("checked_in_by_email", pa.string()),
+        ]
+    )
+
+
+def _arrow_batch(pa: Any, schema: Any, batch: list[tuple[str, Any]]) -> Any:
+    columns: list[list[Any]] = [[] for _ in schema.names]
+    for event_name, row in batch:
+        (
+            event_id,
+            attendee_id,
+            full_name,
+            document_id,
+            church_id,
+            church_name,
+            quota_limit,
+            registered_by_email,
+            created_at,
+            checked_in_at,
+            checked_in_by_email,
+        ) = row
+        values = [
+            str(event_id),
+            event_name,
+            str(attendee_id),
+            full_name,
+            document_id,
+            str(church_id),
+            church_name,
+            quota_limit,
+            registered_by_email,
+            created_at,
+            checked_in_at,
+            checked_in_by_email,
+        ]
+        for column, value in zip(columns, values, strict=True):
+            column.append(value)
+    return pa.RecordBatch.from_arrays(
+        [
+            pa.array(column, type=field.type)
+            for column, field in zip(columns, schema, strict=True)
+        ],
+        schema=schema,
+    )
+
+
+def _write_parquet(path: Path, rows: ExportRows) -> None:
+    import pyarrow.parquet as pq
+
+    with pq.ParquetWriter(path, _arrow_schema(), compression="zstd") as writer:
+        for batch in _arrow_batches(rows):
+            writer.write_batch(batch)
+
+
+def _write_arrow(path: Path, rows: ExportRows) -> None:
+    import pyarrow as pa
+
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    with pa.ipc.new_file(str(path), _arrow_schema(), options=options) as writer:
+        for batch in _arrow_batches(rows):
+            writer.write_batch(batch)
+
+
+_WRITERS: dict[ExportFormat, Callable[[Path, ExportRows], None]] = {
+    ExportFormat.CSV: _write_csv,
+    ExportFormat.NDJSON: _write_ndjson,
+    ExportFormat.XLSX: _write_xlsx,
+    ExportFormat.PARQUET: _write_parquet,
+    ExportFormat.ARROW: _write_arrow,
+}
+
+
+# --- Jobs ---
+def run_export(job_id: uuid.UUID) -> None:
+    """
+    Write the artifact of a job, saving its progress every EXPORT_BATCH_SIZE rows.
+    """
+    job = get_job(job_id)
+    if not job:
+        with _executor_lock:
+            _active_job_ids.discard(job_id)
+        return
+    job.status = ExportStatus.RUNNING
+    save_job(job)
+
+    part_path = artifact_path(job).with_suffix(".part")
+    try:
+        with Session(engine) as session:
+            set_statement_timeout(session, settings.DB_LONG_STATEMENT_TIMEOUT_MS)
+            job.total_rows = session.exec(
+                select(func.count())
+                .select_from(Attendee)
+                .where(col(Attendee.event_id).in_(job.event_ids))
+            ).one()
+            event_names = dict(
+                session.exec(
+                    select(Event.id, Event.name).where(col(Event.id).in_(job.event_ids))
+                ).all()
+            )
+            save_job(job)
+
+            iter_rows = (
+                iter_attendee_analytics_rows
+                if job.format in COLUMNAR_FORMATS
+                else iter_attendee_export_rows
+            )
+
+            def rows() -> ExportRows:
+                for event_id in job.event_ids:
+                    for row in iter_rows(session, event_id):
+                        yield event_names.get(event_id, ""), row
+                        job.rows_written += 1
+                        if job.rows_written % EXPORT_BATCH_SIZE == 0:
+                            save_job(job)
+
+            _WRITERS[job.format](part_path, rows())
+        os.replace(part_path, artifact_path(job))
+        job.status = ExportStatus.DONE
+    except Exception as e:
+        logger.exception("Export %s failed", job.id)
+        part_path.unlink(missing_ok=True)
+        job.status = ExportStatus.FAILED
+        job.error = str(e)
+
+    job.finished_at = datetime.utcnow()
+    save_job(job)
+    with _executor_lock:
+        _active_job_ids.discard(job.id)
+
+
+def enqueue_export(
+    *, event_ids: list[uuid.UUID], format: ExportFormat, created_by_id: uuid.UUID
+) -> ExportJob:
+    """
+    Create an export job and hand it to the worker pool. Raises
+    ExportQueueFullError when EXPORT_MAX_PENDING jobs are already waiting or
+    running.
+    """
+    evict_expired_jobs()
+    fail_orphaned_jobs()
+    active = [job for job in list_jobs() if job.status in ACTIVE_STATUSES]
+    if len(active) >= settings.EXPORT_MAX_PENDING:
+        raise ExportQueueFullError()
+
+    job = ExportJob(
+        id=uuid.uuid4(),
+        format=format,
+        event_ids=list(dict.fromkeys(event_ids)),
+        created_by_id=created_by_id,
+        created_at=datetime.utcnow(),
+    )
+    executor = _get_executor()
+    with _executor_lock:
+        _active_job_ids.add(job.id)
+    save_job(job)
+    executor.submit(run_export, job.id)
+    return job
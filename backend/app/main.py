@@ -1,10 +1,23 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 import sentry_sdk
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.routing import APIRoute
+from psycopg.errors import QueryCanceled
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.main import api_router
+from app.campaigns import queue_campaign_emails
 from app.core.config import settings
+from app.core.db import async_engine
+from app.core.google_auth import start_google_certs_refresher
+from app.core.security import PasswordHashQueueFullError, shutdown_hash_executor
+from app.core.user_cache import start_invalidation_listener
+from app.email_outbox import start_email_outbox_workers
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -14,8 +27,30 @@ def custom_generate_unique_id(route: APIRoute) -> str:
 if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
     sentry_sdk.init(dsn=str(settings.SENTRY_DSN), enable_tracing=True)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # Keeps this worker's auth user cache in sync with the other workers
+    app.state.auth_user_cache_listener = start_invalidation_listener()
+    # Google logins verify tokens against certificates fetched ahead of time
+    app.state.google_certs_refresher = start_google_certs_refresher()
+    app.state.email_outbox_workers = start_email_outbox_workers(
+        fill_outbox=queue_campaign_emails
+    )
+    yield
+    app.state.auth_user_cache_listener.stop()
+    if app.state.google_certs_refresher:
+        app.state.google_certs_refresher.stop()
+    for worker in app.state.email_outbox_workers:
+        worker.stop()
+    shutdown_hash_executor()
+    # Its connections belong to this event loop
+    await async_engine.dispose()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
+    lifespan=lifespan,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
 )
@@ -28,6 +63,41 @@ if settings.all_cors_origins:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        # Refreshed access token, see update_user_me
+        expose_headers=["X-Access-Token"],
+    )
+
+
+@app.exception_handler(PasswordHashQueueFullError)
+def password_hash_queue_full_handler(
+    _request: Request, _exc: PasswordHashQueueFullError
+) -> JSONResponse:
+    # Too many logins/password changes in flight on this worker
+    return JSONResponse(
+        status_code=503, content={"detail": "AUTH_BUSY"}, headers={"Retry-After": "1"}
     )
 
+
+@app.exception_handler(PoolTimeoutError)
+def db_pool_timeout_handler(_request: Request, _exc: PoolTimeoutError) -> JSONResponse:
+    # No database connection freed up within DB_POOL_TIMEOUT
+    return JSONResponse(
+        status_code=503, content={"detail": "DB_BUSY"}, headers={"Retry-After": "1"}
+    )
+
+
+@app.exception_handler(OperationalError)
+def db_operational_error_handler(
+    _request: Request, exc: OperationalError
+) -> JSONResponse:
+    if not isinstance(exc.orig, QueryCanceled):
+        raise exc
+    # A statement ran past its statement timeout
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "DB_STATEMENT_TIMEOUT"},
+        headers={"Retry-After": "1"},
+    )
+
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
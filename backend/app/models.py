@@ -1,9 +1,12 @@
 import uuid
 from datetime import datetime
 from enum import Enum
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
 
 from pydantic import EmailStr
+from sqlalchemy import Index, text
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm.attributes import get_history
 from sqlmodel import Field, Relationship, SQLModel
 
 # Import generated models to ensure they are registered with SQLModel.metadata
@@ -73,6 +76,32 @@ class User(UserBase, table=True):
 
     church: "Church" = Relationship(back_populates="users")
 
+    # Bumped when the claims in the user's access tokens change, which
+    # revokes the tokens issued before
+    token_version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+
+
+# Changing any of these revokes the user's access tokens: they are embedded
+# as claims (app.core.security), or deactivate the user
+TOKEN_VERSION_FIELDS = ("role", "church_id", "is_superuser", "is_active")
+
+
+@sa_event.listens_for(User, "before_update")
+def _bump_token_version(_mapper: Any, _connection: Any, target: User) -> None:
+    if any(get_history(target, name).has_changes() for name in TOKEN_VERSION_FIELDS):
+        target.token_version = (target.token_version or 0) + 1
+
+
+# What authorization needs from a user, cached per process (app.core.user_cache)
+class AuthUser(SQLModel):
+    id: uuid.UUID
+    email: str
+    is_active: bool
+    is_superuser: bool
+    role: UserRole
+    church_id: uuid.UUID | None = None
+    token_version: int = 0
+
 
 # Properties to return via API, id is always required
 class UserPublic(UserBase):
@@ -140,6 +169,44 @@ class TokenGoogle(SQLModel):
 # Contents of JWT token
 class TokenPayload(SQLModel):
     sub: str | None = None
+    # Authorization claims, absent from tokens issued without them
+    role: UserRole | None = None
+    church_id: uuid.UUID | None = None
+    su: bool = False
+    ver: int | None = None
+
+
+class EmailStatus(str, Enum):
+    PENDING = "PENDING"
+    SENT = "SENT"
+    FAILED = "FAILED"
+
+
+# Emails waiting to be delivered by the outbox worker (app.email_outbox)
+class EmailOutbox(SQLModel, table=True):
+    __table_args__ = (
+        # Claiming the next batch to deliver
+        Index(
+            "ix_emailoutbox_pending_next_attempt_at",
+            "next_attempt_at",
+            postgresql_where=text("status = 'PENDING'"),
+        ),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    email_to: str = Field(max_length=255)
+    subject: str = Field(max_length=255)
+    html_content: str
+    status: EmailStatus = Field(default=EmailStatus.PENDING)
+    attempts: int = 0
+    # While a worker is delivering the email, the end of its lease
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow)
+    last_error: str | None = Field(default=None, max_length=1000)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    sent_at: datetime | None = None
+    campaign_id: uuid.UUID | None = Field(
+        default=None, foreign_key="emailcampaign.id", ondelete="CASCADE", index=True
+    )
 
 
 class NewPassword(SQLModel):
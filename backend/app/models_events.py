@@ -1,7 +1,13 @@
+import re
+import unicodedata
 import uuid
 from datetime import datetime
-from typing import TYPE_CHECKING
+from enum import Enum
+from typing import TYPE_CHECKING, Any
 
+from sqlalchemy import Index, text
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm.attributes import get_history
 from sqlmodel import Field, Relationship, SQLModel
 
 if TYPE_CHECKING:
@@ -18,6 +24,9 @@ class EventChurchLink(SQLModel, table=True):
     registered_count: int = Field(
         default=0, description="Current number of registered attendees"
     )
+    checked_in_count: int = Field(
+        default=0, description="Current number of checked-in attendees"
+    )
 
 
 # --- Church Model ---
@@ -64,6 +73,10 @@ class EventBase(SQLModel):
 
 class Event(EventBase, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    registered_count: int = Field(
+        default=0,
+        description="Current number of registered attendees across all churches",
+    )
 
     # Relationships
     churches: list["Church"] = Relationship(
@@ -97,8 +110,63 @@ class AttendeeBase(SQLModel):
     )
 
 
+def normalize_document_id(document_id: str | None) -> str | None:
+    """
+    Normalize a document number so that "12.345.678-a " and "12345678A" match:
+    trimmed, upper-cased and stripped of punctuation and spaces.
+    """
+    if not document_id:
+        return None
+    document_key = re.sub(r"[^0-9A-Z]", "", document_id.strip().upper())
+    return document_key or None
+
+
+def fold_name(name: str | None) -> str | None:
+    """
+    Fold a name for searching: accents removed, lower-cased and with
+    whitespace collapsed, so "  José  García" and "jose garcia" match.
+    """
+    if not name:
+        return None
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split()) or None
+
+
 class Attendee(AttendeeBase, table=True):
+    __table_args__ = (
+        # A person can only be registered once per event (by normalized document)
+        Index(
+            "ix_attendee_event_id_document_key",
+            "event_id",
+            "document_key",
+            unique=True,
+            postgresql_where=text("document_key IS NOT NULL"),
+        ),
+        # Delta sync of the check-in roster
+        Index("ix_attendee_event_id_updated_at", "event_id", "updated_at"),
+        # Substring / similarity search by name and document (pg_trgm)
+        Index(
+            "ix_attendee_search_name_trgm",
+            "search_name",
+            postgresql_using="gin",
+            postgresql_ops={"search_name": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_attendee_document_id_trgm",
+            "document_id",
+            postgresql_using="gin",
+            postgresql_ops={"document_id": "gin_trgm_ops"},
+        ),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    document_key: str | None = Field(
+        default=None, max_length=50, description="Normalized document_id"
+    )
+    search_name: str | None = Field(
+        default=None, max_length=255, description="Accent-folded full_name"
+    )
 
     event_id: uuid.UUID = Field(foreign_key="event.id")
     church_id: uuid.UUID = Field(foreign_key="church.id")
@@ -106,6 +174,10 @@ class Attendee(AttendeeBase, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     checked_in_at: datetime | None = Field(default=None)
     checked_in_by_id: uuid.UUID | None = Field(default=None, foreign_key="user.id")
+    updated_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        description="Last registration or check-in change, used for roster sync",
+    )
 
     # Relationships
     event: Event = Relationship(back_populates="attendees")
@@ -118,6 +190,37 @@ class Attendee(AttendeeBase, table=True):
     )
 
 
+@sa_event.listens_for(Attendee, "before_insert")
+def _set_search_keys(_mapper: Any, _connection: Any, target: Attendee) -> None:
+    target.document_key = normalize_document_id(target.document_id)
+    target.search_name = fold_name(target.full_name)
+
+
+@sa_event.listens_for(Attendee, "before_update")
+def _update_search_keys(_mapper: Any, _connection: Any, target: Attendee) -> None:
+    # Only when their source changed: a check-in must not rewrite the keys
+    if get_history(target, "document_id").has_changes():
+        target.document_key = normalize_document_id(target.document_id)
+    if get_history(target, "full_name").has_changes():
+        target.search_name = fold_name(target.full_name)
+
+
+@sa_event.listens_for(Attendee, "before_update")
+def _touch_updated_at(_mapper: Any, _connection: Any, target: Attendee) -> None:
+    target.updated_at = datetime.utcnow()
+
+
+class AttendeeTombstone(SQLModel, table=True):
+    """
+    Marker left behind when an attendee is deleted, so that check-in devices
+    syncing the roster incrementally learn about the deletion.
+    """
+
+    attendee_id: uuid.UUID = Field(primary_key=True)
+    event_id: uuid.UUID = Field(foreign_key="event.id", ondelete="CASCADE", index=True)
+    deleted_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class AttendeeCreate(AttendeeBase):
     pass
 
@@ -131,3 +234,65 @@ class AttendeePublic(AttendeeBase):
     event_name: str | None = None
     created_at: datetime | None = None
     checked_in_at: datetime | None = None
+    checked_in_by_email: str | None = None
+
+
+# --- Email Campaign Model ---
+class CampaignAudience(str, Enum):
+    # Digiters of the churches invited to the event
+    DIGITERS = "DIGITERS"
+    # Supervisors and admins of the invited churches
+    CHURCH_CONTACTS = "CHURCH_CONTACTS"
+    ALL = "ALL"
+
+
+class EmailCampaignBase(SQLModel):
+    audience: CampaignAudience = CampaignAudience.DIGITERS
+    subject: str = Field(min_length=1, max_length=255)
+    message: str = Field(min_length=1, max_length=5000)
+
+
+class EmailCampaign(EmailCampaignBase, table=True):
+    """
+    An email sent to every recipient of an event's audience. The outbox
+    workers queue the emails in the email outbox (EmailOutbox.campaign_id)
+    in batches of recipients, ordered by email.
+    """
+
+    __table_args__ = (
+        # Finding the next campaign to queue
+        Index(
+            "ix_emailcampaign_queueing_created_at",
+            "created_at",
+            postgresql_where=text("queued_at IS NULL"),
+        ),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    event_id: uuid.UUID = Field(foreign_key="event.id", ondelete="CASCADE", index=True)
+    created_by_id: uuid.UUID | None = Field(
+        default=None, foreign_key="user.id", ondelete="SET NULL"
+    )
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    recipient_count: int = 0
+    queued_count: int = 0
+    # Email of the last recipient queued
+    queued_until: str | None = Field(default=None, max_length=255)
+    # Set once every recipient is queued
+    queued_at: datetime | None = None
+
+
+class EmailCampaignCreate(EmailCampaignBase):
+    pass
+
+
+class EmailCampaignPublic(EmailCampaignBase):
+    id: uuid.UUID
+    event_id: uuid.UUID
+    created_at: datetime
+    recipient_count: int
+    queued_at: datetime | None
+    # Delivery progress
+    pending_count: int = 0
+    sent_count: int = 0
+    failed_count: int = 0
@@ -4,13 +4,15 @@ from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Any
 
-import emails  # type: ignore
 import jwt
-from jinja2 import Template
+from jinja2 import Environment, FileSystemLoader
 from jwt.exceptions import InvalidTokenError
+from sqlmodel import Session
 
 from app.core import security
 from app.core.config import settings
+from app.core.db import engine
+from app.email_outbox import enqueue_email, wake_outbox_worker
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,11 +24,16 @@ class EmailData:
     subject: str
 
 
+# Each template is read and compiled once, then rendered from the cache. In
+# local mode, a template whose file changed is reloaded.
+email_templates = Environment(
+    loader=FileSystemLoader(Path(__file__).parent / "email-templates" / "build"),
+    auto_reload=settings.ENVIRONMENT == "local",
+)
+
+
 def render_email_template(*, template_name: str, context: dict[str, Any]) -> str:
-    template_str = (
-        Path(__file__).parent / "email-templates" / "build" / template_name
-    ).read_text()
-    html_content = Template(template_str).render(context)
+    html_content = email_templates.get_template(template_name).render(context)
     return html_content
 
 
@@ -36,23 +43,17 @@ def send_email(
     subject: str = "",
     html_content: str = "",
 ) -> None:
+    """
+    Queue the email in the outbox (app.email_outbox): the caller doesn't wait
+    for the SMTP server.
+    """
     assert settings.emails_enabled, "no provided configuration for email variables"
-    message = emails.Message(
-        subject=subject,
-        html=html_content,
-        mail_from=(settings.EMAILS_FROM_NAME, settings.EMAILS_FROM_EMAIL),
-    )
-    smtp_options = {"host": settings.SMTP_HOST, "port": settings.SMTP_PORT}
-    if settings.SMTP_TLS:
-        smtp_options["tls"] = True
-    elif settings.SMTP_SSL:
-        smtp_options["ssl"] = True
-    if settings.SMTP_USER:
-        smtp_options["user"] = settings.SMTP_USER
-    if settings.SMTP_PASSWORD:
-        smtp_options["password"] = settings.SMTP_PASSWORD
-    response = message.send(to=email_to, smtp=smtp_options)
-    logger.info(f"send email result: {response}")
+    with Session(engine) as session:
+        enqueue_email(
+            session, email_to=email_to, subject=subject, html_content=html_content
+        )
+        session.commit()
+    wake_outbox_worker()
 
 
 def generate_test_email(email_to: str) -> EmailData:
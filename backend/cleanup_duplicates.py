@@ -1,69 +1,45 @@
-import uuid
-from typing import Any
-from sqlmodel import Session, select, func, col, delete
+import sys
+
+from sqlmodel import Session
 from app.core.db import engine
-from app.models_events import Attendee, Event, EventChurchLink
+from app.crud_events import cleanup_duplicate_attendees, reconcile_event_counters
 
-def cleanup_and_sync():
+def cleanup_and_sync(dry_run: bool = False):
     """
-    1. Borra registros duplicados (mismo document_id en el mismo evento).
+    1. Borra registros duplicados (mismo documento normalizado en el mismo evento).
     2. Sincroniza los contadores de las iglesias con la realidad de la tabla de asistentes.
+    Con dry_run solo informa lo que se borraría.
     """
     with Session(engine) as session:
-        events = session.exec(select(Event)).all()
-        
-        total_deleted = 0
-        
         # --- PASO 1: Limpiar Duplicados ---
-        for event in events:
-            statement = (
-                select(Attendee.document_id)
-                .where(Attendee.event_id == event.id)
-                .where(Attendee.document_id != None)
-                .where(Attendee.document_id != "")
-                .group_by(Attendee.document_id)
-                .having(func.count(Attendee.id) > 1)
+        removed = cleanup_duplicate_attendees(session=session, dry_run=dry_run)
+        for row in removed:
+            print(
+                f"  - {'Se borraría' if dry_run else 'Borrado'} {row['attendee_id']} "
+                f"({row['full_name']}, documento {row['document_id']}) del evento {row['event_id']}, "
+                f"se mantiene {row['kept_attendee_id']}"
             )
-            duplicate_ids = session.exec(statement).all()
-            
-            for doc_id in duplicate_ids:
-                attendees = session.exec(
-                    select(Attendee)
-                    .where(Attendee.event_id == event.id, Attendee.document_id == doc_id)
-                    .order_by(Attendee.created_at.asc())
-                ).all()
-                
-                if len(attendees) > 1:
-                    to_delete = attendees[:-1] # Mantener el último
-                    for a in to_delete:
-                        session.delete(a)
-                        total_deleted += 1
-        
-        session.commit() # Guardar borrados antes de sincronizar
-        
+        total_deleted = len(removed)
+
+        if dry_run:
+            drift = reconcile_event_counters(session=session, repair=False)
+            print(f"🔎 Simulación: {total_deleted} duplicados a borrar, {len(drift)} contadores desfasados.")
+            return
+
         # --- PASO 2: Sincronización Total de Contadores ---
         print("🔄 Sincronizando contadores de iglesias...")
-        links = session.exec(select(EventChurchLink)).all()
-        synced_count = 0
-        
-        for link in links:
-            # Contar cuántos asistentes reales hay para esta iglesia en este evento
-            actual_count = session.exec(
-                select(func.count(Attendee.id))
-                .where(Attendee.event_id == link.event_id, Attendee.church_id == link.church_id)
-            ).one()
-            
-            if link.registered_count != actual_count:
-                print(f"  - Corrigiendo {link.event_id}/{link.church_id}: {link.registered_count} -> {actual_count}")
-                link.registered_count = actual_count
-                session.add(link)
-                synced_count += 1
-        
-        session.commit()
+        drift = reconcile_event_counters(session=session)
+        for row in drift:
+            print(
+                f"  - Corrigiendo {row['event_id']}/{row['church_id']}: "
+                f"registrados {row['registered_count']} -> {row['actual_registered_count']}, "
+                f"check-ins {row['checked_in_count']} -> {row['actual_checked_in_count']}"
+            )
+        synced_count = len(drift)
         
         print(f"✅ Limpieza completada.")
         print(f"   - Registros duplicados eliminados: {total_deleted}")
         print(f"   - Contadores sincronizados: {synced_count}")
 
 if __name__ == "__main__":
-    cleanup_and_sync()
+    cleanup_and_sync(dry_run="--dry-run" in sys.argv[1:])
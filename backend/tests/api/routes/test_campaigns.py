@@ -0,0 +1,416 @@
+import time
+import uuid
+from collections.abc import Generator
+from datetime import datetime, timedelta
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, col, select, update
+
+from app.campaigns import queue_campaign_emails
+from app.core.config import settings
+from app.email_outbox import (
+    OutboxWorker,
+    RateLimiter,
+    SMTPConnection,
+    claim_emails,
+    enqueue_email,
+)
+from app.models import EmailOutbox, EmailStatus, User, UserRole
+from app.models_events import Church, EmailCampaign, Event, EventChurchLink
+from tests.utils.smtp import SMTPStandIn
+from tests.utils.utils import random_email, random_lower_string
+
+
+def create_invited_church(
+    db: Session, event: Event, *, digiters: int, name: str | None = None
+) -> Church:
+    church = Church(name=name or f"{random_lower_string()}_{uuid.uuid4()}")
+    db.add(church)
+    db.flush()
+    db.add(EventChurchLink(event_id=event.id, church_id=church.id, quota_limit=10))
+    for i in range(digiters):
+        db.add(
+            User(
+                email=random_email(),
+                full_name=f"Digiter {i}",
+                hashed_password="hashed",
+                church_id=church.id,
+                role=UserRole.DIGITER,
+            )
+        )
+    db.commit()
+    return church
+
+
+def create_event(db: Session) -> Event:
+    event = Event(
+        name=random_lower_string(),
+        start_date=datetime(2026, 11, 7, 9, 0),
+        end_date=datetime(2026, 11, 8, 18, 0),
+    )
+    db.add(event)
+    db.commit()
+    db.refresh(event)
+    return event
+
+
+def campaign_url(event_id: uuid.UUID) -> str:
+    return f"{settings.API_V1_STR}/events/{event_id}/campaigns/"
+
+
+def campaign_emails(db: Session, campaign_id: str) -> list[EmailOutbox]:
+    db.expire_all()
+    return list(
+        db.exec(
+            select(EmailOutbox).where(EmailOutbox.campaign_id == uuid.UUID(campaign_id))
+        ).all()
+    )
+
+
+def queue_campaigns() -> None:
+    while queue_campaign_emails():
+        pass
+
+
+def drain_outbox(worker: OutboxWorker) -> None:
+    while worker.process_batch():
+        pass
+    worker.connection.close()
+
+
+def outbox_worker(port: int, **kwargs: Any) -> OutboxWorker:
+    return OutboxWorker(
+        SMTPConnection("127.0.0.1", port), fill_outbox=queue_campaign_emails, **kwargs
+    )
+
+
+@pytest.fixture(autouse=True)
+def emails_enabled() -> Generator[None, None, None]:
+    """The emails are delivered by the workers of the tests, not by SMTP_HOST."""
+    with patch("app.core.config.settings.SMTP_HOST", "127.0.0.1"):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def empty_outbox() -> None:
+    """Send the due emails of other tests, which would be claimed first."""
+    with SMTPStandIn() as server:
+        drain_outbox(outbox_worker(server.port))
+
+
+def test_create_campaign(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    event = create_event(db)
+    church = create_invited_church(db, event, digiters=3, name="<b>St. Mark</b>")
+    create_invited_church(db, event, digiters=2)
+    db.add(
+        User(
+            email=random_email(),
+            hashed_password="hashed",
+            church_id=church.id,
+            role=UserRole.DIGITER,
+            is_active=False,
+        )
+    )
+    supervisor = User(
+        email=random_email(),
+        full_name="Supervisor",
+        hashed_password="hashed",
+        church_id=church.id,
+        role=UserRole.SUPERVISOR,
+    )
+    db.add(supervisor)
+    # Not invited
+    other_church = Church(name=f"{random_lower_string()}_{uuid.uuid4()}")
+    db.add(other_church)
+    db.flush()
+    db.add(
+        User(
+            email=random_email(),
+            hashed_password="hashed",
+            church_id=other_church.id,
+            role=UserRole.DIGITER,
+        )
+    )
+    db.commit()
+
+    r = client.post(
+        campaign_url(event.id),
+        headers=superuser_token_headers,
+        json={"subject": "See you soon", "message": "Bring your badge\n<script>"},
+    )
+    assert r.status_code == 202
+    campaign = r.json()
+    assert campaign["audience"] == "DIGITERS"
+    assert campaign["recipient_count"] == 5
+    assert campaign["pending_count"] == 5
+    assert campaign["sent_count"] == 0
+    assert campaign["queued_at"] is None
+    # Queued by the outbox workers, not by the request
+    assert campaign_emails(db, campaign["id"]) == []
+
+    queue_campaigns()
+    emails = campaign_emails(db, campaign["id"])
+    assert len(emails) == 5
+    html = next(e.html_content for e in emails if "St. Mark" in e.html_content)
+    assert "&lt;b&gt;St. Mark&lt;/b&gt;" in html
+    assert "Bring your badge<br>&lt;script&gt;" in html
+    assert "2026-11-07 - 2026-11-08" in html
+    assert "<script>" not in html
+
+    r = client.post(
+        campaign_url(event.id),
+        headers=superuser_token_headers,
+        json={"audience": "CHURCH_CONTACTS", "subject": "Hi", "message": "Hello"},
+    )
+    assert r.status_code == 202
+    queue_campaigns()
+    contacts = campaign_emails(db, r.json()["id"])
+    assert [e.email_to for e in contacts] == [supervisor.email]
+    assert "Hello Supervisor," in contacts[0].html_content
+
+    with SMTPStandIn() as server:
+        drain_outbox(outbox_worker(server.port))
+    assert {m["To"] for m in server.messages} >= {e.email_to for e in emails}
+
+    r = client.get(
+        f"{campaign_url(event.id)}{campaign['id']}", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    assert r.json()["pending_count"] == 0
+    assert r.json()["sent_count"] == 5
+    assert r.json()["queued_at"]
+
+    r = client.get(campaign_url(event.id), headers=superuser_token_headers)
+    assert r.status_code == 200
+    assert [c["audience"] for c in r.json()] == ["CHURCH_CONTACTS", "DIGITERS"]
+
+
+def test_create_campaign_errors(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+) -> None:
+    event = create_event(db)
+    body = {"subject": "Hi", "message": "Hello"}
+
+    r = client.post(campaign_url(event.id), headers=superuser_token_headers, json=body)
+    assert r.status_code == 400
+    assert r.json()["detail"] == "CAMPAIGN_NO_RECIPIENTS"
+
+    r = client.post(
+        campaign_url(uuid.uuid4()), headers=superuser_token_headers, json=body
+    )
+    assert r.status_code == 404
+
+    r = client.post(
+        campaign_url(event.id), headers=normal_user_token_headers, json=body
+    )
+    assert r.status_code == 403
+
+    # Nothing would deliver it: not created
+    create_invited_church(db, event, digiters=1)
+    with patch("app.core.config.settings.SMTP_HOST", None):
+        r = client.post(
+            campaign_url(event.id), headers=superuser_token_headers, json=body
+        )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "EMAILS_DISABLED"
+    assert not db.exec(
+        select(EmailCampaign).where(EmailCampaign.event_id == event.id)
+    ).first()
+
+    r = client.get(
+        f"{campaign_url(event.id)}{uuid.uuid4()}", headers=superuser_token_headers
+    )
+    assert r.status_code == 404
+
+
+def test_campaign_resumes_after_crash(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    event = create_event(db)
+    create_invited_church(db, event, digiters=30)
+    r = client.post(
+        campaign_url(event.id),
+        headers=superuser_token_headers,
+        json={"subject": "Hi", "message": "Hello"},
+    )
+    campaign_id = r.json()["id"]
+    queue_campaigns()
+
+    # A worker claims a batch and dies before sending it
+    claimed = claim_emails(10)
+    assert len(claimed) == 10
+    with SMTPStandIn() as server:
+        drain_outbox(outbox_worker(server.port))
+        emails = campaign_emails(db, campaign_id)
+        assert sum(e.status == EmailStatus.SENT for e in emails) == 20
+
+        # Once the lease is over, another worker sends the rest
+        db.exec(  # type: ignore
+            update(EmailOutbox)
+            .where(col(EmailOutbox.id).in_([e.id for e in claimed]))
+            .values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1))
+        )
+        db.commit()
+        drain_outbox(outbox_worker(server.port))
+
+    emails = campaign_emails(db, campaign_id)
+    assert all(e.status == EmailStatus.SENT for e in emails)
+    assert {m["To"] for m in server.messages} >= {e.email_to for e in emails}
+    r = client.get(
+        f"{campaign_url(event.id)}{campaign_id}", headers=superuser_token_headers
+    )
+    assert r.json()["sent_count"] == 30
+
+
+def test_campaign_emails_after_transactional_emails(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    event = create_event(db)
+    create_invited_church(db, event, digiters=5)
+    r = client.post(
+        campaign_url(event.id),
+        headers=superuser_token_headers,
+        json={"subject": "Hi", "message": "Hello"},
+    )
+    campaign_id = r.json()["id"]
+    queue_campaigns()
+    reset = enqueue_email(
+        db, email_to=random_email(), subject="Password recovery", html_content="<p/>"
+    )
+    db.commit()
+
+    first = claim_emails(1)
+    assert [e.id for e in first] == [reset.id]
+    with SMTPStandIn() as server:
+        drain_outbox(outbox_worker(server.port))
+    db.exec(  # type: ignore
+        update(EmailOutbox)
+        .where(col(EmailOutbox.id) == reset.id)
+        .values(status=EmailStatus.SENT)
+    )
+    db.commit()
+    assert all(e.status == EmailStatus.SENT for e in campaign_emails(db, campaign_id))
+
+
+def create_campaign(
+    client: TestClient, headers: dict[str, str], db: Session, recipients: int
+) -> uuid.UUID:
+    event = create_event(db)
+    create_invited_church(db, event, digiters=recipients)
+    r = client.post(
+        campaign_url(event.id), headers=headers, json={"subject": "Hi", "message": "Hi"}
+    )
+    assert r.status_code == 202
+    return uuid.UUID(r.json()["id"])
+
+
+def run_workers(
+    db: Session,
+    server: SMTPStandIn,
+    campaign_id: uuid.UUID,
+    count: int,
+    rate_limiter: RateLimiter | None = None,
+) -> float:
+    """Seconds for count workers to deliver a campaign."""
+    workers = [
+        outbox_worker(
+            server.port, batch_size=5, rate_limiter=rate_limiter, poll_seconds=0.05
+        )
+        for _ in range(count)
+    ]
+    started_at = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    try:
+        deadline = time.monotonic() + 60
+        while (
+            db.exec(
+                select(EmailCampaign.queued_at).where(EmailCampaign.id == campaign_id)
+            ).one()
+            is None
+            or db.exec(
+                select(EmailOutbox.id).where(
+                    EmailOutbox.campaign_id == campaign_id,
+                    EmailOutbox.status == EmailStatus.PENDING,
+                )
+            ).first()
+        ):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - started_at
+    finally:
+        for worker in workers:
+            worker.stop()
+    return elapsed
+
+
+def test_campaign_rate_limit_shared_by_workers(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    campaign_id = create_campaign(client, superuser_token_headers, db, 12)
+    with SMTPStandIn() as server:
+        elapsed = run_workers(db, server, campaign_id, 3, RateLimiter(40))
+    assert len(server.messages) >= 12
+    assert elapsed >= 11 / 40
+
+
+@pytest.mark.benchmark
+def test_campaign_concurrent_delivery_benchmark(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    """
+    With a relay slow to accept each message, concurrent workers each keep
+    a connection busy: delivery time divides by about the worker count.
+    """
+    message_delay = 0.03
+    with SMTPStandIn(message_delay=message_delay) as server:
+        campaign_id = create_campaign(client, superuser_token_headers, db, 60)
+        one_worker = run_workers(db, server, campaign_id, 1)
+        campaign_id = create_campaign(client, superuser_token_headers, db, 60)
+        four_workers = run_workers(db, server, campaign_id, 4)
+    assert one_worker >= 60 * message_delay
+    assert four_workers * 2 < one_worker
+
+
+def test_campaign_queued_in_batches(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+) -> None:
+    event = create_event(db)
+    create_invited_church(db, event, digiters=10)
+    r = client.post(
+        campaign_url(event.id),
+        headers=superuser_token_headers,
+        json={"subject": "Hi", "message": "Hello"},
+    )
+    campaign_id = r.json()["id"]
+    url = f"{campaign_url(event.id)}{campaign_id}"
+
+    # Each batch is committed with the last recipient it queued
+    assert queue_campaign_emails(batch_size=4) == 4
+    assert queue_campaign_emails(batch_size=4) == 4
+    emails = campaign_emails(db, campaign_id)
+    assert len(emails) == 8
+    campaign = db.get(EmailCampaign, uuid.UUID(campaign_id))
+    assert campaign and campaign.queued_at is None
+    assert campaign.queued_until == max(e.email_to for e in emails)
+    r = client.get(url, headers=superuser_token_headers)
+    assert r.json()["pending_count"] == 10
+
+    assert queue_campaign_emails(batch_size=4) == 2
+    assert queue_campaign_emails(batch_size=4) == 0
+    emails = campaign_emails(db, campaign_id)
+    assert len({e.email_to for e in emails}) == 10
+    r = client.get(url, headers=superuser_token_headers)
+    assert r.json()["recipient_count"] == 10
+    assert r.json()["pending_count"] == 10
+    assert r.json()["queued_at"]
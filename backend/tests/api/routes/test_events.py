@@ -1,10 +1,18 @@
+import asyncio
+import uuid
+from datetime import datetime
+
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
-from sqlmodel import Session
+from sqlmodel import Session, insert, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app import crud
+from app.api.routes import events
 from app.core.config import settings
-from app.models import UserCreate, UserRole
-from app.models_events import Attendee, Church, Event, EventChurchLink
+from app.core.db import async_engine
+from app.models import User, UserCreate, UserRole
+from app.models_events import Attendee, AttendeeCreate, Church, Event, EventChurchLink
 from tests.utils.utils import random_email, random_lower_string
 
 
@@ -225,3 +233,721 @@ def test_get_event_attendees_isolation(
     )
     assert r.status_code == 200
     assert len(r.json()) == 2
+
+def test_register_attendee_concurrent_never_overshoots_quota(db: Session) -> None:
+    # 1. Setup two churches sharing a small event
+    church_a = create_random_church(db)
+    church_b = create_random_church(db)
+    users = []
+    for church in (church_a, church_b):
+        user_in = UserCreate(
+            email=random_email(),
+            password=random_lower_string(),
+            church_id=church.id,
+            role=UserRole.DIGITER,
+        )
+        users.append(crud.create_user(session=db, user_create=user_in).id)
+    event = create_random_event(db, total_quota=5)
+    event.is_active = True
+    db.add(event)
+    db.add(EventChurchLink(event_id=event.id, church_id=church_a.id, quota_limit=100))
+    db.add(EventChurchLink(event_id=event.id, church_id=church_b.id, quota_limit=100))
+    db.commit()
+    event_id = event.id
+
+    # 2. Fire many registrations at the same time from both churches
+    async def register(i: int) -> str:
+        async with AsyncSession(async_engine) as session:
+            user = await session.get(User, users[i % 2])
+            try:
+                await events.register_attendee(
+                    session=session,
+                    current_user=user,
+                    event_id=event_id,
+                    attendee_in=AttendeeCreate(
+                        full_name=f"Attendee {i}", document_id=f"C{i}"
+                    ),
+                )
+                return "OK"
+            except HTTPException as e:
+                return str(e.detail)
+
+    async def register_all() -> list[str]:
+        try:
+            return list(await asyncio.gather(*(register(i) for i in range(10))))
+        finally:
+            await async_engine.dispose()
+
+    results = asyncio.run(register_all())
+
+    # 3. Exactly total_quota registrations were admitted
+    assert results.count("OK") == 5
+    assert results.count("EVENT_QUOTA_EXCEEDED") == 5
+
+    db.refresh(event)
+    assert event.registered_count == 5
+    links = db.exec(
+        select(EventChurchLink).where(EventChurchLink.event_id == event.id)
+    ).all()
+    assert sum(link.registered_count for link in links) == 5
+    attendees = db.exec(select(Attendee).where(Attendee.event_id == event.id)).all()
+    assert len(attendees) == 5
+
+
+def test_register_attendees_bulk(client: TestClient, db: Session) -> None:
+    # 1. Setup Church, Digiter and an Event with room for 3
+    church = create_random_church(db)
+    user_in = UserCreate(email=random_email(), password=random_lower_string(), church_id=church.id, role=UserRole.DIGITER)
+    crud.create_user(session=db, user_create=user_in)
+    event = create_random_event(db, total_quota=3)
+    link = EventChurchLink(event_id=event.id, church_id=church.id, quota_limit=1)
+    db.add(link)
+    db.commit()
+
+    login_data = {"username": user_in.email, "password": user_in.password}
+    r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    family = [{"full_name": f"Family {i}", "document_id": f"F{i}"} for i in range(4)]
+
+    # 2. All-or-nothing - FAIL (4 people, 3 seats), nothing is registered
+    r = client.post(
+        f"{settings.API_V1_STR}/events/{event.id}/register-bulk",
+        headers=headers,
+        json={"attendees": family},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "EVENT_QUOTA_EXCEEDED"
+    db.refresh(event)
+    db.refresh(link)
+    assert event.registered_count == 0
+    assert link.registered_count == 0
+
+    # 3. Partial - admits in order until the quota is reached
+    r = client.post(
+        f"{settings.API_V1_STR}/events/{event.id}/register-bulk",
+        headers=headers,
+        json={"attendees": family, "partial": True},
+    )
+    assert r.status_code == 200
+    data = r.json()
+    assert data["registered_count"] == 3
+    assert data["rejected_count"] == 1
+    assert [row["status"] for row in data["results"]] == ["REGISTERED"] * 3 + ["EVENT_QUOTA_EXCEEDED"]
+    assert data["results"][0]["attendee"]["full_name"] == "Family 0"
+    assert data["results"][0]["attendee"]["church_name"] == church.name
+
+    db.refresh(event)
+    db.refresh(link)
+    assert event.registered_count == 3
+    assert link.registered_count == 3
+    attendees = db.exec(select(Attendee).where(Attendee.event_id == event.id)).all()
+    assert sorted(a.full_name for a in attendees) == ["Family 0", "Family 1", "Family 2"]
+
+    # 4. Event is now full
+    r = client.post(
+        f"{settings.API_V1_STR}/events/{event.id}/register-bulk",
+        headers=headers,
+        json={"attendees": family[3:], "partial": True},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "EVENT_QUOTA_EXCEEDED"
+
+
+def test_register_attendees_bulk_partial_closed_event(
+    client: TestClient, db: Session
+) -> None:
+    # 1. Setup a Digiter invited to an Event with plenty of room
+    church = create_random_church(db)
+    user_in = UserCreate(
+        email=random_email(),
+        password=random_lower_string(),
+        church_id=church.id,
+        role=UserRole.DIGITER,
+    )
+    crud.create_user(session=db, user_create=user_in)
+    event = create_random_event(db, total_quota=10)
+    link = EventChurchLink(event_id=event.id, church_id=church.id, quota_limit=10)
+    db.add(link)
+    db.commit()
+
+    login_data = {"username": user_in.email, "password": user_in.password}
+    r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    family = [{"full_name": f"Family {i}", "document_id": f"P{i}"} for i in range(2)]
+
+    # 2. Partial registration is rejected, not retried, when the event is
+    # inactive or its registrations are closed
+    for changes, detail in [
+        ({"is_active": False}, "EVENT_NOT_ACTIVE"),
+        (
+            {"is_active": True, "max_registration_date": datetime(2020, 1, 1)},
+            "EVENT_REGISTRATION_CLOSED",
+        ),
+    ]:
+        for field, value in changes.items():
+            setattr(event, field, value)
+        db.add(event)
+        db.commit()
+        r = client.post(
+            f"{settings.API_V1_STR}/events/{event.id}/register-bulk",
+            headers=headers,
+            json={"attendees": family, "partial": True},
+        )
+        assert r.status_code == 400
+        assert r.json()["detail"] == detail
+
+    db.refresh(event)
+    db.refresh(link)
+    assert event.registered_count == 0
+    assert link.registered_count == 0
+    assert not db.exec(select(Attendee).where(Attendee.event_id == event.id)).all()
+
+
+def test_register_attendee_already_registered(client: TestClient, db: Session) -> None:
+    # 1. Setup two churches invited to the same event
+    church_a = create_random_church(db)
+    church_b = create_random_church(db)
+    headers = []
+    for church in (church_a, church_b):
+        user_in = UserCreate(email=random_email(), password=random_lower_string(), church_id=church.id, role=UserRole.DIGITER)
+        crud.create_user(session=db, user_create=user_in)
+        login_data = {"username": user_in.email, "password": user_in.password}
+        r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+        headers.append({"Authorization": f"Bearer {r.json()['access_token']}"})
+    event = create_random_event(db, total_quota=10)
+    db.add(EventChurchLink(event_id=event.id, church_id=church_a.id, quota_limit=10))
+    db.add(EventChurchLink(event_id=event.id, church_id=church_b.id, quota_limit=10))
+    db.commit()
+
+    # 2. Register - SUCCESS
+    r = client.post(
+        f"{settings.API_V1_STR}/events/{event.id}/register",
+        headers=headers[0],
+        json={"full_name": "Attendee 1", "document_id": "12.345.678-a"},
+    )
+    assert r.status_code == 200
+
+    # 3. Same document written differently, from another church - ALREADY_REGISTERED
+    r = client.post(
+        f"{settings.API_V1_STR}/events/{event.id}/register",
+        headers=headers[1],
+        json={"full_name": "Attendee One", "document_id": " 12345678A"},
+    )
+    assert r.status_code == 409
+    assert r.json()["detail"] == "ALREADY_REGISTERED"
+
+    # 4. Bulk with a known document and a repeated one
+    r = client.post(
+        f"{settings.API_V1_STR}/events/{event.id}/register-bulk",
+        headers=headers[1],
+        json={
+            "attendees": [
+                {"full_name": "Attendee 1", "document_id": "12345678a"},
+                {"full_name": "Attendee 2", "document_id": "X-1"},
+                {"full_name": "Attendee 2", "document_id": "x1"},
+                {"full_name": "Attendee 3"},
+            ]
+        },
+    )
+    assert r.status_code == 200
+    data = r.json()
+    assert [row["status"] for row in data["results"]] == [
+        "ALREADY_REGISTERED",
+        "REGISTERED",
+        "ALREADY_REGISTERED",
+        "REGISTERED",
+    ]
+
+    # 5. Duplicates did not consume quota
+    db.refresh(event)
+    assert event.registered_count == 3
+    counts = {
+        link.church_id: link.registered_count
+        for link in db.exec(select(EventChurchLink).where(EventChurchLink.event_id == event.id)).all()
+    }
+    assert counts == {church_a.id: 1, church_b.id: 2}
+
+    # 6. Search finds the attendee by any spelling of the document
+    r = client.get(
+        f"{settings.API_V1_STR}/events/{event.id}/attendees/search",
+        headers=headers[1],
+        params={"document_id": "12345678-A"},
+    )
+    assert r.status_code == 200
+    assert r.json()["full_name"] == "Attendee 1"
+
+    # 7. Unknown event - NOT FOUND, not a foreign key error
+    for path, body in [
+        ("register", {"full_name": "Attendee 4", "document_id": "404"}),
+        ("register-bulk", {"attendees": [{"full_name": "Attendee 4"}]}),
+    ]:
+        r = client.post(
+            f"{settings.API_V1_STR}/events/{uuid.uuid4()}/{path}",
+            headers=headers[0],
+            json=body,
+        )
+        assert r.status_code == 404
+        assert r.json()["detail"] == "Event not found"
+
+    # 8. Known document on a closed event - the event is reported first
+    event.is_active = False
+    db.add(event)
+    db.commit()
+    for path, body in [
+        ("register", {"full_name": "Attendee 1", "document_id": "12345678A"}),
+        ("register-bulk", {"attendees": [{"full_name": "Attendee 1", "document_id": "12345678A"}]}),
+    ]:
+        r = client.post(
+            f"{settings.API_V1_STR}/events/{event.id}/{path}",
+            headers=headers[0],
+            json=body,
+        )
+        assert r.status_code == 400
+        assert r.json()["detail"] == "EVENT_NOT_ACTIVE"
+
+
+def test_update_attendee_keeps_legacy_document_key(db: Session) -> None:
+    church = create_random_church(db)
+    user = User(email=random_email(), hashed_password="hashed", church_id=church.id)
+    db.add(user)
+    event = create_random_event(db, total_quota=10)
+    attendee = Attendee(
+        full_name="Attendee 1",
+        document_id="12345678A",
+        event_id=event.id,
+        church_id=church.id,
+        registered_by_id=user.id,
+    )
+    db.add(attendee)
+    db.commit()
+    # A copy registered before documents were normalized, without a key
+    legacy_id = uuid.uuid4()
+    db.exec(  # type: ignore
+        insert(Attendee).values(
+            id=legacy_id,
+            full_name="Attendee One",
+            document_id="12.345.678-a",
+            event_id=event.id,
+            church_id=church.id,
+            registered_by_id=user.id,
+        )
+    )
+    db.commit()
+
+    # Checking it in doesn't give it the key of the other copy
+    legacy = db.get(Attendee, legacy_id)
+    assert legacy
+    legacy.checked_in_at = datetime.utcnow()
+    db.add(legacy)
+    db.commit()
+    db.refresh(legacy)
+    assert legacy.document_key is None
+    assert legacy.checked_in_at
+
+    # Correcting its document does
+    legacy.document_id = "87.654.321-b"
+    legacy.full_name = "Attendee  Óne"
+    db.add(legacy)
+    db.commit()
+    db.refresh(legacy)
+    assert legacy.document_key == "87654321B"
+    assert legacy.search_name == "attendee one"
+
+
+def test_event_stats_query_count_is_constant(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    from sqlalchemy import event as sa_event
+
+    from app.models import User
+
+    event = create_random_event(db, total_quota=100)
+
+    def invite_churches(count: int) -> None:
+        for _ in range(count):
+            church = create_random_church(db)
+            digiter = User(
+                email=random_email(),
+                hashed_password="hashed",
+                church_id=church.id,
+                role=UserRole.DIGITER,
+            )
+            db.add(digiter)
+            db.add(EventChurchLink(event_id=event.id, church_id=church.id, quota_limit=10, registered_count=1, checked_in_count=1))
+            db.flush()
+            db.add(
+                Attendee(
+                    full_name=random_lower_string(),
+                    event_id=event.id,
+                    church_id=church.id,
+                    registered_by_id=digiter.id,
+                    checked_in_at=datetime.utcnow(),
+                )
+            )
+        db.commit()
+
+    def stats_queries() -> tuple[int, dict]:
+        statements: list[str] = []
+
+        def count(_conn, _cursor, statement, *_args) -> None:  # type: ignore
+            statements.append(statement)
+
+        # The route runs on the async engine
+        sa_event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+        try:
+            r = client.get(
+                f"{settings.API_V1_STR}/events/{event.id}/stats",
+                headers=superuser_token_headers,
+            )
+        finally:
+            sa_event.remove(async_engine.sync_engine, "before_cursor_execute", count)
+        assert r.status_code == 200
+        return len(statements), r.json()
+
+    invite_churches(2)
+    # Caches the authenticated user, loaded by the first request only
+    stats_queries()
+    queries_small, stats = stats_queries()
+    assert queries_small > 0
+    assert stats["total_registered"] == 2
+    assert stats["checked_in_count"] == 2
+
+    invite_churches(20)
+    queries_large, stats = stats_queries()
+    assert queries_large == queries_small
+    assert stats["total_registered"] == 22
+    assert stats["checked_in_count"] == 22
+    assert len(stats["church_stats"]) == 22
+    for church_stat in stats["church_stats"]:
+        assert church_stat["quota_limit"] == 10
+        assert church_stat["registered_count"] == 1
+        assert church_stat["checked_in_count"] == 1
+        assert church_stat["digiters_count"] == 1
+
+
+def test_export_attendees_csv(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    import csv
+    import io
+
+    from app.models import User
+
+    church = create_random_church(db)
+    user = User(email=random_email(), hashed_password="hashed", church_id=church.id)
+    db.add(user)
+    event = create_random_event(db)
+    db.add_all(
+        [
+            Attendee(full_name="Ana, \"Anita\"", document_id="1", event_id=event.id, church_id=church.id, registered_by_id=user.id),
+            Attendee(full_name="Beto", event_id=event.id, church_id=church.id, registered_by_id=user.id),
+        ]
+    )
+    db.commit()
+
+    r = client.get(
+        f"{settings.API_V1_STR}/events/{event.id}/attendees/export-csv",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/csv")
+    rows = list(csv.reader(io.StringIO(r.content.decode("utf-8-sig"))))
+    assert rows[0] == [
+        "Full Name",
+        "Document ID",
+        "Church (Iglesia)",
+        "Registered By (Email)",
+        "Registration Date",
+        "Checked-in At",
+    ]
+    by_name = {row[0]: row for row in rows[1:]}
+    assert by_name.keys() == {'Ana, "Anita"', "Beto"}
+    assert by_name["Ana, \"Anita\""][1:4] == ["1", church.name, user.email]
+    assert by_name["Beto"][1:4] == ["N/A", church.name, user.email]
+    assert by_name["Beto"][5] == "N/A"
+
+
+def test_export_attendees_csv_memory_is_flat(db: Session) -> None:
+    import tracemalloc
+
+    from sqlmodel import delete, text
+
+    from app.api.routes import events
+    from app.models import User
+
+    church = create_random_church(db)
+    user = User(email=random_email(), hashed_password="hashed", church_id=church.id)
+    db.add(user)
+    event = create_random_event(db)
+    event_id = event.id
+    db.commit()
+
+    # Synthetic 200k-attendee event, generated in the database
+    attendee_count = 200_000
+    db.exec(  # type: ignore
+        text(
+            """
+            INSERT INTO attendee (id, full_name, document_id, event_id, church_id,
+                                  registered_by_id, created_at, updated_at)
+            SELECT gen_random_uuid(), 'Attendee ' || n, n::text, :event_id,
+                   :church_id, :user_id, now(), now()
+            FROM generate_series(1, :count) AS n
+            """
+        ).bindparams(
+            event_id=event_id, church_id=church.id, user_id=user.id, count=attendee_count
+        )
+    )
+    db.commit()
+
+    try:
+        tracemalloc.start()
+        chunks = 0
+        lines = 0
+        largest_chunk = 0
+        for chunk in events._iter_attendees_csv(event_id):
+            chunks += 1
+            lines += chunk.count("\n")
+            largest_chunk = max(largest_chunk, len(chunk))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        db.exec(delete(Attendee).where(Attendee.event_id == event_id))  # type: ignore
+        db.commit()
+
+    assert lines == attendee_count + 1
+    # Streamed in bounded chunks, not as one body
+    assert chunks > attendee_count // events.EXPORT_BATCH_SIZE
+    assert largest_chunk < 1_000_000
+    # The whole CSV is ~20 MB; the export only ever holds a few batches
+    assert peak < 10_000_000
+
+
+def test_cleanup_duplicates_dry_run_and_delete(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    import uuid
+    from datetime import timedelta
+
+    from sqlmodel import insert
+
+    from app.models import User
+    from app.models_events import AttendeeTombstone
+
+    church_a = create_random_church(db)
+    church_b = create_random_church(db)
+    user = User(email=random_email(), hashed_password="hashed", church_id=church_a.id)
+    db.add(user)
+    event = create_random_event(db, total_quota=10)
+    event.registered_count = 4
+    db.add(event)
+    link_a = EventChurchLink(event_id=event.id, church_id=church_a.id, quota_limit=10, registered_count=3, checked_in_count=1)
+    link_b = EventChurchLink(event_id=event.id, church_id=church_b.id, quota_limit=10, registered_count=1)
+    db.add_all([link_a, link_b])
+    db.commit()
+
+    # Registrations made before documents were normalized: same person, written
+    # differently, registered by both churches (inserted without document_key)
+    now = datetime.utcnow()
+    kept_id, older_a, older_b, other_id = (uuid.uuid4() for _ in range(4))
+    rows = [
+        (kept_id, church_a.id, "12.345.678-a", now, None),
+        (older_a, church_a.id, "12345678A", now - timedelta(days=1), now),
+        (older_b, church_b.id, " 12345678a", now - timedelta(days=2), None),
+        (other_id, church_a.id, "999", now, None),
+    ]
+    db.exec(  # type: ignore
+        insert(Attendee).values(
+            [
+                {
+                    "id": attendee_id,
+                    "full_name": "Legacy",
+                    "document_id": document_id,
+                    "event_id": event.id,
+                    "church_id": church_id,
+                    "registered_by_id": user.id,
+                    "created_at": created_at,
+                    "updated_at": created_at,
+                    "checked_in_at": checked_in_at,
+                }
+                for attendee_id, church_id, document_id, created_at, checked_in_at in rows
+            ]
+        )
+    )
+    db.commit()
+
+    url = f"{settings.API_V1_STR}/events/{event.id}/duplicates/cleanup"
+
+    # 1. Dry run reports exactly what would go, and changes nothing
+    r = client.post(url, headers=superuser_token_headers, params={"dry_run": True})
+    assert r.status_code == 200
+    data = r.json()
+    assert data["dry_run"] is True
+    assert data["deleted_count"] == 2
+    assert data["synced_churches"] == 2
+    assert {row["attendee_id"] for row in data["removed"]} == {str(older_a), str(older_b)}
+    assert {row["kept_attendee_id"] for row in data["removed"]} == {str(kept_id)}
+    assert db.get(Attendee, older_a) is not None
+
+    # 2. Real run deletes them, leaves tombstones and resyncs the counters
+    r = client.post(url, headers=superuser_token_headers)
+    assert r.status_code == 200
+    data = r.json()
+    assert data["dry_run"] is False
+    assert {row["attendee_id"] for row in data["removed"]} == {str(older_a), str(older_b)}
+
+    db.expire_all()
+    remaining = db.exec(select(Attendee.id).where(Attendee.event_id == event.id)).all()
+    assert set(remaining) == {kept_id, other_id}
+    tombstones = db.exec(
+        select(AttendeeTombstone.attendee_id).where(AttendeeTombstone.event_id == event.id)
+    ).all()
+    assert set(tombstones) == {older_a, older_b}
+    db.refresh(link_a)
+    db.refresh(link_b)
+    db.refresh(event)
+    assert (link_a.registered_count, link_a.checked_in_count) == (2, 0)
+    assert (link_b.registered_count, link_b.checked_in_count) == (0, 0)
+    assert event.registered_count == 2
+
+    # 3. Nothing left to clean
+    r = client.post(url, headers=superuser_token_headers)
+    assert r.json()["deleted_count"] == 0
+
+
+def test_duplicate_candidates_across_churches(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+) -> None:
+    from app.models import User
+
+    church_a = create_random_church(db)
+    church_b = create_random_church(db)
+    user = User(email=random_email(), hashed_password="hashed", church_id=church_a.id)
+    db.add(user)
+    event = create_random_event(db, total_quota=10)
+
+    people = [
+        ("José Luis González Pérez", "12345678A", church_a),
+        # Same person, other church: spelling variant and a typo in the document
+        ("JOSE LUIS GONSALEZ", "12345679A", church_b),
+        ("Ana María Rodríguez", None, church_a),
+        # Same person without document, other word order
+        ("Rodriguez Ana Maria", None, church_b),
+        ("Pedro Martínez", "87654321", church_a),
+        ("Lucía Fernández", "11112222", church_b),
+    ]
+    attendees = []
+    for full_name, document_id, church in people:
+        attendee = Attendee(
+            full_name=full_name,
+            document_id=document_id,
+            event_id=event.id,
+            church_id=church.id,
+            registered_by_id=user.id,
+        )
+        db.add(attendee)
+        attendees.append(attendee)
+    db.commit()
+
+    url = f"{settings.API_V1_STR}/events/{event.id}/duplicates/candidates"
+    r = client.get(url, headers=normal_user_token_headers)
+    assert r.status_code == 403
+
+    r = client.get(url, headers=superuser_token_headers)
+    assert r.status_code == 200
+    groups = r.json()
+    assert len(groups) == 2
+    assert [
+        {attendee["id"] for attendee in group["attendees"]} for group in groups
+    ] == [
+        {str(attendees[0].id), str(attendees[1].id)},
+        {str(attendees[2].id), str(attendees[3].id)},
+    ]
+    assert groups[0]["score"] > groups[1]["score"]
+    assert all(group["cross_church"] for group in groups)
+    assert {attendee["church_name"] for attendee in groups[0]["attendees"]} == {
+        church_a.name,
+        church_b.name,
+    }
+
+    r = client.get(url, headers=superuser_token_headers, params={"limit": 1})
+    assert len(r.json()) == 1
+
+
+def test_duplicate_candidates_benchmark() -> None:
+    import random
+    import time
+    import uuid
+
+    from app.duplicates import PersonRecord, find_duplicate_candidates
+    from app.models_events import fold_name
+
+    rng = random.Random(14)
+    first_names = ["José", "María", "Juan", "Ana", "Luis", "Carmen", "Pedro", "Lucía", "Jorge", "Rosa", "Carlos", "Elena", "Miguel", "Sofía", "Andrés", "Paula", "Diego", "Laura", "Javier", "Marta"]
+    surnames = ["García", "González", "Rodríguez", "Fernández", "López", "Martínez", "Sánchez", "Pérez", "Gómez", "Martín", "Jiménez", "Ruiz", "Hernández", "Díaz", "Moreno", "Álvarez", "Romero", "Alonso", "Gutiérrez", "Navarro"]
+    syllables = ["ba", "be", "ca", "co", "da", "di", "fe", "ga", "go", "la", "le", "li", "lo", "ma", "mi", "na", "ne", "pa", "ra", "ri", "ro", "sa", "se", "ta", "ti", "to", "va", "ve", "za", "rel", "son", "dez", "tin"]
+
+    def invented_name() -> str:
+        return "".join(rng.choice(syllables) for _ in range(rng.randint(2, 3))).capitalize()
+
+    first_names += list(dict.fromkeys(invented_name() for _ in range(300)))[:180]
+    surnames += list(dict.fromkeys(invented_name() for _ in range(500)))[:280]
+    churches = [uuid.uuid4() for _ in range(40)]
+
+    # Synthetic 20k-attendee event, as (search_name, document_key) like the DB stores them
+    records = [
+        PersonRecord(
+            id=uuid.uuid4(),
+            search_name=fold_name(
+                f"{rng.choice(first_names)} {rng.choice(surnames)} {rng.choice(surnames)}"
+            ),
+            document_key=str(rng.randint(10_000_000, 99_999_999)),
+            church_id=rng.choice(churches),
+        )
+        for _ in range(20_000)
+    ]
+    planted = []
+    for original in rng.sample(records, 300):
+        search_name = original.search_name or ""
+        document_key = original.document_key or ""
+        kind = rng.choice(["typo", "no-document", "missing-surname", "spelling"])
+        if kind == "typo":
+            position = rng.randrange(len(document_key))
+            digit = str((int(document_key[position]) + 1) % 10)
+            document_key = document_key[:position] + digit + document_key[position + 1 :]
+        elif kind == "no-document":
+            document_key = ""
+        elif kind == "missing-surname":
+            search_name = search_name.rsplit(" ", 1)[0]
+        else:
+            search_name = "h" + search_name.replace("z", "s").replace("v", "b")
+        duplicate = PersonRecord(
+            id=uuid.uuid4(),
+            search_name=search_name,
+            document_key=document_key or None,
+            church_id=rng.choice(churches),
+        )
+        records.append(duplicate)
+        planted.append((original.id, duplicate.id))
+
+    start = time.perf_counter()
+    groups = find_duplicate_candidates(records)
+    elapsed = time.perf_counter() - start
+
+    group_of = {
+        member_id: index
+        for index, group in enumerate(groups)
+        for member_id in group.member_ids
+    }
+    found = sum(
+        1
+        for original_id, duplicate_id in planted
+        if original_id in group_of and group_of.get(duplicate_id) == group_of[original_id]
+    )
+    assert found == len(planted)
+    # Almost nothing else is flagged
+    assert len(group_of) < 2 * len(planted) + 50
+    assert elapsed < 1.0
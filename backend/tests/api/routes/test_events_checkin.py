@@ -1,11 +1,36 @@
+import asyncio
+import time
+import uuid
+from collections import Counter
+from typing import Any, cast
+from unittest.mock import patch
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
 from fastapi.testclient import TestClient
-from sqlmodel import Session
+from sqlmodel import Session, select, text, update
 from datetime import datetime
 
 from app import crud
+from app.api.deps import CurrentAuthUser, SessionDep, short_statement_timeout
+from app.api.routes.events import check_digiter
 from app.core.config import settings
-from app.models import UserCreate, UserRole
-from app.models_events import Attendee, Church, Event, EventChurchLink
+from app.core.db import (
+    PoolTimeoutError,
+    create_async_db_engine,
+    create_db_engine,
+)
+from app.main import app, db_pool_timeout_handler
+from app.models import User, UserCreate, UserRole
+from app.models_events import (
+    Attendee,
+    AttendeePublic,
+    Church,
+    Event,
+    EventChurchLink,
+    normalize_document_id,
+)
 from tests.utils.utils import random_email, random_lower_string
 
 
@@ -87,6 +112,60 @@ def test_search_attendee(client: TestClient, db: Session) -> None:
     assert r.status_code == 404
 
 
+def test_search_attendees_by_name_accents_and_typos(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    if not db.exec(
+        text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+    ).first():  # type: ignore
+        pytest.skip("pg_trgm extension is not installed")
+
+    church = create_random_church(db)
+    user = crud.create_user(
+        session=db,
+        user_create=UserCreate(
+            email=random_email(),
+            password=random_lower_string(),
+            church_id=church.id,
+            role=UserRole.DIGITER,
+        ),
+    )
+    event = create_random_event(db, total_quota=10)
+    for full_name in ["José García", "Josefina Garcés", "Pedro Pérez"]:
+        db.add(
+            Attendee(
+                full_name=full_name,
+                event_id=event.id,
+                church_id=church.id,
+                registered_by_id=user.id,
+            )
+        )
+    db.commit()
+
+    url = f"{settings.API_V1_STR}/events/{event.id}/attendees/search-by-name"
+
+    # Accent-insensitive, exact match ranked first
+    r = client.get(url, headers=superuser_token_headers, params={"q": "jose garcia"})
+    assert r.status_code == 200
+    names = [a["full_name"] for a in r.json()]
+    assert names[0] == "José García"
+    assert "Pedro Pérez" not in names
+
+    # Typo still matches
+    r = client.get(url, headers=superuser_token_headers, params={"q": "Jose Garsia"})
+    assert r.status_code == 200
+    assert r.json()[0]["full_name"] == "José García"
+
+    # Same search through the attendee list filter
+    r = client.get(
+        f"{settings.API_V1_STR}/events/{event.id}/attendees",
+        headers=superuser_token_headers,
+        params={"q": "PEREZ"},
+    )
+    assert r.status_code == 200
+    assert [a["full_name"] for a in r.json()] == ["Pedro Pérez"]
+
+
 def test_checkin_attendee(client: TestClient, db: Session) -> None:
     # 1. Setup
     church = create_random_church(db)
@@ -155,3 +234,509 @@ def test_checkin_attendee(client: TestClient, db: Session) -> None:
     assert r.status_code == 200
     stats = r.json()
     assert stats["checked_in_count"] == 1
+
+
+def test_checkin_by_document(client: TestClient, db: Session) -> None:
+    # 1. Setup
+    church = create_random_church(db)
+    user_in = UserCreate(
+        email=random_email(),
+        password=random_lower_string(),
+        full_name="Digiter User",
+        church_id=church.id,
+        role=UserRole.DIGITER,
+    )
+    user = crud.create_user(session=db, user_create=user_in)
+    event = create_random_event(db, total_quota=10)
+    db.add(EventChurchLink(event_id=event.id, church_id=church.id, quota_limit=10))
+    db.commit()
+
+    attendee = Attendee(
+        full_name="Scan Me",
+        document_id="55.666.777-B",
+        event_id=event.id,
+        church_id=church.id,
+        registered_by_id=user.id,
+    )
+    db.add(attendee)
+    db.commit()
+    db.refresh(attendee)
+
+    login_data = {"username": user.email, "password": user_in.password}
+    r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    # 2. Not registered
+    r = client.post(
+        f"{settings.API_V1_STR}/events/{event.id}/checkin-by-document",
+        headers=headers,
+        params={"document_id": "00000000Z"},
+    )
+    assert r.status_code == 404
+
+    # 3. Scan - Success (document as printed on the card)
+    r = client.post(
+        f"{settings.API_V1_STR}/events/{event.id}/checkin-by-document",
+        headers=headers,
+        params={"document_id": "55666777b"},
+    )
+    assert r.status_code == 200
+    data = r.json()
+    assert data["id"] == str(attendee.id)
+    assert data["checked_in_at"] is not None
+    assert data["church_name"] == church.name
+    assert data["registered_by_email"] == user.email
+
+    db.refresh(attendee)
+    assert attendee.checked_in_by_id == user.id
+
+    # 4. Scan again - Already checked in, with the original time and who did it
+    r = client.post(
+        f"{settings.API_V1_STR}/events/{event.id}/checkin-by-document",
+        headers=headers,
+        params={"document_id": "55666777B"},
+    )
+    assert r.status_code == 409
+    detail = r.json()["detail"]
+    assert detail["checked_in_by_email"] == user.email
+    assert detail["checked_in_at"] == data["checked_in_at"]
+    assert detail["attendee"]["church_name"] == church.name
+
+
+def test_checkin_batch(client: TestClient, db: Session) -> None:
+    # 1. Setup
+    church = create_random_church(db)
+    user_in = UserCreate(
+        email=random_email(),
+        password=random_lower_string(),
+        full_name="Digiter User",
+        church_id=church.id,
+        role=UserRole.DIGITER,
+    )
+    user = crud.create_user(session=db, user_create=user_in)
+    event = create_random_event(db, total_quota=10)
+    db.add(EventChurchLink(event_id=event.id, church_id=church.id, quota_limit=10))
+    db.commit()
+
+    early = Attendee(
+        full_name="Early",
+        document_id="111",
+        event_id=event.id,
+        church_id=church.id,
+        registered_by_id=user.id,
+    )
+    replayed = Attendee(
+        full_name="Replayed",
+        document_id="222",
+        event_id=event.id,
+        church_id=church.id,
+        registered_by_id=user.id,
+    )
+    at_desk = Attendee(
+        full_name="At Desk",
+        document_id="333",
+        event_id=event.id,
+        church_id=church.id,
+        registered_by_id=user.id,
+        checked_in_at=datetime(2026, 2, 1, 9, 30),
+    )
+    db.add_all([early, replayed, at_desk])
+    db.commit()
+
+    login_data = {"username": user.email, "password": user_in.password}
+    r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    # 2. Replay a backlog of scans in one request
+    scans = [
+        {"attendee_id": str(early.id), "scanned_at": "2026-02-01T09:00:00Z"},
+        {"document_id": "222", "scanned_at": "2026-02-01T09:10:00Z"},
+        {"document_id": "2-2-2", "scanned_at": "2026-02-01T09:05:00Z"},
+        {"document_id": "333", "scanned_at": "2026-02-01T09:15:00Z"},
+        {"document_id": "999", "scanned_at": "2026-02-01T09:20:00Z"},
+    ]
+    r = client.post(
+        f"{settings.API_V1_STR}/events/{event.id}/checkin-batch",
+        headers=headers,
+        json={"scans": scans},
+    )
+    assert r.status_code == 200
+    data = r.json()
+    assert data["checked_in_count"] == 2
+    assert [row["status"] for row in data["results"]] == [
+        "CHECKED_IN",
+        "ALREADY_CHECKED_IN",
+        "CHECKED_IN",
+        "ALREADY_CHECKED_IN",
+        "NOT_FOUND",
+    ]
+    assert data["results"][3]["checked_in_at"] == "2026-02-01T09:30:00"
+
+    # 3. The earliest scan wins; a check-in made at the desk is left as it is,
+    # even if the backlog scanned the attendee earlier
+    db.refresh(early)
+    db.refresh(replayed)
+    db.refresh(at_desk)
+    assert early.checked_in_at == datetime(2026, 2, 1, 9, 0)
+    assert replayed.checked_in_at == datetime(2026, 2, 1, 9, 5)
+    assert replayed.checked_in_by_id == user.id
+    assert at_desk.checked_in_at == datetime(2026, 2, 1, 9, 30)
+    assert at_desk.checked_in_by_id is None
+
+    # 4. Replaying the same backlog changes nothing
+    r = client.post(
+        f"{settings.API_V1_STR}/events/{event.id}/checkin-batch",
+        headers=headers,
+        json={"scans": scans},
+    )
+    assert r.status_code == 200
+    assert r.json()["checked_in_count"] == 0
+
+
+def test_checkin_counters_and_reconcile(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    # 1. Setup
+    church = create_random_church(db)
+    user_in = UserCreate(
+        email=random_email(),
+        password=random_lower_string(),
+        full_name="Digiter User",
+        church_id=church.id,
+        role=UserRole.DIGITER,
+    )
+    user = crud.create_user(session=db, user_create=user_in)
+    event = create_random_event(db, total_quota=10)
+    link = EventChurchLink(
+        event_id=event.id, church_id=church.id, quota_limit=10, registered_count=3
+    )
+    event.registered_count = 3
+    db.add_all([link, event])
+    attendees = [
+        Attendee(
+            full_name=f"Counted {i}",
+            document_id=f"70{i}",
+            event_id=event.id,
+            church_id=church.id,
+            registered_by_id=user.id,
+        )
+        for i in range(3)
+    ]
+    db.add_all(attendees)
+    db.commit()
+
+    login_data = {"username": user.email, "password": user_in.password}
+    r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    base = f"{settings.API_V1_STR}/events/{event.id}"
+
+    # 2. Every check-in path bumps the church counter
+    r = client.post(f"{base}/attendees/{attendees[0].id}/checkin", headers=headers)
+    assert r.status_code == 200
+    r = client.post(
+        f"{base}/checkin-by-document", headers=headers, params={"document_id": "701"}
+    )
+    assert r.status_code == 200
+    r = client.post(
+        f"{base}/checkin-batch",
+        headers=headers,
+        json={
+            "scans": [{"document_id": "702", "scanned_at": "2026-02-01T09:00:00Z"}] * 2
+        },
+    )
+    assert r.status_code == 200
+    # Repeated scans don't count twice
+    r = client.post(f"{base}/attendees/{attendees[0].id}/checkin", headers=headers)
+    assert r.status_code == 409
+    db.refresh(link)
+    assert link.checked_in_count == 3
+
+    # 3. Deleting a checked-in attendee gives back both counters
+    r = client.delete(f"{base}/attendees/{attendees[0].id}", headers=headers)
+    assert r.status_code == 200
+    db.refresh(link)
+    assert (link.registered_count, link.checked_in_count) == (2, 2)
+
+    r = client.get(f"{base}/stats", headers=superuser_token_headers)
+    assert r.json()["checked_in_count"] == 2
+
+    # 4. Drift is reported by a dry run and repaired otherwise
+    db.exec(  # type: ignore
+        update(EventChurchLink)
+        .where(EventChurchLink.event_id == event.id)
+        .values(registered_count=0, checked_in_count=7)
+    )
+    db.commit()
+
+    r = client.post(f"{base}/counters/reconcile", headers=headers)
+    assert r.status_code == 403
+
+    r = client.post(
+        f"{base}/counters/reconcile",
+        headers=superuser_token_headers,
+        params={"dry_run": True},
+    )
+    assert r.status_code == 200
+    drift = r.json()["drift"]
+    assert len(drift) == 1
+    assert drift[0]["checked_in_count"] == 7
+    assert drift[0]["actual_checked_in_count"] == 2
+    assert drift[0]["actual_registered_count"] == 2
+    db.refresh(link)
+    assert link.checked_in_count == 7
+
+    r = client.post(f"{base}/counters/reconcile", headers=superuser_token_headers)
+    assert r.status_code == 200
+    assert r.json()["repaired"] is True
+    db.refresh(link)
+    db.refresh(event)
+    assert (link.registered_count, link.checked_in_count) == (2, 2)
+    assert event.registered_count == 2
+
+    r = client.post(f"{base}/counters/reconcile", headers=superuser_token_headers)
+    assert r.json()["drift"] == []
+
+
+def test_roster_snapshot_and_delta(client: TestClient, db: Session) -> None:
+    import json
+    from datetime import timedelta
+
+    from app.api.routes.events import roster_document_hash
+
+    # 1. Setup
+    church = create_random_church(db)
+    user_in = UserCreate(
+        email=random_email(),
+        password=random_lower_string(),
+        full_name="Digiter User",
+        church_id=church.id,
+        role=UserRole.DIGITER,
+    )
+    user = crud.create_user(session=db, user_create=user_in)
+    event = create_random_event(db, total_quota=10)
+    db.add(EventChurchLink(event_id=event.id, church_id=church.id, quota_limit=10))
+    db.commit()
+
+    long_ago = datetime.utcnow() - timedelta(hours=1)
+    attendees = [
+        Attendee(
+            full_name=f"Roster {i}",
+            document_id=f"R-{i}",
+            event_id=event.id,
+            church_id=church.id,
+            registered_by_id=user.id,
+        )
+        for i in range(3)
+    ]
+    db.add_all(attendees)
+    db.commit()
+    # Pretend they registered a while ago
+    db.exec(
+        update(Attendee)
+        .where(Attendee.event_id == event.id)
+        .values(updated_at=long_ago)
+    )  # type: ignore
+    db.commit()
+
+    login_data = {"username": user.email, "password": user_in.password}
+    r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    def get_roster(**params: str) -> list[dict]:
+        r = client.get(
+            f"{settings.API_V1_STR}/events/{event.id}/attendees/roster",
+            headers=headers,
+            params=params,
+        )
+        assert r.status_code == 200
+        assert r.headers["content-encoding"] == "gzip"
+        return [json.loads(line) for line in r.text.splitlines()]
+
+    # 2. Full snapshot
+    lines = get_roster()
+    assert lines[0]["type"] == "meta"
+    assert lines[0]["full"] is True
+    rows = {line["id"]: line for line in lines[1:]}
+    assert set(rows) == {str(a.id) for a in attendees}
+    first = rows[str(attendees[0].id)]
+    assert first["doc"] == roster_document_hash("r0")
+    assert first["church"] == church.name
+    assert first["checked_in"] is False
+
+    # 3. Check one in and delete another
+    since = (datetime.utcnow() - timedelta(minutes=10)).isoformat()
+    r = client.post(
+        f"{settings.API_V1_STR}/events/{event.id}/checkin-by-document",
+        headers=headers,
+        params={"document_id": "R-0"},
+    )
+    assert r.status_code == 200
+    r = client.delete(
+        f"{settings.API_V1_STR}/events/{event.id}/attendees/{attendees[1].id}",
+        headers=headers,
+    )
+    assert r.status_code == 200
+
+    # 4. Delta only has what changed
+    lines = get_roster(since=since)
+    assert lines[0]["full"] is False
+    changes = {line["id"]: line for line in lines[1:]}
+    assert set(changes) == {str(attendees[0].id), str(attendees[1].id)}
+    assert changes[str(attendees[0].id)]["checked_in"] is True
+    assert changes[str(attendees[1].id)]["type"] == "deleted"
+
+
+def sync_scanner_app() -> FastAPI:
+    """The document search route as it was before it was ported to async."""
+    sync_app = FastAPI()
+    sync_app.add_exception_handler(PoolTimeoutError, db_pool_timeout_handler)  # type: ignore
+
+    @sync_app.get(
+        f"{settings.API_V1_STR}/events/{{event_id}}/attendees/search",
+        response_model=AttendeePublic,
+        dependencies=[Depends(short_statement_timeout)],
+    )
+    def search_attendee_by_document(
+        *,
+        session: SessionDep,
+        current_user: CurrentAuthUser,
+        event_id: uuid.UUID,
+        document_id: str,
+    ) -> Any:
+        check_digiter(current_user)
+        result = session.exec(
+            select(Attendee, User.email, Church.name)
+            .join(User, cast(Any, Attendee.registered_by_id == User.id))
+            .join(Church, cast(Any, Attendee.church_id == Church.id))
+            .where(Attendee.event_id == event_id)
+            .where(Attendee.document_key == normalize_document_id(document_id))
+        ).first()
+        assert result
+        attendee, email, church_name = result
+        attendee_public = AttendeePublic.model_validate(attendee)
+        attendee_public.registered_by_email = email
+        attendee_public.church_name = church_name
+        return attendee_public
+
+    return sync_app
+
+
+async def scanner_load(
+    app: Any, url: str, headers: dict[str, str], documents: list[str], scans: int
+) -> tuple[float, float, Counter[int]]:
+    """
+    Successful requests per second, p99 latency and count of each status
+    code of one scanner client per document.
+    """
+    latencies: list[float] = []
+    statuses: Counter[int] = Counter()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+
+        async def scanner(document_id: str) -> None:
+            for _ in range(scans):
+                started_at = time.perf_counter()
+                r = await client.get(
+                    url, headers=headers, params={"document_id": document_id}
+                )
+                latencies.append(time.perf_counter() - started_at)
+                statuses[r.status_code] += 1
+
+        # Warm up the connection pool and the auth user cache
+        await asyncio.gather(*(scanner(document) for document in documents[:30]))
+        latencies.clear()
+        statuses.clear()
+        started_at = time.perf_counter()
+        await asyncio.gather(*(scanner(document) for document in documents))
+        elapsed = time.perf_counter() - started_at
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    return statuses[200] / elapsed, p99, statuses
+
+
+def create_scanned_attendees(db: Session, count: int) -> tuple[str, list[str]]:
+    """The search URL of a new event and the documents of its attendees."""
+    church = create_random_church(db)
+    event = create_random_event(db, total_quota=count)
+    superuser = crud.get_user_by_email(session=db, email=settings.FIRST_SUPERUSER)
+    assert superuser
+    documents = [f"SCAN-{i}" for i in range(count)]
+    db.add_all(
+        Attendee(
+            full_name=f"Scanner Attendee {i}",
+            document_id=document,
+            document_key=normalize_document_id(document),
+            search_name=f"scanner attendee {i}",
+            event_id=event.id,
+            church_id=church.id,
+            registered_by_id=superuser.id,
+        )
+        for i, document in enumerate(documents)
+    )
+    db.commit()
+    return f"{settings.API_V1_STR}/events/{event.id}/attendees/search", documents
+
+
+def test_scanner_load(superuser_token_headers: dict[str, str], db: Session) -> None:
+    """Concurrent scanner clients on the async search route all get an answer."""
+    clients = 100
+    url, documents = create_scanned_attendees(db, clients)
+    # Its own pool: connections are bound to the event loop of asyncio.run
+    scanner_engine = create_async_db_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+
+    async def run() -> Counter[int]:
+        try:
+            with patch("app.api.deps.async_engine", scanner_engine):
+                _, _, statuses = await scanner_load(
+                    app, url, superuser_token_headers, documents, 2
+                )
+            return statuses
+        finally:
+            await scanner_engine.dispose()
+
+    assert asyncio.run(run()) == {200: clients * 2}
+
+
+@pytest.mark.benchmark
+def test_scanner_load_benchmark_sync_vs_async(
+    superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    """
+    500 scanner clients searching attendees by document at once, against
+    the sync route and the async one. The sync route holds a pooled
+    connection while it waits for a threadpool thread, so under this load
+    requests queue for the pool and some give up with DB_BUSY.
+    """
+    clients = 500
+    url, documents = create_scanned_attendees(db, clients)
+
+    # Requests give up on the pool after a second rather than ten
+    with patch("app.core.config.settings.DB_POOL_TIMEOUT", 1.0):
+        sync_engine = create_db_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+    scanner_engine = create_async_db_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+
+    async def run() -> tuple[Any, Any]:
+        try:
+            with patch("app.api.deps.engine", sync_engine):
+                sync = await scanner_load(
+                    sync_scanner_app(), url, superuser_token_headers, documents, 2
+                )
+            with patch("app.api.deps.async_engine", scanner_engine):
+                async_ = await scanner_load(
+                    app, url, superuser_token_headers, documents, 2
+                )
+            return sync, async_
+        finally:
+            sync_engine.dispose()
+            await scanner_engine.dispose()
+
+    (sync_rps, sync_p99, sync_statuses), (async_rps, async_p99, async_statuses) = (
+        asyncio.run(run())
+    )
+    results = (
+        f"sync: {sync_rps:.0f} req/s, p99 {sync_p99:.2f}s, {dict(sync_statuses)}; "
+        f"async: {async_rps:.0f} req/s, p99 {async_p99:.2f}s, {dict(async_statuses)}"
+    )
+    assert async_statuses == {200: clients * 2}, results
+    assert async_rps > sync_rps, results
+    assert async_p99 < sync_p99, results
@@ -1,7 +1,8 @@
+import asyncio
 import pytest
 import uuid
 from datetime import datetime, timezone
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.api.routes import events
 from app.models import User, UserRole
 from app.models_events import Attendee, Event
@@ -40,7 +41,7 @@ def test_checkin_attendee_security_logic():
     This doesn't test the DB, but the python logic flows using mocks.
     """
     # Setup
-    mock_session = MagicMock(spec=Session)
+    mock_session = MagicMock(spec=AsyncSession)
     current_user = MockUser(UserRole.DIGITER)
     event_id = uuid.uuid4()
     other_event_id = uuid.uuid4()
@@ -59,11 +60,13 @@ def test_checkin_attendee_security_logic():
     # When session.get returns None
     mock_session.get.side_effect = [None]
     with pytest.raises(HTTPException) as exc:
-        events.checkin_attendee(
-            session=mock_session,
-            current_user=current_user,
-            event_id=event_id,
-            attendee_id=attendee_id,
+        asyncio.run(
+            events.checkin_attendee(
+                session=mock_session,
+                current_user=current_user,
+                event_id=event_id,
+                attendee_id=attendee_id,
+            )
         )
     assert exc.value.status_code == 404
 
@@ -74,32 +77,38 @@ def test_checkin_attendee_security_logic():
     # 2. Test Wrong Event (Security Check)
     # We must ensure attendee.event_id is different from the passed event_id
     with pytest.raises(HTTPException) as exc:
-        events.checkin_attendee(
-            session=mock_session,
-            current_user=current_user,
-            event_id=other_event_id,  # Trying to checkin to WRONG event
-            attendee_id=attendee_id,
+        asyncio.run(
+            events.checkin_attendee(
+                session=mock_session,
+                current_user=current_user,
+                event_id=other_event_id,  # Trying to checkin to WRONG event
+                attendee_id=attendee_id,
+            )
         )
     assert exc.value.status_code == 400
 
     # 3. Test Already Checked In (Integrity Check)
     attendee.checked_in_at = datetime.now()
     with pytest.raises(HTTPException) as exc:
+        asyncio.run(
+            events.checkin_attendee(
+                session=mock_session,
+                current_user=current_user,
+                event_id=event_id,
+                attendee_id=attendee_id,
+            )
+        )
+    assert exc.value.status_code == 409
+
+    # 4. Test Success & Data Integrity (Recording User ID)
+    attendee.checked_in_at = None  # Reset
+    result = asyncio.run(
         events.checkin_attendee(
             session=mock_session,
             current_user=current_user,
             event_id=event_id,
             attendee_id=attendee_id,
         )
-    assert exc.value.status_code == 409
-
-    # 4. Test Success & Data Integrity (Recording User ID)
-    attendee.checked_in_at = None  # Reset
-    result = events.checkin_attendee(
-        session=mock_session,
-        current_user=current_user,
-        event_id=event_id,
-        attendee_id=attendee_id,
     )
 
     assert result.checked_in_by_id == current_user.id  # CRITICAL CHECK
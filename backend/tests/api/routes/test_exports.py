@@ -0,0 +1,337 @@
+import csv
+import io
+import json
+import os
+import time
+import uuid
+import zipfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app import exports
+from app.core.config import settings
+from app.models import User
+from app.models_events import Attendee, Church, Event
+from tests.utils.utils import random_email, random_lower_string
+
+
+@pytest.fixture(autouse=True)
+def exports_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.setattr(settings, "EXPORTS_DIR", str(tmp_path))
+    return tmp_path
+
+
+def create_event_with_attendees(db: Session, count: int) -> Event:
+    church = Church(name=f"{random_lower_string()}_{uuid.uuid4()}")
+    db.add(church)
+    user = User(email=random_email(), hashed_password="hashed", church_id=church.id)
+    db.add(user)
+    event = Event(name=random_lower_string(), total_quota=count)
+    db.add(event)
+    db.flush()
+    for i in range(count):
+        db.add(
+            Attendee(
+                full_name=f"Attendee <{i}> & co",
+                document_id=str(i),
+                event_id=event.id,
+                church_id=church.id,
+                registered_by_id=user.id,
+                checked_in_at=datetime(2026, 2, 1, 9, 0) if i == 0 else None,
+            )
+        )
+    db.commit()
+    db.refresh(event)
+    return event
+
+
+def wait_for_job(client: TestClient, headers: dict[str, str], job_id: str) -> dict:
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        r = client.get(f"{settings.API_V1_STR}/exports/{job_id}", headers=headers)
+        assert r.status_code == 200
+        job = r.json()
+        if job["status"] in ("DONE", "FAILED"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError("export did not finish")
+
+
+@pytest.mark.parametrize("export_format", ["csv", "ndjson", "xlsx"])
+def test_export_job(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    export_format: str,
+) -> None:
+    event_a = create_event_with_attendees(db, 3)
+    event_b = create_event_with_attendees(db, 2)
+
+    r = client.post(
+        f"{settings.API_V1_STR}/exports/",
+        headers=superuser_token_headers,
+        json={"event_ids": [str(event_a.id), str(event_b.id)], "format": export_format},
+    )
+    assert r.status_code == 202
+    job_id = r.json()["id"]
+
+    job = wait_for_job(client, superuser_token_headers, job_id)
+    assert job["status"] == "DONE"
+    assert job["total_rows"] == 5
+    assert job["rows_written"] == 5
+    assert job["progress"] == 1.0
+
+    r = client.get(
+        f"{settings.API_V1_STR}/exports/{job_id}/download",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+
+    if export_format == "csv":
+        rows = list(csv.reader(io.StringIO(r.content.decode("utf-8-sig"))))
+        assert rows[0] == exports.EXPORT_COLUMNS
+        assert len(rows) == 6
+        assert {row[0] for row in rows[1:]} == {event_a.name, event_b.name}
+    elif export_format == "ndjson":
+        records = [json.loads(line) for line in r.content.decode().splitlines()]
+        assert len(records) == 5
+        checked_in = [rec for rec in records if rec["checked_in_at"]]
+        assert len(checked_in) == 2
+        assert checked_in[0]["checked_in_at"] == "2026-02-01T09:00:00"
+    else:
+        with zipfile.ZipFile(io.BytesIO(r.content)) as zf:
+            sheet = zf.read("xl/worksheets/sheet1.xml").decode()
+        assert sheet.count("<row>") == 6
+        assert "Attendee &lt;0&gt; &amp; co" in sheet
+
+
+def test_export_job_validation(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+) -> None:
+    event = create_event_with_attendees(db, 1)
+    url = f"{settings.API_V1_STR}/exports/"
+
+    r = client.post(
+        url, headers=normal_user_token_headers, json={"event_ids": [str(event.id)]}
+    )
+    assert r.status_code == 403
+
+    r = client.post(
+        url, headers=superuser_token_headers, json={"event_ids": [str(uuid.uuid4())]}
+    )
+    assert r.status_code == 404
+
+    r = client.get(f"{url}{uuid.uuid4()}", headers=superuser_token_headers)
+    assert r.status_code == 404
+
+
+def test_export_job_not_ready_and_queue_full(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    event = create_event_with_attendees(db, 1)
+    pending = exports.ExportJob(
+        id=uuid.uuid4(),
+        format=exports.ExportFormat.CSV,
+        event_ids=[event.id],
+        created_by_id=uuid.uuid4(),
+        created_at=datetime.utcnow(),
+    )
+    exports.save_job(pending)
+
+    r = client.get(
+        f"{settings.API_V1_STR}/exports/{pending.id}/download",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 409
+    assert r.json()["detail"] == "EXPORT_NOT_READY"
+
+    monkeypatch.setattr(settings, "EXPORT_MAX_PENDING", 1)
+    r = client.post(
+        f"{settings.API_V1_STR}/exports/",
+        headers=superuser_token_headers,
+        json={"event_ids": [str(event.id)]},
+    )
+    assert r.status_code == 429
+    assert r.json()["detail"] == "EXPORT_QUEUE_FULL"
+
+
+def test_orphaned_jobs_fail_and_free_the_queue(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    exports_dir: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    event = create_event_with_attendees(db, 1)
+
+    def save_running_job(heartbeat_age: float) -> exports.ExportJob:
+        job = exports.ExportJob(
+            id=uuid.uuid4(),
+            format=exports.ExportFormat.CSV,
+            event_ids=[event.id],
+            created_by_id=uuid.uuid4(),
+            created_at=datetime.utcnow(),
+            status=exports.ExportStatus.RUNNING,
+        )
+        exports.save_job(job)
+        touched_at = time.time() - heartbeat_age
+        os.utime(exports_dir / f"{job.id}.json", (touched_at, touched_at))
+        return job
+
+    stale = exports.ORPHANED_AFTER_HEARTBEATS * settings.EXPORT_HEARTBEAT_SECONDS + 1
+    # Its process restarted mid-export
+    orphaned = save_running_job(stale)
+    # Another process that is still alive
+    alive = save_running_job(0)
+    # This process, whatever the age of the file
+    own = save_running_job(stale)
+    monkeypatch.setattr(exports, "_active_job_ids", {own.id})
+
+    monkeypatch.setattr(settings, "EXPORT_MAX_PENDING", 3)
+    r = client.post(
+        f"{settings.API_V1_STR}/exports/",
+        headers=superuser_token_headers,
+        json={"event_ids": [str(event.id)]},
+    )
+    assert r.status_code == 202
+    wait_for_job(client, superuser_token_headers, r.json()["id"])
+
+    r = client.get(f"{settings.API_V1_STR}/exports/", headers=superuser_token_headers)
+    assert r.status_code == 200
+    statuses = {job["id"]: job for job in r.json()}
+    assert statuses[str(orphaned.id)]["status"] == "FAILED"
+    assert statuses[str(orphaned.id)]["error"]
+    assert statuses[str(orphaned.id)]["finished_at"]
+    assert statuses[str(alive.id)]["status"] == "RUNNING"
+    assert statuses[str(own.id)]["status"] == "RUNNING"
+    assert exports.fail_orphaned_jobs() == 0
+
+
+def test_poll_orphaned_job(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    exports_dir: Path,
+) -> None:
+    event = create_event_with_attendees(db, 1)
+    job = exports.ExportJob(
+        id=uuid.uuid4(),
+        format=exports.ExportFormat.CSV,
+        event_ids=[event.id],
+        created_by_id=uuid.uuid4(),
+        created_at=datetime.utcnow(),
+        status=exports.ExportStatus.RUNNING,
+        total_rows=10,
+        rows_written=4,
+    )
+    exports.save_job(job)
+    url = f"{settings.API_V1_STR}/exports/{job.id}"
+
+    r = client.get(url, headers=superuser_token_headers)
+    assert r.json()["status"] == "RUNNING"
+
+    # Its process restarted mid-export: polling the job alone reports it
+    stale = exports.ORPHANED_AFTER_HEARTBEATS * settings.EXPORT_HEARTBEAT_SECONDS + 1
+    touched_at = time.time() - stale
+    os.utime(exports_dir / f"{job.id}.json", (touched_at, touched_at))
+    r = client.get(url, headers=superuser_token_headers)
+    assert r.status_code == 200
+    assert r.json()["status"] == "FAILED"
+    assert r.json()["error"]
+
+    r = client.get(f"{url}/download", headers=superuser_token_headers)
+    assert r.status_code == 409
+    assert r.json()["detail"] == "EXPORT_NOT_READY"
+
+
+def test_evict_expired_jobs(db: Session, exports_dir: Path) -> None:
+    event = create_event_with_attendees(db, 1)
+    job = exports.enqueue_export(
+        event_ids=[event.id],
+        format=exports.ExportFormat.CSV,
+        created_by_id=uuid.uuid4(),
+    )
+    deadline = time.monotonic() + 30
+    while exports.get_job(job.id).status != exports.ExportStatus.DONE:  # type: ignore
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    assert exports.artifact_path(job).exists()
+
+    assert exports.evict_expired_jobs() == 0
+    later = datetime.utcnow() + timedelta(seconds=settings.EXPORT_TTL_SECONDS + 1)
+    assert exports.evict_expired_jobs(now=later) == 1
+    assert exports.get_job(job.id) is None
+    assert list(exports_dir.iterdir()) == []
+
+
+@pytest.mark.parametrize("export_format", ["parquet", "arrow"])
+def test_export_job_columnar(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    export_format: str,
+) -> None:
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    event_a = create_event_with_attendees(db, 3)
+    event_b = create_event_with_attendees(db, 2)
+
+    r = client.post(
+        f"{settings.API_V1_STR}/exports/",
+        headers=superuser_token_headers,
+        json={"event_ids": [str(event_a.id), str(event_b.id)], "format": export_format},
+    )
+    assert r.status_code == 202
+    job = wait_for_job(client, superuser_token_headers, r.json()["id"])
+    assert job["status"] == "DONE", job["error"]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/exports/{job['id']}/download",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    if export_format == "parquet":
+        table = pq.read_table(pa.BufferReader(r.content))
+    else:
+        table = pa.ipc.open_file(pa.BufferReader(r.content)).read_all()
+
+    assert table.num_rows == 5
+    # Typed columns, not formatted strings
+    assert table.schema.field("checked_in_at").type == pa.timestamp("us", tz="UTC")
+    assert table.schema.field("church_quota_limit").type == pa.int32()
+    rows = table.to_pylist()
+    assert {row["event_id"] for row in rows} == {str(event_a.id), str(event_b.id)}
+    checked_in = [row for row in rows if row["checked_in_at"]]
+    assert len(checked_in) == 2
+    assert checked_in[0]["checked_in_at"].replace(tzinfo=None) == datetime(
+        2026, 2, 1, 9, 0
+    )
+    assert all(row["church_quota_limit"] is None for row in rows)  # not invited
+
+
+def test_export_job_columnar_unavailable(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    event = create_event_with_attendees(db, 1)
+    monkeypatch.setattr(exports, "columnar_export_available", lambda: False)
+    r = client.post(
+        f"{settings.API_V1_STR}/exports/",
+        headers=superuser_token_headers,
+        json={"event_ids": [str(event.id)], "format": "parquet"},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "EXPORT_FORMAT_UNAVAILABLE"
@@ -1,11 +1,24 @@
+import json
+import statistics
+import threading
+import time
+from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
 from unittest.mock import patch
 
+import pytest
+import rsa
 from fastapi.testclient import TestClient
+from google.auth import crypt
+from google.auth import jwt as google_jwt
 from sqlmodel import Session
 
 from app.core.config import settings
-from app.core.security import verify_password
-from app.crud import create_user
+from app.core.google_auth import GoogleIdTokenVerifier
+from app.core.security import _submit_hash_job, verify_password
+from app.crud import create_user, get_user_by_email
 from app.models import UserCreate
 from app.utils import generate_password_reset_token
 from tests.utils.user import user_authentication_headers
@@ -116,3 +129,203 @@ def test_reset_password_invalid_token(
     assert "detail" in response
     assert r.status_code == 400
     assert response["detail"] == "Invalid token"
+
+
+@pytest.mark.benchmark
+def test_login_storm_keeps_other_endpoints_responsive(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+
+    def login() -> int:
+        r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+        return r.status_code
+
+    def read_me_latency() -> float:
+        start = time.perf_counter()
+        r = client.get(
+            f"{settings.API_V1_STR}/users/me", headers=superuser_token_headers
+        )
+        assert r.status_code == 200
+        return time.perf_counter() - start
+
+    # Start the hashing processes
+    assert login() == 200
+    baseline = statistics.median(read_me_latency() for _ in range(20))
+
+    logins = 12
+    with ThreadPoolExecutor(max_workers=logins) as pool:
+        storm = [pool.submit(login) for _ in range(logins)]
+        during = []
+        while not all(f.done() for f in storm) and len(during) < 50:
+            during.append(read_me_latency())
+        assert [f.result() for f in storm] == [200] * logins
+
+    # Logins queue up for the hashing processes instead of competing with
+    # the other requests for worker threads and CPU
+    assert len(during) >= 10
+    assert statistics.median(during) < baseline * 3 + 0.05
+
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/metrics/", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert content["counters"]["password_hash.submitted"] >= logins + 1
+    assert content["gauges"]["password_hash.queue_depth"] == 0
+    assert content["timings"]["password_hash.seconds"]["count"] >= logins + 1
+
+
+def test_login_hash_queue_full(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    with patch("app.core.config.settings.PASSWORD_HASH_MAX_PENDING", 2):
+        # Two slow jobs take every place in the queue
+        busy = [_submit_hash_job(time.sleep, 2) for _ in range(2)]
+        r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+        metrics = client.get(
+            f"{settings.API_V1_STR}/utils/metrics/", headers=superuser_token_headers
+        ).json()
+        for job in busy:
+            job.result()
+    assert r.status_code == 503
+    assert r.json() == {"detail": "AUTH_BUSY"}
+    assert r.headers["Retry-After"] == "1"
+    assert metrics["gauges"]["password_hash.queue_depth"] == 2
+    assert metrics["counters"]["password_hash.rejected"] >= 1
+
+    r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 200
+    metrics = client.get(
+        f"{settings.API_V1_STR}/utils/metrics/", headers=superuser_token_headers
+    ).json()
+    assert metrics["gauges"]["password_hash.queue_depth"] == 0
+
+
+GOOGLE_CLIENT_ID = "test-client.apps.googleusercontent.com"
+
+
+class GoogleCertsServer(ThreadingHTTPServer):
+    """Stand-in for Google's certificates endpoint."""
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), GoogleCertsHandler)
+        public_key, private_key = rsa.newkeys(1024)
+        self.signer = crypt.RSASigner.from_string(
+            private_key.save_pkcs1().decode(), key_id="key-1"
+        )
+        self.certs = {"key-1": public_key.save_pkcs1().decode()}
+        self.requests = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/oauth2/v1/certs"
+
+    def id_token(self, **claims: Any) -> str:
+        now = int(time.time())
+        payload = {
+            "iss": "https://accounts.google.com",
+            "aud": GOOGLE_CLIENT_ID,
+            "iat": now,
+            "exp": now + 3600,
+            "sub": "1234567890",
+            **claims,
+        }
+        return google_jwt.encode(self.signer, payload).decode()
+
+
+class GoogleCertsHandler(BaseHTTPRequestHandler):
+    server: GoogleCertsServer
+
+    def do_GET(self) -> None:
+        self.server.requests += 1
+        body = json.dumps(self.server.certs).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Cache-Control", "public, max-age=600, must-revalidate")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_args: Any) -> None:
+        pass
+
+
+@pytest.fixture
+def google_certs_server() -> Generator[GoogleCertsServer, None, None]:
+    server = GoogleCertsServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    verifier = GoogleIdTokenVerifier(server.url)
+    with (
+        patch("app.core.google_auth.google_id_token_verifier", verifier),
+        patch("app.core.config.settings.GOOGLE_CLIENT_ID", GOOGLE_CLIENT_ID),
+    ):
+        yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_login_google(
+    client: TestClient, db: Session, google_certs_server: GoogleCertsServer
+) -> None:
+    email = random_email()
+    token = google_certs_server.id_token(email=email, name="Google User")
+    for _ in range(2):
+        r = client.post(f"{settings.API_V1_STR}/login/google", json={"token": token})
+        assert r.status_code == 200
+        assert r.json()["access_token"]
+    user = get_user_by_email(session=db, email=email)
+    assert user
+    assert user.is_google_account
+    assert user.full_name == "Google User"
+    # Both logins were verified against the cached certificates
+    assert google_certs_server.requests == 1
+
+    r = client.post(
+        f"{settings.API_V1_STR}/login/google",
+        json={"token": google_certs_server.id_token(email=email, aud="other-client")},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"].startswith("Invalid Google Token")
+
+    r = client.post(
+        f"{settings.API_V1_STR}/login/google",
+        json={"token": google_certs_server.id_token(iss="https://evil.example.com")},
+    )
+    assert r.status_code == 400
+
+    r = client.post(
+        f"{settings.API_V1_STR}/login/google",
+        json={"token": google_certs_server.id_token(name="No email")},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Invalid Google Token: No email found"
+    assert google_certs_server.requests == 1
+
+
+def test_login_google_rotated_key(
+    client: TestClient, google_certs_server: GoogleCertsServer
+) -> None:
+    token = google_certs_server.id_token(email=random_email())
+    r = client.post(f"{settings.API_V1_STR}/login/google", json={"token": token})
+    assert r.status_code == 200
+
+    # Google starts signing with a key published after our last fetch
+    public_key, private_key = rsa.newkeys(1024)
+    google_certs_server.certs["key-2"] = public_key.save_pkcs1().decode()
+    google_certs_server.signer = crypt.RSASigner.from_string(
+        private_key.save_pkcs1().decode(), key_id="key-2"
+    )
+    token = google_certs_server.id_token(email=random_email())
+    with patch("app.core.google_auth.UNKNOWN_KEY_REFETCH_SECONDS", 0):
+        r = client.post(f"{settings.API_V1_STR}/login/google", json={"token": token})
+    assert r.status_code == 200
+    assert google_certs_server.requests == 2
@@ -1,13 +1,21 @@
+import time
 import uuid
+from typing import Any, cast
 from unittest.mock import patch
 
+import jwt
 from fastapi.testclient import TestClient
-from sqlmodel import Session, select
+from sqlalchemy import event, text
+from sqlmodel import Session, col, select
 
 from app import crud
 from app.core.config import settings
-from app.core.security import verify_password
-from app.models import User, UserCreate
+from app.core.db import engine
+from app.core.security import ALGORITHM, verify_password
+from app.core.user_cache import AUTH_USER_CHANNEL, auth_user_cache
+from app.models import EmailOutbox, User, UserCreate, UserRole
+from app.models_events import Church
+from tests.utils.user import user_authentication_headers
 from tests.utils.utils import random_email, random_lower_string
 
 
@@ -492,3 +500,313 @@ def test_delete_user_without_privileges(
     )
     assert r.status_code == 403
     assert r.json()["detail"] == "The user doesn't have enough privileges"
+
+
+def create_user_with_headers(
+    client: TestClient, db: Session, role: UserRole
+) -> tuple[User, str, dict[str, str]]:
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db,
+        user_create=UserCreate(email=random_email(), password=password, role=role),
+    )
+    headers = user_authentication_headers(
+        client=client, email=user.email, password=password
+    )
+    return user, password, headers
+
+
+def test_auth_user_cache_hit_skips_database(client: TestClient, db: Session) -> None:
+    _, _, headers = create_user_with_headers(client, db, UserRole.DIGITER)
+    url = f"{settings.API_V1_STR}/events/my-events"  # no church: no query of its own
+
+    r = client.get(url, headers=headers)
+    assert r.status_code == 200
+
+    statements: list[str] = []
+
+    def count(*args: Any) -> None:
+        statements.append(args[2])
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        r = client.get(url, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert r.status_code == 200
+    assert statements == []
+
+
+def test_auth_user_cache_invalidated_by_user_updates(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user, password, headers = create_user_with_headers(client, db, UserRole.ADMIN)
+    admin_only = f"{settings.API_V1_STR}/events/{uuid.uuid4()}/duplicates"
+    assert client.get(admin_only, headers=headers).status_code == 200
+
+    # update_user: the role change revokes the tokens issued before
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/{user.id}",
+        headers=superuser_token_headers,
+        json={"role": "DIGITER"},
+    )
+    assert r.status_code == 200
+    assert auth_user_cache.get(user.id) is None
+    r = client.get(admin_only, headers=headers)
+    assert r.status_code == 401
+    assert r.json()["detail"] == "TOKEN_REVOKED"
+    headers = user_authentication_headers(
+        client=client, email=user.email, password=password
+    )
+    assert client.get(admin_only, headers=headers).status_code == 403
+
+    # update_user_me: choosing a church returns a token with the new claims
+    church = Church(name=random_lower_string())
+    db.add(church)
+    db.commit()
+    assert auth_user_cache.get(user.id) is not None
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/me",
+        headers=headers,
+        json={"church_id": str(church.id)},
+    )
+    assert r.status_code == 200
+    assert auth_user_cache.get(user.id) is None
+    assert client.get(admin_only, headers=headers).status_code == 401
+    headers = {"Authorization": f"Bearer {r.headers['X-Access-Token']}"}
+    claims = jwt.decode(
+        r.headers["X-Access-Token"], settings.SECRET_KEY, algorithms=[ALGORITHM]
+    )
+    assert claims["church_id"] == str(church.id)
+    assert claims["role"] == "DIGITER"
+    assert client.get(admin_only, headers=headers).status_code == 403
+
+    # update_users_bulk
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/bulk",
+        headers=superuser_token_headers,
+        json={"ids": [str(user.id)], "is_active": False},
+    )
+    assert r.status_code == 200
+    r = client.get(admin_only, headers=headers)
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Inactive user"
+
+    # delete_user
+    r = client.delete(
+        f"{settings.API_V1_STR}/users/{user.id}", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    r = client.get(admin_only, headers=headers)
+    assert r.status_code == 404
+    assert r.json()["detail"] == "User not found"
+
+
+def test_access_token_claims(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user, password, headers = create_user_with_headers(client, db, UserRole.SUPERVISOR)
+    token = headers["Authorization"].removeprefix("Bearer ")
+    claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+    assert claims["sub"] == str(user.id)
+    assert claims["role"] == "SUPERVISOR"
+    assert claims["church_id"] is None
+    assert claims["su"] is False
+    assert claims["ver"] == 0
+
+    # Changes that don't touch the claims keep the token valid
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/{user.id}",
+        headers=superuser_token_headers,
+        json={"full_name": "New Name"},
+    )
+    assert r.status_code == 200
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 200
+
+    # Revoked tokens are rejected by the routes that load the full user too
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/{user.id}",
+        headers=superuser_token_headers,
+        json={"is_superuser": True},
+    )
+    assert r.status_code == 200
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 401
+    assert r.json()["detail"] == "TOKEN_REVOKED"
+
+    headers = user_authentication_headers(
+        client=client, email=user.email, password=password
+    )
+    r = client.get(f"{settings.API_V1_STR}/exports/", headers=headers)
+    assert r.status_code == 200
+
+
+def test_auth_user_cache_invalidated_by_other_process(
+    client: TestClient, db: Session
+) -> None:
+    listener = cast(Any, client.app).state.auth_user_cache_listener
+    assert listener.listening.wait(timeout=10)
+    user, _, headers = create_user_with_headers(client, db, UserRole.DIGITER)
+    client.get(f"{settings.API_V1_STR}/events/my-events", headers=headers)
+    assert auth_user_cache.get(user.id) is not None
+
+    # What another worker process sends when it commits a change to the user
+    with engine.connect() as connection:
+        connection.execute(
+            text("SELECT pg_notify(:channel, :user_id)"),
+            {"channel": AUTH_USER_CHANNEL, "user_id": str(user.id)},
+        )
+        connection.commit()
+
+    deadline = time.monotonic() + 10
+    while auth_user_cache.get(user.id) is not None:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_import_users(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    church = Church(name=f"Import church {random_lower_string()}")
+    db.add(church)
+    db.commit()
+    db.refresh(church)
+    existing = crud.create_user(
+        session=db,
+        user_create=UserCreate(email=random_email(), password=random_lower_string()),
+    )
+    new_email, named_email = random_email(), random_email()
+    password = random_lower_string()
+    data = {
+        "users": [
+            {"email": new_email, "password": password, "church_id": str(church.id)},
+            {"email": existing.email},
+            {"email": new_email},
+            {"email": random_email(), "church_id": str(uuid.uuid4())},
+            {"email": named_email, "role": "ADMIN", "church_name": church.name},
+        ]
+    }
+    with (
+        patch("app.core.config.settings.SMTP_HOST", "smtp.example.com"),
+        patch("app.core.config.settings.SMTP_USER", "admin@example.com"),
+    ):
+        r = client.post(
+            f"{settings.API_V1_STR}/users/import",
+            headers=superuser_token_headers,
+            json=data,
+        )
+    assert r.status_code == 200
+    content = r.json()
+    assert content["created_count"] == 2
+    assert content["rejected_count"] == 3
+    assert [row["status"] for row in content["results"]] == [
+        "CREATED",
+        "ALREADY_EXISTS",
+        "DUPLICATE_IN_REQUEST",
+        "CHURCH_NOT_FOUND",
+        "CREATED",
+    ]
+    created = content["results"][0]["user"]
+    assert created["role"] == UserRole.DIGITER
+    assert created["church_name"] == church.name
+    assert content["results"][4]["user"]["role"] == UserRole.ADMIN
+    assert content["results"][4]["user"]["church_id"] == str(church.id)
+    welcome_emails = db.exec(
+        select(EmailOutbox.email_to).where(
+            col(EmailOutbox.email_to).in_([new_email, named_email])
+        )
+    ).all()
+    assert sorted(welcome_emails) == sorted([new_email, named_email])
+
+    user = crud.get_user_by_email(session=db, email=new_email)
+    assert user
+    assert user.church_id == church.id
+    assert verify_password(password, user.hashed_password)
+
+
+def test_import_users_csv(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    email = random_email()
+    content = (
+        "email,full_name,password,role\n"
+        f"{email},Ana Pérez,{random_lower_string()},SUPERVISOR\n"
+        "not-an-email,Luis,,\n"
+        f"{random_email()},Short,abc,\n"
+    )
+    r = client.post(
+        f"{settings.API_V1_STR}/users/import/csv",
+        headers=superuser_token_headers,
+        files={"file": ("users.csv", content.encode(), "text/csv")},
+    )
+    assert r.status_code == 200
+    results = r.json()["results"]
+    assert [row["status"] for row in results] == ["CREATED", "INVALID", "INVALID"]
+    assert results[0]["user"]["full_name"] == "Ana Pérez"
+    assert results[0]["user"]["role"] == UserRole.SUPERVISOR
+    assert results[1]["email"] == "not-an-email"
+    assert results[1]["detail"].startswith("email:")
+    assert results[2]["detail"].startswith("password:")
+    assert crud.get_user_by_email(session=db, email=email)
+
+    r = client.post(
+        f"{settings.API_V1_STR}/users/import/csv",
+        headers=superuser_token_headers,
+        files={"file": ("users.csv", b"name\nAna\n", "text/csv")},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "CSV_MISSING_EMAIL_COLUMN"
+
+
+def test_import_users_not_superuser(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/users/import",
+        headers=normal_user_token_headers,
+        json={"users": [{"email": random_email()}]},
+    )
+    assert r.status_code == 403
+
+
+def test_update_users_bulk(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    church = Church(name=f"Bulk church {random_lower_string()}")
+    db.add(church)
+    db.commit()
+    digiter, _, _ = create_user_with_headers(client, db, UserRole.DIGITER)
+    admin, _, _ = create_user_with_headers(client, db, UserRole.ADMIN)
+    missing_id = uuid.uuid4()
+
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/bulk",
+        headers=superuser_token_headers,
+        json={
+            "ids": [str(digiter.id), str(admin.id), str(missing_id), str(digiter.id)],
+            "role": "DIGITER",
+            "church_id": str(church.id),
+        },
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert content["updated_count"] == 2
+    assert content["not_found_ids"] == [str(missing_id)]
+
+    for user in (digiter, admin):
+        db.refresh(user)
+        assert user.role == UserRole.DIGITER
+        assert user.church_id == church.id
+        assert user.token_version == 1
+
+    # Nothing changes for these users: their tokens stay valid
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/bulk",
+        headers=superuser_token_headers,
+        json={"ids": [str(digiter.id)], "role": "DIGITER"},
+    )
+    assert r.status_code == 200
+    assert r.json()["updated_count"] == 1
+    db.refresh(digiter)
+    assert digiter.token_version == 1
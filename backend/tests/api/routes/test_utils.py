@@ -0,0 +1,415 @@
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from jinja2 import Template
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, col, select, text, update
+
+from app import crud
+from app.core.config import settings
+from app.core.db import create_db_engine, engine, set_statement_timeout
+from app.email_outbox import (
+    OutboxWorker,
+    OutgoingEmail,
+    RateLimiter,
+    SMTPConnection,
+    build_message,
+    claim_emails,
+    enqueue_email,
+    wake_outbox_worker,
+)
+from app.models import EmailOutbox, EmailStatus
+from app.models_events import Attendee, Church, Event
+from app.utils import render_email_template
+from tests.utils.smtp import SMTPStandIn
+from tests.utils.utils import random_email, random_lower_string
+
+
+def drain_outbox(worker: OutboxWorker) -> None:
+    while worker.process_batch():
+        pass
+
+
+def queue_emails(db: Session, count: int) -> list[EmailOutbox]:
+    emails = [
+        enqueue_email(
+            db,
+            email_to=random_email(),
+            subject=f"Reminder {i}",
+            html_content=f"<p>{random_lower_string()}</p>",
+        )
+        for i in range(count)
+    ]
+    db.commit()
+    return emails
+
+
+def test_email_outbox_worker(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    email_to = random_email()
+    with (
+        SMTPStandIn() as server,
+        patch("app.core.config.settings.SMTP_HOST", "127.0.0.1"),
+        patch("app.core.config.settings.SMTP_PORT", server.port),
+        patch("app.core.config.settings.SMTP_TLS", False),
+    ):
+        worker = OutboxWorker(SMTPConnection.from_settings(), poll_seconds=30)
+        worker.start()
+        try:
+            r = client.post(
+                f"{settings.API_V1_STR}/utils/test-email/",
+                headers=superuser_token_headers,
+                params={"email_to": email_to},
+            )
+            assert r.status_code == 201
+            # Woken up by the request instead of waiting for its next poll
+            deadline = time.monotonic() + 10
+            while not any(m["To"] == email_to for m in server.messages):
+                assert time.monotonic() < deadline
+                time.sleep(0.05)
+        finally:
+            worker.stop()
+
+    message = next(m for m in server.messages if m["To"] == email_to)
+    assert message["Subject"] == f"{settings.PROJECT_NAME} - Test email"
+    assert message.get_content_type() == "text/html"
+
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/metrics/", headers=superuser_token_headers
+    )
+    content = r.json()
+    assert content["counters"]["email_outbox.sent"] >= 1
+    assert "email_outbox.pending" in content["gauges"]
+
+
+def test_email_outbox_wakes_every_worker(db: Session) -> None:
+    with SMTPStandIn() as server:
+        workers = [
+            OutboxWorker(SMTPConnection("127.0.0.1", server.port), poll_seconds=30)
+            for _ in range(2)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            # Each wakeup reaches the idle workers instead of waiting for a poll
+            for _ in range(5):
+                emails = queue_emails(db, 3)
+                wake_outbox_worker()
+                deadline = time.monotonic() + 5
+                while not {e.email_to for e in emails} <= {
+                    m["To"] for m in server.messages
+                }:
+                    assert time.monotonic() < deadline
+                    time.sleep(0.01)
+        finally:
+            for worker in workers:
+                worker.stop()
+
+
+def test_email_outbox_failures(db: Session) -> None:
+    (refused,) = queue_emails(db, 1)
+    with SMTPStandIn() as server:
+        server.refused.add(refused.email_to)
+        drain_outbox(OutboxWorker(SMTPConnection("127.0.0.1", server.port)))
+    db.refresh(refused)
+    assert refused.status == EmailStatus.FAILED
+    assert refused.attempts == 1
+    assert refused.last_error and "550" in refused.last_error
+    assert refused.html_content == ""
+
+    # The server is gone: retried later, with backoff
+    (unreachable,) = queue_emails(db, 1)
+    before = datetime.utcnow()
+    worker = OutboxWorker(SMTPConnection("127.0.0.1", server.port, timeout=1))
+    assert worker.process_batch() == 1
+    db.refresh(unreachable)
+    assert unreachable.status == EmailStatus.PENDING
+    assert unreachable.attempts == 1
+    assert unreachable.last_error
+    assert unreachable.html_content
+    assert (unreachable.next_attempt_at - before).total_seconds() >= 29
+
+    # Hung up after the message: not sent again on the same attempt
+    (dropped,) = queue_emails(db, 1)
+    with SMTPStandIn() as server:
+        server.drop_after_data = True
+        worker = OutboxWorker(SMTPConnection("127.0.0.1", server.port))
+        assert worker.process_batch() == 1
+        assert not worker.connection.is_open
+    assert len(server.messages) == 1
+    assert server.connections == 1
+    db.refresh(dropped)
+    assert dropped.status == EmailStatus.PENDING
+    assert dropped.attempts == 1
+    assert dropped.last_error
+
+    # Given up after EMAIL_MAX_ATTEMPTS
+    unreachable.attempts = worker.max_attempts - 1
+    unreachable.next_attempt_at = before
+    db.add(unreachable)
+    db.commit()
+    worker.process_batch()
+    db.refresh(unreachable)
+    assert unreachable.status == EmailStatus.FAILED
+    assert unreachable.attempts == worker.max_attempts
+
+
+def test_email_outbox_claims_each_email_once(db: Session) -> None:
+    queue_emails(db, 10)
+    first = claim_emails(6)
+    second = claim_emails(100)
+    assert len(first) == 6
+    assert not {e.id for e in first} & {e.id for e in second}
+    # Leased: not claimed again until the lease is over
+    assert claim_emails(100) == []
+    db.exec(  # type: ignore
+        update(EmailOutbox)
+        .where(col(EmailOutbox.id).in_([e.id for e in first + second]))
+        .values(status=EmailStatus.SENT)
+    )
+    db.commit()
+
+
+def test_email_outbox_throttling(db: Session) -> None:
+    emails = queue_emails(db, 6)
+    with SMTPStandIn() as server:
+        worker = OutboxWorker(
+            SMTPConnection("127.0.0.1", server.port), rate_limiter=RateLimiter(20)
+        )
+        started_at = time.perf_counter()
+        drain_outbox(worker)
+        elapsed = time.perf_counter() - started_at
+        worker.connection.close()
+    assert {m["To"] for m in server.messages} >= {e.email_to for e in emails}
+    assert elapsed >= (len(server.messages) - 1) / 20
+
+
+def test_email_outbox_throughput_benchmark(db: Session) -> None:
+    """
+    Delivering through the outbox pays the SMTP handshake once, sending
+    one connection per email (as send_email did) pays it every time.
+    """
+    handshake = 0.02
+    emails = queue_emails(db, 200)
+    with SMTPStandIn(connect_delay=handshake) as server:
+        started_at = time.perf_counter()
+        for email in emails[:20]:
+            connection = SMTPConnection("127.0.0.1", server.port)
+            connection.send(
+                build_message(
+                    OutgoingEmail(
+                        email.id, email.email_to, email.subject, email.html_content, 0
+                    )
+                )
+            )
+            connection.close()
+        per_connection = (time.perf_counter() - started_at) / 20
+        server.messages.clear()
+        server.connections = 0
+
+        worker = OutboxWorker(SMTPConnection("127.0.0.1", server.port))
+        started_at = time.perf_counter()
+        drain_outbox(worker)
+        per_email = (time.perf_counter() - started_at) / len(server.messages)
+        worker.connection.close()
+
+    sent = db.exec(
+        select(EmailOutbox.status, EmailOutbox.html_content).where(
+            col(EmailOutbox.id).in_([e.id for e in emails])
+        )
+    ).all()
+    # Delivered emails don't keep their content
+    assert sent == [(EmailStatus.SENT, "")] * len(emails)
+    assert server.connections == 1
+    assert per_email < handshake < per_connection
+    assert per_email * 3 < per_connection
+
+
+def test_build_message() -> None:
+    with patch("app.core.config.settings.EMAILS_FROM_EMAIL", "info@example.com"):
+        message = build_message(
+            OutgoingEmail(
+                id=uuid.uuid4(),
+                email_to="ana@example.com",
+                subject="Hola",
+                html_content="<p>¡Bienvenida!</p>",
+                attempts=0,
+            )
+        )
+    assert message["To"] == "ana@example.com"
+    assert message["From"].endswith("<info@example.com>")
+    assert message["Message-ID"].endswith("@example.com>")
+    assert "¡Bienvenida!" in message.get_content()
+
+
+def test_render_email_template_benchmark() -> None:
+    """Rendering from the compiled template cache vs reading and compiling."""
+    path = Path(__file__).parents[3] / "app" / "email-templates" / "build"
+    context = {
+        "project_name": settings.PROJECT_NAME,
+        "username": "ana@example.com",
+        "password": random_lower_string(),
+        "email": "ana@example.com",
+        "link": settings.FRONTEND_HOST,
+    }
+    renders = 200
+
+    def uncached() -> str:
+        template = Template((path / "new_account.html").read_text())
+        return template.render(context)
+
+    started_at = time.perf_counter()
+    for _ in range(renders):
+        expected = uncached()
+    before = (time.perf_counter() - started_at) / renders
+
+    started_at = time.perf_counter()
+    for _ in range(renders):
+        html = render_email_template(template_name="new_account.html", context=context)
+    after = (time.perf_counter() - started_at) / renders
+
+    assert html == expected
+    assert after * 10 < before
+
+
+def show_statement_timeout(session: Session) -> str:
+    return str(session.exec(text("SHOW statement_timeout")).one()[0])  # type: ignore
+
+
+def test_statement_timeouts() -> None:
+    with Session(engine) as session:
+        assert show_statement_timeout(session) == "30s"
+        set_statement_timeout(session, 50)
+        assert show_statement_timeout(session) == "50ms"
+        with pytest.raises(OperationalError, match="statement timeout"):
+            session.exec(text("SELECT pg_sleep(1)"))  # type: ignore
+        session.rollback()
+        # Kept for the session's next transactions
+        assert show_statement_timeout(session) == "50ms"
+        session.rollback()
+
+    # The connection went back to the pool with the default timeout
+    with Session(engine) as session:
+        assert show_statement_timeout(session) == "30s"
+
+
+def test_pgbouncer_mode() -> None:
+    with patch("app.core.config.settings.DB_PGBOUNCER", True):
+        pgbouncer_engine = create_db_engine(
+            str(settings.SQLALCHEMY_DATABASE_URI), pgbouncer=True
+        )
+        try:
+            with Session(pgbouncer_engine) as session:
+                # No startup option: the default is set in each transaction
+                assert show_statement_timeout(session) == "30s"
+                dbapi_connection = session.connection().connection.dbapi_connection
+                assert dbapi_connection.prepare_threshold is None  # type: ignore
+                session.commit()
+                with pgbouncer_engine.connect() as connection:
+                    assert (
+                        connection.exec_driver_sql("SHOW statement_timeout").scalar()
+                        == "0"
+                    )
+        finally:
+            pgbouncer_engine.dispose()
+
+
+def test_db_pool_exhausted(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    with (
+        patch("app.core.config.settings.DB_POOL_SIZE", 1),
+        patch("app.core.config.settings.DB_MAX_OVERFLOW", 0),
+        patch("app.core.config.settings.DB_POOL_TIMEOUT", 0.1),
+    ):
+        small_engine = create_db_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+    try:
+        with (
+            small_engine.connect(),
+            patch("app.api.deps.engine", small_engine),
+        ):
+            r = client.get(
+                f"{settings.API_V1_STR}/events/", headers=superuser_token_headers
+            )
+    finally:
+        small_engine.dispose()
+    assert r.status_code == 503
+    assert r.json() == {"detail": "DB_BUSY"}
+    assert r.headers["Retry-After"] == "1"
+
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/metrics/", headers=superuser_token_headers
+    )
+    content = r.json()
+    assert content["counters"]["db.pool.timeouts"] >= 1
+    assert content["timings"]["db.pool.checkout_seconds"]["count"] >= 1
+
+
+def test_checkin_statement_timeout(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    superuser = crud.get_user_by_email(session=db, email=settings.FIRST_SUPERUSER)
+    assert superuser
+    church = Church(name=f"{random_lower_string()}_{uuid.uuid4()}")
+    event = Event(name=random_lower_string(), total_quota=10)
+    db.add(church)
+    db.add(event)
+    db.flush()
+    attendee = Attendee(
+        full_name="Locked Attendee",
+        event_id=event.id,
+        church_id=church.id,
+        registered_by_id=superuser.id,
+    )
+    db.add(attendee)
+    db.commit()
+
+    url = f"{settings.API_V1_STR}/events/{event.id}/attendees/{attendee.id}/checkin"
+    # Another transaction holds the attendee: the check-in waits on its lock
+    with (
+        Session(engine) as blocker,
+        patch("app.core.config.settings.DB_SHORT_STATEMENT_TIMEOUT_MS", 100),
+    ):
+        blocker.get(Attendee, attendee.id, with_for_update=True)
+        started_at = time.perf_counter()
+        r = client.post(url, headers=superuser_token_headers)
+        elapsed = time.perf_counter() - started_at
+        blocker.rollback()
+    assert r.status_code == 503
+    assert r.json() == {"detail": "DB_STATEMENT_TIMEOUT"}
+    assert elapsed < 2
+
+    r = client.post(url, headers=superuser_token_headers)
+    assert r.status_code == 200
+
+
+def test_attendee_search_statement_timeout(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    event = Event(name=random_lower_string(), total_quota=10)
+    db.add(event)
+    db.commit()
+
+    url = f"{settings.API_V1_STR}/events/{event.id}/attendees"
+    # Another transaction holds the attendee table: the search waits on it
+    with (
+        Session(engine) as blocker,
+        patch("app.core.config.settings.DB_SHORT_STATEMENT_TIMEOUT_MS", 100),
+    ):
+        blocker.exec(text("LOCK TABLE attendee IN ACCESS EXCLUSIVE MODE"))  # type: ignore
+        started_at = time.perf_counter()
+        r = client.get(url, headers=superuser_token_headers, params={"q": "jose"})
+        elapsed = time.perf_counter() - started_at
+        blocker.rollback()
+    assert r.status_code == 503
+    assert r.json() == {"detail": "DB_STATEMENT_TIMEOUT"}
+    assert elapsed < 2
+
+    r = client.get(url, headers=superuser_token_headers, params={"q": "jose"})
+    assert r.status_code == 200
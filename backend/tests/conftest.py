@@ -1,3 +1,4 @@
+import os
 from collections.abc import Generator
 
 import pytest
@@ -8,11 +9,33 @@ from app.core.config import settings
 from app.core.db import engine, init_db
 from app.main import app
 from app.models import Item, User
-from app.models_events import Attendee, Church, Event, EventChurchLink
+from app.models_events import (
+    Attendee,
+    AttendeeTombstone,
+    Church,
+    Event,
+    EventChurchLink,
+)
 from tests.utils.user import authentication_token_from_email
 from tests.utils.utils import get_superuser_token_headers
 
 
+def pytest_configure(config: pytest.Config) -> None:
+    config.addinivalue_line(
+        "markers", "benchmark: timing comparison, run with RUN_BENCHMARKS=1"
+    )
+
+
+def pytest_collection_modifyitems(items: list[pytest.Item]) -> None:
+    # Slow and timing dependent: left out of the normal runs
+    if os.getenv("RUN_BENCHMARKS"):
+        return
+    skip = pytest.mark.skip(reason="benchmark, set RUN_BENCHMARKS=1 to run it")
+    for item in items:
+        if item.get_closest_marker("benchmark"):
+            item.add_marker(skip)
+
+
 @pytest.fixture(scope="session", autouse=True)
 def db() -> Generator[Session, None, None]:
     with Session(engine) as session:
@@ -20,6 +43,7 @@ def db() -> Generator[Session, None, None]:
         yield session
         # Clean up tables in order (children first)
         session.execute(delete(Attendee))
+        session.execute(delete(AttendeeTombstone))
         session.execute(delete(EventChurchLink))
         session.execute(delete(Item))
         session.execute(delete(User))
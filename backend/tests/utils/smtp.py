@@ -0,0 +1,94 @@
+import email
+import socketserver
+import threading
+import time
+from email.message import Message
+from types import TracebackType
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    server: "SMTPStandIn"
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self) -> None:
+        self.server.connections += 1
+        # The handshake latency of a remote relay
+        time.sleep(self.server.connect_delay)
+        self.reply("220 localhost SMTP stand-in")
+        recipients: list[str] = []
+        while line := self.rfile.readline():
+            command = line.decode().strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.reply("250-localhost")
+                self.reply("250 8BITMIME")
+            elif verb in ("HELO", "NOOP"):
+                self.reply("250 OK")
+            elif verb in ("MAIL", "RSET"):
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipient = command.split(":", 1)[1].strip(" <>")
+                if recipient in self.server.refused:
+                    self.reply("550 No such user")
+                else:
+                    recipients.append(recipient)
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while (data_line := self.rfile.readline()) not in (b".\r\n", b""):
+                    data.append(
+                        data_line[1:] if data_line.startswith(b".") else data_line
+                    )
+                # The time a remote relay takes to accept a message
+                time.sleep(self.server.message_delay)
+                with self.server.lock:
+                    self.server.messages.append(
+                        email.message_from_bytes(b"".join(data))
+                    )
+                if self.server.drop_after_data:
+                    # Hang up before confirming the message
+                    return
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """A local SMTP server that keeps the messages it receives."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, connect_delay: float = 0.0, message_delay: float = 0.0) -> None:
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.connect_delay = connect_delay
+        self.message_delay = message_delay
+        self.refused: set[str] = set()
+        self.drop_after_data = False
+        self.messages: list[Message] = []
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    @property
+    def port(self) -> int:
+        return int(self.server_address[1])
+
+    def __enter__(self) -> "SMTPStandIn":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.shutdown()
+        self.server_close()
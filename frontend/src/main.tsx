@@ -19,6 +19,15 @@ OpenAPI.BASE = import.meta.env.VITE_API_URL
 OpenAPI.TOKEN = async () => {
   return localStorage.getItem("access_token") || ""
 }
+// The API sends a new token when the previous one was revoked by a change to
+// the user's own role or church (e.g. choosing a church in the setup)
+OpenAPI.interceptors.response.use((response) => {
+  const refreshedToken = response.headers["x-access-token"]
+  if (refreshedToken) {
+    localStorage.setItem("access_token", refreshedToken)
+  }
+  return response
+})
 
 const handleApiError = (error: any) => {
   const status = error instanceof ApiError ? error.status : error?.status || error?.response?.status